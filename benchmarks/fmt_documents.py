@@ -0,0 +1,128 @@
+# coding: utf-8
+"""
+Throughput and allocations of the article formatter, one document at a time
+against batches formatted in the current process and in process pools.
+
+python benchmarks/fmt_documents.py [--documents 20000] [--batch_size 200]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from xylose.scielodocument import Article
+
+from processing import loaddata
+from processing.workers import parallel_batches
+
+AFFILIATIONS = [
+    ('Brasil', u'São Paulo'), ('Brazil', 'SP'), ('Brasil', 'Rio de Janeiro'),
+    ('Mexico', 'Jalisco'), ('Chile', 'Santiago'), ('Argentina', 'Buenos Aires'),
+    ('USA', 'California'), ('Spain', 'Madrid')
+]
+
+KEYWORDS = ['Zika', 'Dengue', 'Public health', 'Epidemiology', 'Brazil']
+
+
+def raw_article(i):
+    affiliations = [
+        {'i': 'A%02d' % n, 'p': p, 's': s, '_': 'Institution %d' % n}
+        for n, (p, s) in enumerate(AFFILIATIONS[i % 5:i % 5 + 3])
+    ]
+    code = 'S0001-3765%04d000100%03d' % (2000 + i % 20, i % 1000)
+
+    return {
+        'collection': 'scl',
+        'code': code,
+        'created_at': '2000-01-01',
+        'processing_date': '2000-01-02',
+        'article': {
+            'v880': [{'_': code}],
+            'v65': [{'_': '20000101'}],
+            'v40': [{'_': 'en'}],
+            'v71': [{'_': 'oa'}],
+            'v70': affiliations,
+            'v85': [{'k': k, 'l': 'en'} for k in KEYWORDS[i % 3:]],
+            'v14': [{'f': '1', 'l': '10'}]
+        },
+        'issue': {'issue': {'v31': [{'_': '1'}], 'v32': [{'_': '1'}]}},
+        'title': {
+            'v400': [{'_': '0001-3765'}],
+            'v100': [{'_': 'Journal'}],
+            'v441': [{'_': 'Health Sciences'}]
+        }
+    }
+
+
+def one_at_a_time(records):
+    return [loaddata.fmt_document(Article(i)) for i in records]
+
+
+def measure(label, func, records):
+    start = time.perf_counter()
+    result = func(records)
+    elapsed = time.perf_counter() - start
+
+    print('%-30s %8.0f docs/s' % (label, len(result) / elapsed))
+
+
+def allocations(label, func, records):
+    tracemalloc.start()
+    func(records)
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('%-30s %8.1f KiB allocated per document' % (label, peak / 1024.0 / len(records)))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark of the article formatter"
+    )
+
+    parser.add_argument(
+        '--documents',
+        type=int,
+        default=20000,
+        help='Number of documents formated'
+    )
+
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=200,
+        help='Number of documents of each batch'
+    )
+
+    args = parser.parse_args()
+
+    records = [raw_article(i) for i in range(args.documents)]
+
+    # Warm the lookup tables and the normalization cache.
+    loaddata.fmt_documents_batch(records[:100])
+
+    measure('fmt_document', one_at_a_time, records)
+    measure('fmt_documents_batch', loaddata.fmt_documents_batch, records)
+
+    processes = 1
+    while processes <= multiprocessing.cpu_count():
+        measure(
+            'parallel_batches, %d processes' % processes,
+            lambda i: list(parallel_batches(
+                i, loaddata.fmt_documents_batch, processes=processes,
+                batch_size=args.batch_size)),
+            records
+        )
+        processes *= 2
+
+    allocations('fmt_document', one_at_a_time, records[:2000])
+    allocations('fmt_documents_batch', loaddata.fmt_documents_batch, records[:2000])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+# coding: utf-8
+"""
+Import time of processing.loaddata in the working tree against a baseline
+revision, each measured in fresh interpreters.
+
+Both trees are copied to a temporary directory, so the bytecode and the
+compiled ISO 3166 tables written while measuring never reach the package.
+
+python benchmarks/import_loaddata.py <baseline revision> [--rounds 10]
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+here = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PACKAGES = ['processing', 'publication']
+
+IMPORT = """
+import time
+start = time.perf_counter()
+import processing.loaddata
+print(time.perf_counter() - start)
+"""
+
+# Lookup of a country, loading the ISO 3166 tables when they are loaded on
+# first use.
+FIRST_USE = """
+import time
+import processing.loaddata
+start = time.perf_counter()
+processing.loaddata.country('Brasil')
+print(time.perf_counter() - start)
+"""
+
+
+def copy_working_tree(directory):
+    for package in PACKAGES:
+        shutil.copytree(
+            os.path.join(here, package), os.path.join(directory, package),
+            ignore=shutil.ignore_patterns('__pycache__', '*.pyc', '*.pickle'))
+
+
+def copy_revision(revision, directory):
+    archive = os.path.join(directory, 'revision.tar')
+    with open(archive, 'wb') as f:
+        subprocess.check_call(
+            ['git', 'archive', revision] + PACKAGES, stdout=f, cwd=here)
+
+    with tarfile.open(archive) as tar:
+        tar.extractall(directory)
+
+    os.remove(archive)
+
+
+def measure(directory, code, rounds):
+    """
+    Best time printed by the code in fresh interpreters run in the
+    directory, after one run warming up the bytecode and the compiled
+    tables of the tree.
+    """
+    command = [sys.executable, '-c', code]
+    subprocess.check_output(command, cwd=directory)
+
+    times = []
+    for i in range(rounds):
+        output = subprocess.check_output(command, cwd=directory)
+        times.append(float(output.decode('utf-8').split()[-1]))
+
+    return min(times)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Import time of processing.loaddata against a baseline revision"
+    )
+
+    parser.add_argument(
+        'baseline',
+        help='Git revision of the baseline tree'
+    )
+
+    parser.add_argument(
+        '--rounds',
+        type=int,
+        default=10,
+        help='Number of rounds of each measure'
+    )
+
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+
+    try:
+        trees = [
+            ('baseline (%s)' % args.baseline, os.path.join(directory, 'baseline')),
+            ('working tree', os.path.join(directory, 'current'))
+        ]
+        os.makedirs(trees[0][1])
+        copy_revision(args.baseline, trees[0][1])
+        copy_working_tree(trees[1][1])
+
+        for name, path in trees:
+            imported = measure(path, IMPORT, args.rounds)
+            first_use = measure(path, FIRST_USE, args.rounds)
+            print('%-30s import %.1fms, first country lookup +%.1fms' % (
+                name, imported * 1000, first_use * 1000))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+# coding: utf-8
+import bisect
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+
+from articlemeta import client
+from thriftpy.rpc import make_client
+from thriftpy.transport import TTransportException
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.environ.get('ARTICLEMETA_POOL_SIZE', 8))
+MAX_RETRIES = 3
+RETRY_BACKOFF = 2
+TIMEOUT = 60000  # milliseconds
+
+# Upper bounds, in milliseconds, of the latency histogram buckets.
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Errors of a broken connection, the call is retried with a new one.
+CONNECTION_ERRORS = (TTransportException, socket.error, EOFError)
+
+
+class LatencyHistogram(object):
+    """
+    Counts of the call latencies of each method in LATENCY_BUCKETS.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, seconds):
+        milliseconds = seconds * 1000
+        index = bisect.bisect_left(self.buckets, milliseconds)
+
+        with self._lock:
+            data = self._data.setdefault(method, {
+                'count': 0,
+                'total': 0.0,
+                'buckets': [0] * (len(self.buckets) + 1)
+            })
+            data['count'] += 1
+            data['total'] += milliseconds
+            data['buckets'][index] += 1
+
+    def stats(self):
+        """
+        Calls, mean latency and bucket counts of each method, the buckets are
+        (upper bound in milliseconds, count) pairs, '+Inf' for the last one.
+        """
+        labels = [str(i) for i in self.buckets] + ['+Inf']
+        result = {}
+
+        with self._lock:
+            for method, data in self._data.items():
+                result[method] = {
+                    'count': data['count'],
+                    'mean': data['total'] / data['count'],
+                    'buckets': list(zip(labels, data['buckets']))
+                }
+
+        return result
+
+
+class PooledCalls(object):
+    """
+    Stand-in of the thriftpy client given to the ThriftClient methods, each
+    call runs on a pooled connection and is retried on a new connection
+    when the transport is broken.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+
+    def __getattr__(self, method):
+
+        def call(*args, **kwargs):
+            return self._pool.call(method, *args, **kwargs)
+
+        return call
+
+
+class PooledThriftClient(client.ThriftClient):
+    """
+    ArticleMeta ThriftClient keeping up to ``pool_size`` connections open
+    between the calls, instead of connecting once per call.
+
+    Calls failing with a broken transport are retried up to ``max_retries``
+    times on a new connection, waiting ``retry_backoff ** attempt`` seconds
+    between the attempts. The latency of each call is recorded in
+    ``latency``.
+    """
+
+    def __init__(
+        self, domain=None, admintoken=None, pool_size=POOL_SIZE,
+        max_retries=MAX_RETRIES, retry_backoff=RETRY_BACKOFF, timeout=TIMEOUT
+    ):
+        super(PooledThriftClient, self).__init__(
+            domain=domain, admintoken=admintoken)
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.latency = LatencyHistogram()
+        self.connects = 0
+        self.reconnects = 0
+        self.retries = 0
+        self._idle = LifoQueue(maxsize=pool_size)
+        self._slots = threading.Semaphore(pool_size)
+        self._lock = threading.Lock()
+
+    def grow(self, pool_size):
+        """
+        Allow up to pool_size connections, when more than the current size.
+        """
+        with self._lock:
+            if pool_size <= self.pool_size:
+                return
+
+            extra = pool_size - self.pool_size
+            self.pool_size = pool_size
+            with self._idle.mutex:
+                self._idle.maxsize = pool_size
+
+        for i in range(extra):
+            self._slots.release()
+
+    def _connect(self):
+        connection = make_client(
+            self.ARTICLEMETA_THRIFT.ArticleMeta,
+            self._address,
+            self._port,
+            timeout=self.timeout
+        )
+
+        with self._lock:
+            self.connects += 1
+
+        return connection
+
+    def _acquire(self):
+        self._slots.acquire()
+
+        try:
+            return self._idle.get_nowait()
+        except Empty:
+            pass
+
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection, broken=False):
+        try:
+            if broken:
+                connection.close()
+            else:
+                self._idle.put_nowait(connection)
+        except Full:
+            connection.close()
+        except Exception as e:
+            logger.debug('Fail to close ArticleMeta connection: %s', e)
+        finally:
+            self._slots.release()
+
+    def call(self, method, *args, **kwargs):
+        attempt = 0
+
+        while True:
+            connection = self._acquire()
+            start = time.time()
+
+            try:
+                result = getattr(connection, method)(*args, **kwargs)
+            except CONNECTION_ERRORS as e:
+                self._release(connection, broken=True)
+                if attempt >= self.max_retries:
+                    logger.error(
+                        'ArticleMeta %s failed after %d retries: %s',
+                        method, attempt, e)
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                    self.reconnects += 1
+                wait = self.retry_backoff ** attempt
+                logger.warning(
+                    'ArticleMeta %s failed (%s), reconnecting in %d seconds',
+                    method, e, wait)
+                time.sleep(wait)
+                continue
+            except Exception:
+                # Errors declared by the service, the connection is fine.
+                self._release(connection)
+                raise
+
+            self.latency.record(method, time.time() - start)
+            self._release(connection)
+
+            return result
+
+    @contextmanager
+    def client_context(self):
+        yield PooledCalls(self)
+
+    @property
+    def client(self):
+        return PooledCalls(self)
+
+    def close(self):
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                return
+            try:
+                connection.close()
+            except Exception as e:
+                logger.debug('Fail to close ArticleMeta connection: %s', e)
+
+    def stats(self):
+        return {
+            'connects': self.connects,
+            'reconnects': self.reconnects,
+            'retries': self.retries,
+            'idle': self._idle.qsize(),
+            'latency': self.latency.stats()
+        }
@@ -0,0 +1,94 @@
+# coding: utf-8
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE = os.environ.get('PUBLICATIONSTATS_CHECKPOINT', None)
+ALL_COLLECTIONS = 'all'
+
+
+class CheckpointStore(object):
+    """
+    Persists, per collection and doc_type, the watermark, the latest
+    processing_date of a load finished without failures.
+
+    The watermark is used as the from_date of the next run, so it only asks
+    ArticleMeta for the documents changed since then. ArticleMeta does not
+    return the documents ordered by processing_date, so the watermark only
+    moves when a whole load is indexed: an interrupted or failed load is
+    read again in full from the previous watermark.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoint (
+                collection TEXT,
+                doc_type TEXT,
+                processing_date TEXT,
+                updated_at TEXT,
+                PRIMARY KEY (collection, doc_type)
+            )
+        """)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, collection, doc_type):
+        """
+        Return a dict with processing_date and updated_at, or None when
+        there is no checkpoint for the given collection and doc_type.
+        """
+        row = self.conn.execute(
+            'SELECT processing_date, updated_at FROM checkpoint '
+            'WHERE collection = ? AND doc_type = ?',
+            (collection or ALL_COLLECTIONS, doc_type)
+        ).fetchone()
+
+        if not row:
+            return None
+
+        return {'processing_date': row[0], 'updated_at': row[1]}
+
+    def watermark(self, collection, doc_type):
+        checkpoint = self.get(collection, doc_type)
+
+        return checkpoint['processing_date'] if checkpoint else None
+
+    def finish(self, collection, doc_type, processing_date=None):
+        """
+        Record the end of the load, moving the watermark to the latest
+        processing_date it indexed, None when the load had failures and the
+        watermark must be kept. The watermark never moves backwards.
+        """
+        current = self.watermark(collection, doc_type)
+
+        if not processing_date or (current and processing_date <= current):
+            return
+
+        self.conn.execute(
+            'INSERT OR REPLACE INTO checkpoint '
+            '(collection, doc_type, processing_date, updated_at) '
+            'VALUES (?, ?, ?, ?)',
+            (
+                collection or ALL_COLLECTIONS, doc_type, processing_date,
+                datetime.now().isoformat()
+            )
+        )
+        self.conn.commit()
+
+        logger.info(
+            'Checkpoint watermark of %s (%s) moved to %s',
+            collection or ALL_COLLECTIONS, doc_type, processing_date
+        )
+
+    def close(self):
+        self.conn.close()
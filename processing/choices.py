@@ -1,7 +1,17 @@
 # coding: utf-8
+import argparse
 import json
 import codecs
+import logging
 import os
+import pickle
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
 
 iso_3166_division = os.path.abspath(
     os.path.join(os.path.dirname(__file__), 'iso_3166_divisions.json')
@@ -11,18 +21,176 @@ iso_3166_country_code = os.path.abspath(
     os.path.join(os.path.dirname(__file__), 'iso_3166_country_code.json')
 )
 
-ISO_3166_DIVISION_CODE = {}
-with codecs.open(iso_3166_division) as divisions:
+# Compiled lookup tables, generated at build time (python setup.py build or
+# python -m processing.choices) or on the first use when missing or older
+# than the JSON sources.
+iso_3166_tables = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), 'iso_3166.pickle')
+)
+
+# Bump when the layout or the aliases of the compiled tables change.
+TABLES_VERSION = 1
+
+Tables = namedtuple('Tables', [
+    'country_code',
+    'country_name_as_key',
+    'country_alias',
+    'division_code',
+    'division_name_as_key',
+    'division_alias'
+])
+
+_tables = None
+_tables_lock = threading.Lock()
+
+
+# Spelling variants found in the affiliations that are not derived from the
+# ISO 3166 names.
+COUNTRY_ALIASES = {
+    u'BRASIL': u'BR',
+    u'ESPANA': u'ES',
+    u'USA': u'US',
+    u'EUA': u'US',
+    u'EEUU': u'US',
+    u'UNITED STATES OF AMERICA': u'US',
+    u'ESTADOS UNIDOS': u'US',
+    u'UK': u'GB',
+    u'ENGLAND': u'GB',
+    u'REINO UNIDO': u'GB',
+    u'MEJICO': u'MX',
+    u'ALEMANHA': u'DE',
+    u'ALEMANIA': u'DE',
+    u'FRANCA': u'FR',
+    u'FRANCIA': u'FR',
+    u'ITALIA': u'IT',
+    u'PERU': u'PE',
+    u'PANAMA': u'PA',
+    u'COLOMBIE': u'CO',
+    u'ARGENTINE': u'AR',
+    u'CHILI': u'CL'
+}
+
+NON_ALPHANUMERIC = re.compile(r'[^0-9A-Z]+')
+
+
+def normalize_name(name):
+    """
+    Spelling insensitive form of a country or state name, without accents,
+    punctuation and repeated spaces, in upper case.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = u''.join([i for i in name if not unicodedata.combining(i)])
+
+    return NON_ALPHANUMERIC.sub(u' ', name.upper()).strip()
+
+
+def compile_tables():
+    """
+    Build the lookup tables from the ISO 3166 JSON sources.
+    """
+    division_code = {}
+    with codecs.open(iso_3166_division) as divisions:
+
+        for country, divisions in json.loads(divisions.read()).items():
+            for division, name in divisions.items():
+                div_code = u'%s-%s' % (country, division)
+                division_code[div_code] = name
+
+    with codecs.open(iso_3166_country_code) as countries:
+        country_code = json.loads(countries.read())
+
+    country_alias = {normalize_name(value): key for key, value in country_code.items()}
+    country_alias.update(COUNTRY_ALIASES)
+
+    # Division names are looked up inside the given country first, the same
+    # name may be used by divisions of different countries.
+    division_alias = {}
+    for key, value in division_code.items():
+        division_alias[(key.split('-')[0], normalize_name(value))] = key
+        division_alias.setdefault((None, normalize_name(value)), key)
+
+    return Tables(
+        country_code=country_code,
+        country_name_as_key={value.upper(): key for key, value in country_code.items()},
+        country_alias=country_alias,
+        division_code=division_code,
+        division_name_as_key={value.upper(): key for key, value in division_code.items()},
+        division_alias=division_alias
+    )
+
+
+def write_tables(tables, path=iso_3166_tables):
+    """
+    Serialize the compiled tables, replacing the file atomically.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(
+            (TABLES_VERSION, tuple(tables)), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def read_tables(path=iso_3166_tables):
+    """
+    Load the compiled tables, None when the file is missing, was compiled by
+    another version or is older than the JSON sources.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+        if mtime < max(os.path.getmtime(iso_3166_division), os.path.getmtime(iso_3166_country_code)):
+            return None
+        with open(path, 'rb') as f:
+            version, data = pickle.load(f)
+    except (IOError, OSError, EOFError, ValueError, pickle.UnpicklingError):
+        return None
+
+    if version != TABLES_VERSION:
+        return None
+
+    return Tables(*data)
+
+
+def tables():
+    """
+    Lookup tables of the ISO 3166 countries and divisions, loaded on the
+    first call.
+    """
+    global _tables
+
+    if _tables is not None:
+        return _tables
+
+    with _tables_lock:
+        if _tables is None:
+            loaded = read_tables()
+            if loaded is None:
+                loaded = compile_tables()
+                try:
+                    write_tables(loaded)
+                except (IOError, OSError) as e:
+                    logger.debug('Fail to write compiled ISO 3166 tables: %s', e)
+            _tables = loaded
+
+    return _tables
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Compile the ISO 3166 lookup tables"
+    )
+
+    parser.add_argument(
+        '--output',
+        '-o',
+        default=iso_3166_tables,
+        help='Compiled tables file'
+    )
 
-    for country, divisions in json.loads(divisions.read()).items():
-        for division, name in divisions.items():
-            div_code = u'%s-%s' % (country, division)
-            ISO_3166_DIVISION_CODE[div_code] = name
+    args = parser.parse_args()
 
+    write_tables(compile_tables(), args.output)
 
-ISO_3166_COUNTRY_CODE = {}
-with codecs.open(iso_3166_country_code) as countries:
-    ISO_3166_COUNTRY_CODE = json.loads(countries.read())
 
-ISO_3166_COUNTRY_NAME_AS_KEY = {value.upper(): key for key, value in ISO_3166_COUNTRY_CODE.items()}
-ISO_3166_DIVISION_NAME_AS_KEY = {value.upper(): key for key, value in ISO_3166_DIVISION_CODE.items()}
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+# coding: utf-8
+import logging
+import os
+import sqlite3
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10000
+SOURCES = ('articlemeta', 'indexed')
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+
+    if batch:
+        yield batch
+
+
+class IdDiff(object):
+    """
+    Compares the ids available in ArticleMeta with the ids available in the
+    search index without keeping them in memory.
+
+    Both id streams are spilled into a temporary sqlite file, indexed by id,
+    and the include and remove decisions are read back with cursors, so the
+    memory usage does not depend on the size of the corpus.
+
+    Ids are given as (id, processing_date) tuples, where id is formated as
+    collection_code.
+    """
+
+    def __init__(self, path=None):
+        self._temporary = path is None
+        if self._temporary:
+            fd, path = tempfile.mkstemp(prefix='publicationstats_', suffix='.sqlite')
+            os.close(fd)
+
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=OFF')
+        self.conn.execute('PRAGMA synchronous=OFF')
+        for source in SOURCES:
+            self.conn.execute('DROP TABLE IF EXISTS %s' % source)
+            self.conn.execute(
+                'CREATE TABLE %s (id TEXT PRIMARY KEY, processing_date TEXT)' % source
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self, source, ids):
+        """
+        Store a stream of (id, processing_date) tuples for the given source,
+        returning the number of ids read.
+        """
+        if source not in SOURCES:
+            raise ValueError('Invalid source, expected one of: %s' % str(SOURCES))
+
+        total = 0
+        for batch in _batches(ids, BATCH_SIZE):
+            self.conn.executemany(
+                'INSERT OR REPLACE INTO %s VALUES (?, ?)' % source, batch)
+            total += len(batch)
+            logger.debug('Loaded %d ids from %s', total, source)
+
+        self.conn.commit()
+
+        return total
+
+    def _query(self, sql):
+        cursor = self.conn.cursor()
+        cursor.arraysize = BATCH_SIZE
+        cursor.execute(sql)
+
+        while True:
+            rows = cursor.fetchmany()
+            if not rows:
+                break
+            for row in rows:
+                yield row
+
+    def to_include(self):
+        """
+        Ids available in ArticleMeta that are missing in the index or were
+        updated after being indexed.
+        """
+        sql = """
+            SELECT a.id FROM articlemeta a
+            LEFT JOIN indexed i
+            ON a.id = i.id AND a.processing_date = i.processing_date
+            WHERE i.id IS NULL
+        """
+        for row in self._query(sql):
+            yield row[0]
+
+    def to_remove(self):
+        """
+        Ids available in the index that are no longer available in
+        ArticleMeta.
+        """
+        sql = """
+            SELECT i.id FROM indexed i
+            LEFT JOIN articlemeta a ON a.id = i.id
+            WHERE a.id IS NULL
+        """
+        for row in self._query(sql):
+            yield row[0]
+
+    def count_to_include(self):
+        sql = """
+            SELECT COUNT(*) FROM articlemeta a
+            LEFT JOIN indexed i
+            ON a.id = i.id AND a.processing_date = i.processing_date
+            WHERE i.id IS NULL
+        """
+        return self.conn.execute(sql).fetchone()[0]
+
+    def count(self, source):
+        if source not in SOURCES:
+            raise ValueError('Invalid source %s, expected one of %s' % (source, SOURCES))
+
+        return self.conn.execute('SELECT COUNT(*) FROM %s' % source).fetchone()[0]
+
+    def count_to_remove(self):
+        sql = """
+            SELECT COUNT(*) FROM indexed i
+            LEFT JOIN articlemeta a ON a.id = i.id
+            WHERE a.id IS NULL
+        """
+        return self.conn.execute(sql).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,206 @@
+# coding: utf-8
+import csv
+import gzip
+import logging
+import os
+import uuid
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_OPEN_FILES = 64
+
+# Separator of the values of the multivalued fields in a column.
+SEPARATOR = '|'
+
+# Columns of the exported documents, the analyzed copies of the fields are
+# left out.
+FIELDS = {
+    'journal': [
+        'id', 'issn', 'collection', 'title', 'status', 'subject_areas',
+        'wos_subject_areas', 'is_multidisciplinary', 'included_at_year',
+        'creation_year', 'creation_date', 'processing_year',
+        'processing_date', 'license'
+    ],
+    'article': [
+        'id', 'pid', 'issn', 'journal_title', 'collection', 'issue',
+        'issue_type', 'document_type', 'publication_year',
+        'publication_date', 'creation_year', 'creation_date',
+        'processing_year', 'processing_date', 'subject_areas',
+        'wos_subject_areas', 'is_multidisciplinary', 'languages',
+        'aff_countries', 'aff_states_code', 'aff_states_name', 'aff_names',
+        'keywords', 'pages', 'citations', 'authors', 'license', 'doi',
+        'doi_prefix', 'acceptance_delta'
+    ]
+}
+
+# Field of the year partition of each doc_type.
+YEAR_FIELD = {
+    'journal': 'included_at_year',
+    'article': 'publication_year'
+}
+
+
+def column(value):
+    if value is None:
+        return ''
+
+    if isinstance(value, (list, tuple, set)):
+        return SEPARATOR.join([str(i) for i in value])
+
+    return str(value)
+
+
+class CsvExporter(object):
+    """
+    Writes the formatted documents to gzipped CSV files partitioned by
+    collection and year, as they are added:
+
+        <directory>/<doc_type>/collection=<acronym>/year=<year>/part-<pid>-<uuid>.csv.gz
+
+    Every exporter writes its own part, so several loads, in the same
+    process or not, may export the same partition. The least recently used
+    files are closed when more than ``max_open_files`` are open and appended
+    to when written again, gzip members are concatenated.
+
+    It takes the place of the BulkIndexer, ``on_flush`` is called with the
+    batch number after the files are flushed every ``chunk_size`` documents.
+    Deletions can not be exported and are only counted.
+    """
+
+    def __init__(
+        self, directory, doc_type, chunk_size=CHUNK_SIZE,
+        max_open_files=MAX_OPEN_FILES, on_flush=None
+    ):
+        self.directory = directory
+        self.doc_type = doc_type
+        self.fields = FIELDS[doc_type]
+        self.year_field = YEAR_FIELD[doc_type]
+        self.chunk_size = chunk_size
+        self.max_open_files = max_open_files
+        self.on_flush = on_flush
+        self.part = 'part-%d-%s.csv.gz' % (os.getpid(), uuid.uuid4().hex)
+
+        self.exported = 0
+        self.skipped_deletes = 0
+        self.batches = 0
+
+        self._pending = 0
+        self._created = set()
+        self._files = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def path(self, collection, year):
+        return os.path.join(
+            self.directory, self.doc_type, 'collection=%s' % collection,
+            'year=%s' % year, self.part
+        )
+
+    def _writer(self, collection, year):
+        key = (collection, year)
+
+        if key in self._files:
+            self._files.move_to_end(key)
+            return self._files[key][1]
+
+        if len(self._files) >= self.max_open_files:
+            old_key, (old_file, old_writer) = self._files.popitem(last=False)
+            old_file.close()
+
+        path = self.path(collection, year)
+        new = path not in self._created
+
+        if new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._created.add(path)
+
+        f = gzip.open(path, 'wt' if new else 'at', encoding='utf-8', newline='')
+        writer = csv.writer(f)
+        if new:
+            writer.writerow(self.fields)
+
+        self._files[key] = (f, writer)
+
+        return writer
+
+    def add(self, document):
+        writer = self._writer(
+            document.get('collection') or 'undefined',
+            document.get(self.year_field) or 'undefined'
+        )
+        writer.writerow([column(document.get(i)) for i in self.fields])
+
+        self.exported += 1
+        self._pending += 1
+        if self._pending >= self.chunk_size:
+            self.flush()
+
+    def delete(self, _id):
+        self.skipped_deletes += 1
+        logger.debug('Deletion of %s not exported', _id)
+
+    def flush(self):
+        if not self._pending:
+            return
+
+        for f, writer in self._files.values():
+            f.flush()
+
+        self._pending = 0
+        self.batches += 1
+        if self.on_flush:
+            self.on_flush(self.batches)
+
+    def close(self):
+        self.flush()
+
+        for f, writer in self._files.values():
+            f.close()
+
+        self._files.clear()
+
+    def summary(self):
+        return {
+            'exported': self.exported,
+            'files': len(self._created),
+            'skipped_deletes': self.skipped_deletes
+        }
+
+
+class ExportingIndexer(object):
+    """
+    Indexes the documents with the indexer and exports them with the
+    exporter at the same time, ``on_flush`` is the one of the indexer.
+    """
+
+    def __init__(self, indexer, exporter):
+        self.indexer = indexer
+        self.exporter = exporter
+
+    @property
+    def on_flush(self):
+        return self.indexer.on_flush
+
+    @on_flush.setter
+    def on_flush(self, value):
+        self.indexer.on_flush = value
+
+    def add(self, document):
+        self.exporter.add(document)
+        self.indexer.add(document)
+
+    def delete(self, _id):
+        self.indexer.delete(_id)
+
+    def flush(self):
+        self.exporter.flush()
+        self.indexer.flush()
+
+    def summary(self):
+        return self.indexer.summary()
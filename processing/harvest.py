@@ -0,0 +1,142 @@
+# coding: utf-8
+import logging
+import threading
+from queue import Queue, Empty
+
+from processing.workers import _put, POLL_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+SLICES = 4
+SCROLL_SIZE = 5000
+KEEP_ALIVE = '1m'
+QUEUE_SIZE = 16
+
+_DONE = object()
+
+
+def scroll_slice(client, index, doc_type, body, keep_alive=KEEP_ALIVE):
+    """
+    Yield the pages of hits of one scroll, clearing it at the end.
+    """
+    result = client.search(
+        index=index, doc_type=doc_type, body=body, scroll=keep_alive)
+    scroll_id = result.get('_scroll_id', None)
+
+    try:
+        while result['hits']['hits']:
+            yield result['hits']['hits']
+            result = client.scroll(scroll_id=scroll_id, scroll=keep_alive)
+            scroll_id = result.get('_scroll_id', scroll_id)
+    finally:
+        if scroll_id:
+            try:
+                client.clear_scroll(scroll_id=scroll_id)
+            except Exception as e:
+                logger.debug('Fail to clear scroll: %s', e)
+
+
+def harvest_hits(
+    client, index, doc_type, body, slices=SLICES, keep_alive=KEEP_ALIVE
+):
+    """
+    Stream the hits of the search body, in no particular order, read by
+    ``slices`` parallel sliced scrolls.
+    """
+    if slices <= 1:
+        for hits in scroll_slice(client, index, doc_type, body, keep_alive):
+            for hit in hits:
+                yield hit
+        return
+
+    pages = Queue(maxsize=QUEUE_SIZE)
+    stop = threading.Event()
+    errors = []
+
+    def reader(slice_id):
+        sliced = dict(body, slice={'id': slice_id, 'max': slices})
+        try:
+            for hits in scroll_slice(client, index, doc_type, sliced, keep_alive):
+                if not _put(pages, hits, stop):
+                    return
+        except Exception as e:
+            logger.error('Fail to read slice %d of %s: %s', slice_id, index, e)
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(pages, _DONE, stop)
+
+    threads = [
+        threading.Thread(target=reader, args=(i,), name='slice-%d' % i)
+        for i in range(slices)
+    ]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    running = slices
+    try:
+        while running and not stop.is_set():
+            try:
+                hits = pages.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+
+            if hits is _DONE:
+                running -= 1
+                continue
+
+            for hit in hits:
+                yield hit
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+
+def docvalues_body(fields, query=None, size=SCROLL_SIZE):
+    return {
+        'query': query or {'match_all': {}},
+        '_source': False,
+        'docvalue_fields': fields,
+        'sort': ['_doc'],
+        'size': size
+    }
+
+
+def harvest_ids(
+    client, index, doc_type, query=None, field='processing_date',
+    default=None, slices=SLICES, size=SCROLL_SIZE, keep_alive=KEEP_ALIVE
+):
+    """
+    Stream the (_id, field value) pairs of the documents matching the query,
+    in no particular order.
+
+    The index is read by ``slices`` parallel sliced scrolls, sorted by _doc,
+    without the _source, the field value is read from the doc values.
+
+    default: value given to documents without the field.
+    """
+    body = docvalues_body([field], query=query, size=size)
+
+    for hit in harvest_hits(client, index, doc_type, body, slices, keep_alive):
+        yield (hit['_id'], hit.get('fields', {}).get(field, [default])[0])
+
+
+def harvest_fields(
+    client, index, doc_type, fields, query=None, slices=SLICES,
+    size=SCROLL_SIZE, keep_alive=KEEP_ALIVE
+):
+    """
+    Stream the values of the fields of the documents matching the query, as
+    dicts of lists of values, read from the doc values like harvest_ids.
+    """
+    body = docvalues_body(fields, query=query, size=size)
+
+    for hit in harvest_hits(client, index, doc_type, body, slices, keep_alive):
+        values = hit.get('fields', {})
+        yield {i: values.get(i, []) for i in fields}
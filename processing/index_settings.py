@@ -0,0 +1,73 @@
+# coding: utf-8
+import logging
+import os
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Index settings applied while documents are loaded into the index read by
+# the API, given as key=value pairs separated by commas or "none". Nothing is
+# changed by default: dropping the replicas or the refresh of the serving
+# index risks its data and freezes the API results, the fresh index of a
+# rebuild is created without them instead (see processing.reindex).
+BULK_PROFILE = os.environ.get('PUBLICATIONSTATS_BULK_PROFILE', 'none')
+
+NO_PROFILE = 'none'
+
+
+def parse_profile(profile):
+    """
+    Settings of a profile like "refresh_interval=-1,number_of_replicas=0",
+    empty for "none".
+    """
+    if not profile or profile.strip().lower() == NO_PROFILE:
+        return {}
+
+    settings = {}
+    for item in profile.split(','):
+        try:
+            key, value = item.split('=', 1)
+        except ValueError:
+            raise ValueError('Invalid index setting: %s, expected key=value' % item)
+        settings[key.strip()] = value.strip()
+
+    return settings
+
+
+def current_settings(client, index, keys):
+    """
+    Values of the given settings of each index behind the name, None for the
+    ones using the default value.
+    """
+    data = client.indices.get_settings(index=index)
+    current = {}
+
+    for name, content in data.items():
+        settings = content['settings'].get('index', {})
+        current[name] = {key: settings.get(key, None) for key in keys}
+
+    return current
+
+
+@contextmanager
+def index_settings(client, index, settings):
+    """
+    Apply the settings to the index, or to the indices of an alias, while
+    the block runs and restore the previous values when it ends, even when
+    it fails.
+    """
+    if not settings:
+        yield
+        return
+
+    previous = current_settings(client, index, settings.keys())
+
+    logger.info('Applying index settings %s to %s', settings, index)
+    client.indices.put_settings(index=index, body={'index': settings})
+
+    try:
+        yield
+    finally:
+        for name, values in previous.items():
+            logger.info('Restoring index settings %s of %s', values, name)
+            client.indices.put_settings(index=name, body={'index': values})
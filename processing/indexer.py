@@ -0,0 +1,155 @@
+# coding: utf-8
+import logging
+import time
+
+from elasticsearch import TransportError
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 500
+MAX_CHUNK_BYTES = 10 * 1024 * 1024
+MAX_RETRIES = 3
+RETRY_BACKOFF = 2
+RETRYABLE_STATUS = (429, 500, 502, 503, 504)
+
+
+class BulkIndexer(object):
+    """
+    Buffers index and delete operations and sends them to ElasticSearch
+    through the bulk API.
+
+    A batch is sent every time it reaches ``chunk_size`` operations or
+    ``max_chunk_bytes`` bytes. Only the items that failed with a retryable
+    status are sent again, up to ``max_retries`` times.
+
+    ``on_flush`` is called with the batch number after every batch is sent,
+    when all the operations given before it are done.
+    """
+
+    def __init__(
+        self, client, index, doc_type, chunk_size=CHUNK_SIZE,
+        max_chunk_bytes=MAX_CHUNK_BYTES, max_retries=MAX_RETRIES,
+        retry_backoff=RETRY_BACKOFF, on_flush=None
+    ):
+        self.client = client
+        self.index = index
+        self.doc_type = doc_type
+        self.chunk_size = chunk_size
+        self.max_chunk_bytes = max_chunk_bytes
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.on_flush = on_flush
+        self.serializer = client.transport.serializer
+
+        self.indexed = 0
+        self.deleted = 0
+        self.failed = 0
+        self.failed_ids = []
+        self.batches = 0
+
+        self._buffer = []
+        self._buffer_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def _stage(self, op_type, _id, lines):
+        size = sum([len(i) + 1 for i in lines])
+
+        if self._buffer and (
+            len(self._buffer) >= self.chunk_size or
+            self._buffer_bytes + size > self.max_chunk_bytes
+        ):
+            self.flush()
+
+        self._buffer.append((op_type, _id, lines))
+        self._buffer_bytes += size
+
+    def add(self, document):
+        action = {'index': {'_id': document['id']}}
+        self._stage(
+            'index',
+            document['id'],
+            [self.serializer.dumps(action), self.serializer.dumps(document)]
+        )
+
+    def delete(self, _id):
+        action = {'delete': {'_id': _id}}
+        self._stage('delete', _id, [self.serializer.dumps(action)])
+
+    def _send(self, chunk):
+        """
+        Send one bulk request and return the items that must be retried.
+        """
+        body = '\n'.join([line for op_type, _id, lines in chunk for line in lines]) + '\n'
+
+        try:
+            result = self.client.bulk(
+                body=body, index=self.index, doc_type=self.doc_type)
+        except TransportError as e:
+            logger.warning('Bulk request failed (%d items): %s', len(chunk), e)
+            return chunk
+
+        to_retry = []
+        for staged, item in zip(chunk, result['items']):
+            op_type, _id, lines = staged
+            status = item[op_type].get('status', 500)
+            if 200 <= status < 300 or (op_type == 'delete' and status == 404):
+                if op_type == 'delete':
+                    self.deleted += 1
+                else:
+                    self.indexed += 1
+                continue
+
+            if status in RETRYABLE_STATUS:
+                to_retry.append(staged)
+                continue
+
+            self._fail(staged, item[op_type].get('error', status))
+
+        return to_retry
+
+    def _fail(self, staged, error):
+        op_type, _id, lines = staged
+        self.failed += 1
+        self.failed_ids.append(_id)
+        logger.error('Fail to %s document %s: %s', op_type, _id, error)
+
+    def flush(self):
+        chunk = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        if not chunk:
+            return
+
+        for attempt in range(self.max_retries + 1):
+            if not chunk:
+                break
+
+            if attempt > 0:
+                wait = self.retry_backoff ** attempt
+                logger.info(
+                    'Retrying %d items in %d seconds (attempt %d/%d)',
+                    len(chunk), wait, attempt, self.max_retries
+                )
+                time.sleep(wait)
+
+            chunk = self._send(chunk)
+
+        for staged in chunk:
+            self._fail(staged, 'max retries exceeded')
+
+        self.batches += 1
+        if self.on_flush:
+            self.on_flush(self.batches)
+
+    def summary(self):
+        return {
+            'indexed': self.indexed,
+            'deleted': self.deleted,
+            'failed': self.failed
+        }
@@ -0,0 +1,131 @@
+# coding: utf-8
+import logging
+import threading
+
+from elasticsearch import helpers, TransportError
+
+logger = logging.getLogger(__name__)
+
+# Journal fields repeated in every article of the journal.
+FIELDS = [
+    'issn', 'journal_title', 'subject_areas', 'is_multidisciplinary',
+    'wos_subject_areas'
+]
+
+
+def journal_fields(journal):
+    """
+    Journal fields of the article documents from a xylose Journal.
+    """
+    data = {}
+
+    data['issn'] = journal.scielo_issn
+    data['journal_title'] = journal.title
+    data['subject_areas'] = journal.subject_areas or ['undefined']
+    data['subject_areas'] = ['Multidisciplinary'] if len(data['subject_areas']) > 2 else data['subject_areas']
+    data['is_multidisciplinary'] = 1 if len(data['subject_areas']) > 2 else 0
+    data['wos_subject_areas'] = journal.wos_subject_areas or ['undefined']
+
+    return data
+
+
+class JournalCache(object):
+    """
+    Journal fields of the article documents by collection and ISSN, computed
+    once for each journal of a load instead of once for each article.
+
+    The cache may be pre-warmed from the journal documents already indexed.
+    The counters are kept per process, articles formatted in other processes
+    are counted by their own cache.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prewarmed = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.prewarmed = 0
+
+    def get(self, document):
+        """
+        Journal fields of the given xylose Article.
+        """
+        title = document.data.get('title', None) or {}
+        issn = title.get('v400', [{'_': None}])[0]['_']
+        key = (document.collection_acronym, issn)
+
+        data = self._data.get(key, None)
+
+        if data is not None and issn is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        data = journal_fields(document.journal)
+
+        with self._lock:
+            self.misses += 1
+            if issn is not None:
+                self._data[key] = data
+
+        return data
+
+    def prewarm(self, client, index, collection=None):
+        """
+        Load the journal fields from the journal documents of the index.
+        Documents indexed before the wos_subject_areas field was added are
+        skipped and computed from the articles.
+        """
+        query = {'query': {'match_all': {}}}
+        if collection:
+            query = {'query': {'term': {'collection': collection}}}
+
+        loaded = 0
+        try:
+            for hit in helpers.scan(
+                client, index=index, doc_type='journal', query=query,
+                _source=['collection', 'issn', 'title', 'subject_areas',
+                         'is_multidisciplinary', 'wos_subject_areas']
+            ):
+                source = hit['_source']
+                if 'wos_subject_areas' not in source:
+                    continue
+                data = {
+                    'issn': source['issn'],
+                    'journal_title': source.get('title', None),
+                    'subject_areas': source['subject_areas'],
+                    'is_multidisciplinary': source['is_multidisciplinary'],
+                    'wos_subject_areas': source['wos_subject_areas']
+                }
+                with self._lock:
+                    self._data[(source['collection'], source['issn'])] = data
+                loaded += 1
+        except TransportError as e:
+            logger.warning('Fail to pre-warm the journal cache: %s', e)
+
+        with self._lock:
+            self.prewarmed += loaded
+        logger.info('Journal cache pre-warmed with %d journals', loaded)
+
+        return loaded
+
+    def stats(self):
+        total = self.hits + self.misses
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'prewarmed': self.prewarmed,
+            'size': len(self._data),
+            'hit_rate': float(self.hits) / total if total else 0.0
+        }
@@ -1,17 +1,33 @@
 # coding: utf-8
 import logging
 import logging.config
+import multiprocessing
 from datetime import datetime, timedelta
 import argparse
+import functools
 import os
 import sys
+import threading
 
 from elasticsearch import Elasticsearch, NotFoundError, RequestError
 
 from publication import utils
-from articlemeta import client
+from publication.controller import ALLOWED_DOC_TYPES_N_FACETS
+from publication.local import SnapshotBuilder
+from publication.rollup import build_rollup, write_rollup
+from xylose.scielodocument import Article, UnavailableMetadataException
 from processing import choices
-import xylose
+from processing.indexer import BulkIndexer, CHUNK_SIZE, MAX_CHUNK_BYTES
+from processing.checkpoint import CheckpointStore, CHECKPOINT_FILE
+from processing.diff import IdDiff
+from processing.harvest import harvest_ids, harvest_fields, SLICES
+from processing.index_settings import index_settings, parse_profile, BULK_PROFILE
+from processing.articlemeta_client import PooledThriftClient, POOL_SIZE
+from processing.journals import JournalCache
+from processing.sources import dump_source
+from processing.export import CsvExporter, ExportingIndexer
+from processing.workers import (
+    parallel_documents, parallel_batches, WORKERS, QUEUE_SIZE, BATCH_SIZE)
 
 logger = logging.getLogger(__name__)
 
@@ -60,18 +76,55 @@ FROM = datetime.now() - timedelta(days=30)
 FROM = FROM.isoformat()[:10]
 UNTIL = datetime.now().isoformat()[:10]
 
-ES = Elasticsearch(
-    os.environ.get('ELASTICSEARCH', '127.0.0.1:9200'), timeout=360)
+# Distinct raw country and state strings memoized by the article formatter.
+NORMALIZATION_CACHE_SIZE = int(
+    os.environ.get('PUBLICATIONSTATS_NORMALIZATION_CACHE_SIZE', 4096))
 
+NUMBER_OF_SHARDS = 5
+NUMBER_OF_REPLICAS = 2
 
-def articlemeta(address=None):
+# Maximum number of documents removed by the differential mode, a number of
+# documents or a percentage of the indexed documents.
+REMOVE_THRESHOLD = {
+    'article': os.environ.get('PUBLICATIONSTATS_REMOVE_THRESHOLD_ARTICLE', '1000'),
+    'journal': os.environ.get('PUBLICATIONSTATS_REMOVE_THRESHOLD_JOURNAL', '10')
+}
+
+# Journal fields shared by the articles of the current load.
+JOURNALS = JournalCache()
+
+
+def elasticsearch():
+    return Elasticsearch(
+        os.environ.get('ELASTICSEARCH', '127.0.0.1:9200'), timeout=360)
+
+
+ES = elasticsearch()
+
+
+_articlemeta = {}
+_articlemeta_lock = threading.Lock()
+
+
+def articlemeta(address=None, pool_size=POOL_SIZE):
     """
     address: 127.0.0.1:11720
+
+    Return the pooled client of the address, shared by all the calls of the
+    current process, its pool grows to the largest pool_size asked for.
     """
     address = address or os.environ.get(
         'ARTICLEMETA_THRIFTSERVER', 'articlemeta.scielo.org:11621')
 
-    return client.ThriftClient(domain=address)
+    key = (os.getpid(), address)
+    with _articlemeta_lock:
+        if key not in _articlemeta:
+            _articlemeta[key] = PooledThriftClient(
+                domain=address, pool_size=pool_size)
+        else:
+            _articlemeta[key].grow(pool_size)
+
+    return _articlemeta[key]
 
 
 def fmt_journal(document):
@@ -87,6 +140,7 @@ def fmt_journal(document):
     data['subject_areas'] = document.subject_areas or ['undefined']
     data['subject_areas'] = ['Multidisciplinary'] if len(data['subject_areas']) > 2 else data['subject_areas']
     data['is_multidisciplinary'] = 1 if len(data['subject_areas']) > 2 else 0
+    data['wos_subject_areas'] = document.wos_subject_areas or ['undefined']
     data['included_at_year'] = document.creation_date[0:4]
     data['status'] = document.current_status
     data['title'] = document.title
@@ -96,28 +150,60 @@ def fmt_journal(document):
     return data
 
 
+@functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def country(country):
+    tables = choices.tables()
 
     code = country.upper()
 
-    if code in choices.ISO_3166_COUNTRY_CODE:
+    if code in tables.country_code:
         return code
 
-    if code in choices.ISO_3166_COUNTRY_NAME_AS_KEY:
-        return choices.ISO_3166_COUNTRY_NAME_AS_KEY[code]
+    if code in tables.country_name_as_key:
+        return tables.country_name_as_key[code]
 
-    return 'undefined'
+    return tables.country_alias.get(
+        choices.normalize_name(country), 'undefined')
 
 
+@functools.lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def state(state, country_code):
+    tables = choices.tables()
 
     code = '-'.join([country_code, state])
     code = code.upper()
 
-    if code in choices.ISO_3166_DIVISION_CODE:
+    if code in tables.division_code:
         return code
 
-    return choices.ISO_3166_DIVISION_NAME_AS_KEY.get(state.upper(), 'undefined')
+    if state.upper() in tables.division_name_as_key:
+        return tables.division_name_as_key[state.upper()]
+
+    name = choices.normalize_name(state)
+
+    return tables.division_alias.get(
+        (country_code, name),
+        tables.division_alias.get((None, name), 'undefined')
+    )
+
+
+def normalization_stats():
+    """
+    Hit rate of the memoized country and state normalization.
+    """
+    data = {}
+
+    for name, func in (('country', country), ('state', state)):
+        info = func.cache_info()
+        total = info.hits + info.misses
+        data[name] = {
+            'hits': info.hits,
+            'misses': info.misses,
+            'size': info.currsize,
+            'hit_rate': float(info.hits) / total if total else 0.0
+        }
+
+    return data
 
 
 def pages(first, last):
@@ -159,13 +245,27 @@ def acceptancedelta(received, accepted):
         return days
 
 
-def fmt_document(document):
+def affiliation_codes(country_name, state_name):
+    """
+    Country and state codes of one affiliation.
+    """
+    country_code = country(country_name)
+
+    return country_code, state(state_name, country_code)
+
+
+def fmt_document(document, journals=None):
+    """
+    journals: JournalCache with the journal fields, the cache of the current
+        load when not given.
+    """
+    journals = journals if journals is not None else JOURNALS
+
     data = {}
 
     data['id'] = '_'.join([document.collection_acronym, document.publisher_id])
     data['pid'] = document.publisher_id
-    data['issn'] = document.journal.scielo_issn
-    data['journal_title'] = document.journal.title
+    data.update(journals.get(document))
     data['issue'] = '_'.join([document.collection_acronym, document.publisher_id[0:18]])
     data['issue_type'] = document.issue.type if document.issue else 'undefined'
     data['creation_year'] = document.creation_date[0:4]
@@ -174,27 +274,24 @@ def fmt_document(document):
     data['processing_date'] = document.processing_date
     data['publication_date'] = document.publication_date
     data['publication_year'] = document.publication_date[0:4]
-    data['subject_areas'] = document.journal.subject_areas or ['undefined']
-    data['subject_areas'] = ['Multidisciplinary'] if len(data['subject_areas']) > 2 else data['subject_areas']
-    data['is_multidisciplinary'] = 1 if len(data['subject_areas']) > 2 else 0
-    wos_subject_areas = document.journal.wos_subject_areas or ['undefined']
-    data['wos_subject_areas'] = wos_subject_areas
     data['collection'] = document.collection_acronym
     data['document_type'] = document.document_type
     pgs = pages(document.start_page, document.end_page)
     data['pages'] = pgs
-    data['languages'] = [i.lower() for i in list(set(document.languages()+[document.original_language() or 'undefined']))]
+    data['languages'] = list({i.lower() for i in document.languages() + [document.original_language() or 'undefined']})
     data['aff_countries'] = ['undefined']
     data['aff_states_name'] = ['undefined']
     if document.mixed_affiliations:
-        data['aff_countries'] = list(set([country(aff.get('country', 'undefined')) for aff in document.mixed_affiliations]))
-        data['aff_states_code'] = list(set([state(
-            aff.get('state', 'undefined'),
-            country(aff.get('country', 'undefined'))) for aff in document.mixed_affiliations]))
+        codes = {
+            affiliation_codes(aff.get('country', 'undefined'), aff.get('state', 'undefined'))
+            for aff in document.mixed_affiliations
+        }
+        data['aff_countries'] = list({i[0] for i in codes})
+        data['aff_states_code'] = list({i[1] for i in codes})
         data['aff_names'] = list(set([aff['institution'] for aff in document.mixed_affiliations if aff.get('institution', None)]))
         data['aff_names_analyzed'] = data['aff_names']
         data['aff_names_cleaned'] = list(set([utils.cleanup_string(i) for i in data['aff_names']]))
-        data['aff_states_name'] = list(set([choices.ISO_3166_DIVISION_CODE.get(i, 'undefied') for i in data['aff_states_code']]))
+        data['aff_states_name'] = list(set([choices.tables().division_code.get(i, 'undefied') for i in data['aff_states_code']]))
     keywords = []
     kws = document.keywords() or {}
     if kws:
@@ -217,13 +314,50 @@ def fmt_document(document):
     return data
 
 
-def documents(endpoint, collection=None, issns=None, fmt=None, from_date=FROM, until_date=UNTIL):
+def fmt_documents_batch(records):
+    """
+    Format a batch of ArticleMeta records, xylose Articles or their raw
+    dicts, the unit of work sent to the formatting processes by
+    workers.parallel_batches. The country and state lookups are memoized
+    by each process, see country and state.
 
-    allowed_endpoints = ['journal', 'article']
+    Records without metadata are logged and left out of the returned list,
+    see fmt_or_skip.
+    """
+    formated = []
+
+    for record in records:
+        if isinstance(record, dict):
+            record = Article(record)
+
+        if not record or not record.data:
+            continue
+
+        document = fmt_or_skip(fmt_document, record)
+        if document is not None:
+            formated.append(document)
+
+    return formated
+
+
+def fmt_or_skip(fmt, record):
+    """
+    Format a xylose record, None when its metadata is unavailable, which is
+    logged. Other errors stop the load, so the checkpoint is not moved past
+    documents that were not indexed.
+    """
+    try:
+        return fmt(record)
+    except UnavailableMetadataException as e:
+        logger.error('Fail to format metadata for (%s) error: %s', record.data.get('code', None), e.args[0])
+
+    return None
 
-    if endpoint not in allowed_endpoints:
-        raise TypeError('Invalid endpoint, expected one of: %s' % str(allowed_endpoints))
 
+def articlemeta_source(endpoint, collection=None, issns=None, from_date=FROM, until_date=UNTIL):
+    """
+    Stream the xylose documents of ArticleMeta.
+    """
     for issn in issns:
         if endpoint == 'article':
             itens = articlemeta().documents(collection=collection, issn=issn, from_date=from_date, until_date=until_date)
@@ -231,15 +365,42 @@ def documents(endpoint, collection=None, issns=None, fmt=None, from_date=FROM, u
             itens = articlemeta().journals(collection=collection)
 
         for item in itens:
-            if not item or not item.data:
-                continue
+            yield item
+
+
+def documents(endpoint, collection=None, issns=None, fmt=None, from_date=FROM, until_date=UNTIL, source=None):
+    """
+    source: iterable of xylose documents read instead of ArticleMeta, like
+        processing.sources.dump_source.
+    """
+
+    allowed_endpoints = ['journal', 'article']
+
+    if endpoint not in allowed_endpoints:
+        raise TypeError('Invalid endpoint, expected one of: %s' % str(allowed_endpoints))
 
-            formated_document = fmt(item)
+    if source is None:
+        source = articlemeta_source(
+            endpoint, collection=collection, issns=issns,
+            from_date=from_date, until_date=until_date)
 
-            yield ('add', formated_document)
+    for item in source:
+        if not item or not item.data:
+            continue
 
+        formated_document = fmt_or_skip(fmt, item) if fmt else item
+        if formated_document is None:
+            continue
 
-def setup_index(index):
+        yield ('add', formated_document)
+
+
+def setup_index(index, settings=None):
+    """
+    Create the index with the mappings of the journal and article documents.
+
+    settings: index settings replacing the default ones.
+    """
 
     logger.info('Setting up index %s', index)
 
@@ -263,6 +424,10 @@ def setup_index(index):
                         "type": "string",
                         "index": "not_analyzed"
                     },
+                    "wos_subject_areas": {
+                        "type": "string",
+                        "index": "not_analyzed"
+                    },
                     "is_multidisciplinary": {
                         "type": "long"
                     },
@@ -444,154 +609,313 @@ def setup_index(index):
         },
         "settings": {
             "index": {
-                "number_of_shards": 5,
-                "number_of_replicas": 2
+                "number_of_shards": NUMBER_OF_SHARDS,
+                "number_of_replicas": NUMBER_OF_REPLICAS
             }
         }
     }
 
+    journal_settings_mappings['settings']['index'].update(settings or {})
+
     try:
         ES.indices.create(index=index, body=journal_settings_mappings)
     except RequestError:
         logger.debug('Index already available')
 
 
-def differential_mode(index, endpoint, fmt, collection=None, delete=False):
-    art_meta = articlemeta()
-    logger.info("Running differetial process")
-    ind_ids = set()
-    art_ids = set()
-    logger.info("Loading ArticleMeta IDs")
+def fetch_document(art_meta, endpoint, to_include_id):
+    """
+    Retrieve from ArticleMeta the document of a differential id, formated as
+    collection_code.
+    """
+    splited = to_include_id.split('_')
+    code = splited[1]
+    collection = splited[0]
+
+    if endpoint == 'article':
+        return art_meta.document(code=code, collection=collection)
+
+    if endpoint == 'journal':
+        return art_meta.journal(code=code, collection=collection)
+
+
+def articlemeta_ids(art_meta, endpoint, collection=None):
+    """
+    Stream the (id, processing_date) of the documents available in
+    ArticleMeta.
+    """
     if endpoint == 'article':
         for ndx, item in enumerate(art_meta.documents(collection=collection, only_identifiers=True), 1):
-            code = '_'.join([item.collection, item.code, item.processing_date])
-            art_ids.add(code)
+            code = '_'.join([item.collection, item.code])
             logger.debug('Read item from ArticleMeta (%d): %s', ndx, code)
+            yield (code, item.processing_date)
 
     if endpoint == 'journal':
         for ndx, item in enumerate(art_meta.journals(collection=collection), 1):
-            code = '_'.join([item.collection_acronym, item.scielo_issn, item.processing_date])
-            art_ids.add(code)
+            code = '_'.join([item.collection_acronym, item.scielo_issn])
             logger.debug('Read item from ArticleMeta (%d): %s', ndx, code)
+            yield (code, item.processing_date)
 
-    logger.info("Loading ElasticSearch Index IDs")
 
+def index_ids(index, endpoint, collection=None, slices=SLICES):
+    """
+    Stream the (id, processing_date) of the documents available in the
+    search index.
+    """
+    query = None
     if collection:
         query = {
-            "match": {
+            "term": {
                 "collection": collection
-
             }
         }
-    else:
-        query = {
-            "match_all": {}
-        }
 
-    body = {
-        "query": query,
-        "_source": ["id", "processing_date"]
-    }
+    return harvest_ids(
+        ES, index, endpoint, query=query, field='processing_date',
+        default='1900-01-01', slices=slices
+    )
 
-    result = ES.search(index=index, doc_type=endpoint, body=body, size=10000, scroll='1h')
-    ndx = 0
-    while True:
-        scroll = {
-            'scroll': '1h',
-            'scroll_id': result['_scroll_id']
-        }
-        if len(result['hits']['hits']) == 0:
-            ES.clear_scroll(scroll_id=result['_scroll_id'])
-            break
-        for item in result['hits']['hits']:
-            ndx += 1
-            code = "_".join([item['_source']['id'], item['_source'].get('processing_date', '1900-01-01')])
-            ind_ids.add(code)
-            logger.debug('Read item from ElasticSearch Index (%d): %s', ndx, code)
-        result = ES.scroll(body=scroll, scroll='1h')
-
-    # Ids to include
-    logger.info("Running include records process.")
-    include_ids = art_ids - ind_ids
-    total_to_include = len(include_ids)
-    logger.info("Including (%d) documents to search index." % total_to_include)
-    if total_to_include > 0:
-        for ndx, to_include_id in enumerate(include_ids, 1):
-            logger.debug("Including documento (%d/%d): %s" % (ndx, total_to_include, to_include_id))
-            splited = to_include_id.split('_')
-            code = splited[1]
-            collection = splited[0]
-            processing_date = splited[2]
-            if endpoint == 'article':
-                document = art_meta.document(code=code, collection=collection)
-                try:
-                    document = fmt(document)
-                except xylose.scielodocument.UnavailableMetadataException as e:
-                    logger.error('Fail to format metadata for (%s_%s) error: %s', collection, code, e.args[0])
-                    continue
-
-            if endpoint == 'journal':
-                document = art_meta.journal(code=code, collection=collection)
-                try:
-                    document = fmt(document)
-                except xylose.scielodocument.UnavailableMetadataException as e:
-                    logger.error('Fail to format metadata for (%s_%s) error: %s', collection, code, e.args[0])
-                    continue
-
-            ES.index(index=index, doc_type=endpoint, id=document['id'], body=document)
-
-    # Ids to remove
-    if delete is True:
-        logger.info("Running remove records process.")
-        remove_ids = set([i.split('_')[1] for i in ind_ids]) - set([i.split('_')[1] for i in art_ids])
-        total_to_remove = len(remove_ids)
-        logger.info("Removing (%d) documents to search index." % total_to_remove)
-        if endpoint == 'article' and total_to_remove > 1000:
-            logger.warning('To many documents to remove (%d), skipping', total_to_remove)
-            return
-
-        if endpoint == 'journal' and total_to_remove > 10:
-            logger.warning('To many journals to remove (%d), skipping', total_to_remove)
-            return
-
-        for ndx, to_remove_id in enumerate(remove_ids, 1):
-            logger.debug('Removing document (%d/%d): %s', ndx, total_to_remove, to_remove_id)
-            splited = to_remove_id.split('_')
-            code = '_'.join([splited[0], splited[1]])
-            collection = splited[0]
-            processing_date = splited[2]
-            ES.delete(index=index, doc_type=endpoint, id=code)
+
+def write_index_rollup(index, generation, path, slices=SLICES):
+    """
+    Write the rollup of the facets of the documents of the index, tagged
+    with its generation, see publication.rollup.
+    """
+    builder = SnapshotBuilder()
+
+    for doc_type, facets in ALLOWED_DOC_TYPES_N_FACETS.items():
+        logger.info('Reading the %s facets of index %s', doc_type, index)
+        for document in harvest_fields(ES, index, doc_type, facets, slices=slices):
+            builder.add(doc_type, document)
+
+    rollup = build_rollup(builder.snapshot(generation), generation=generation)
+    write_rollup(rollup, path)
+
+    logger.info(
+        'Rollup %s of generation %s written, %d cuboids',
+        path, generation, len(rollup.cube))
+
+
+def publish_generation(index, rollup=None):
+    """
+    Make the loaded documents searchable and publish a new generation of the
+    index, used by the API to drop its cached responses.
+
+    rollup: path of the rollup of the facets written for the new generation.
+    """
+    generation = datetime.now().isoformat()
+
+    ES.indices.refresh(index=index)
+    ES.index(
+        index=index,
+        doc_type=utils.GENERATION_DOC_TYPE,
+        id=utils.GENERATION_ID,
+        body={'generation': generation}
+    )
+
+    logger.info('Published index generation %s', generation)
+
+    if rollup:
+        write_index_rollup(index, generation, rollup)
+
+    return generation
+
+
+def removal_limit(threshold, total):
+    """
+    Maximum number of documents removed by the differential mode, the
+    threshold is a number of documents, like 1000, or a percentage of the
+    indexed documents, like 5%.
+    """
+    threshold = str(threshold).strip()
+
+    try:
+        if threshold.endswith('%'):
+            return int(total * float(threshold[:-1]) / 100)
+        return int(threshold)
+    except ValueError:
+        raise ValueError(
+            'Invalid removal threshold %s, expected a number or a percentage' % threshold)
+
+
+def write_removal_report(path, ids):
+    """
+    Write the ids eligible to be removed, one per line.
+    """
+    with open(path, 'w') as report:
+        for _id in ids:
+            report.write(_id + '\n')
+
+    logger.info('Removal report written to %s', path)
+
+
+def differential_mode(
+    index, endpoint, fmt, collection=None, delete=False, indexer=None,
+    workers=WORKERS, queue_size=QUEUE_SIZE, processes=0,
+    remove_threshold=None, dry_run_report=None
+):
+    """
+    remove_threshold: maximum number of documents removed, as a number or a
+        percentage of the indexed documents, REMOVE_THRESHOLD of the endpoint
+        when not given.
+    dry_run_report: file receiving the ids eligible to be removed, nothing is
+        removed when given.
+    """
+    indexer = indexer or BulkIndexer(ES, index, endpoint)
+    art_meta = articlemeta()
+    logger.info("Running differetial process")
+
+    with IdDiff() as diff:
+        logger.info("Loading ArticleMeta IDs")
+        diff.load('articlemeta', articlemeta_ids(art_meta, endpoint, collection))
+
+        logger.info("Loading ElasticSearch Index IDs")
+        diff.load('indexed', index_ids(index, endpoint, collection))
+
+        # Ids to include
+        logger.info("Running include records process.")
+        total_to_include = diff.count_to_include()
+        logger.info("Including (%d) documents to search index." % total_to_include)
+        if total_to_include > 0:
+            fetch = functools.partial(fetch_document, art_meta, endpoint)
+            for ndx, document in enumerate(parallel_documents(
+                diff.to_include(), fetch, fmt, workers=workers,
+                queue_size=queue_size, processes=processes
+            ), 1):
+                logger.debug("Including documento (%d/%d): %s" % (ndx, total_to_include, document['id']))
+                indexer.add(document)
+
+            indexer.flush()
+
+        # Ids to remove
+        if delete is True or dry_run_report:
+            logger.info("Running remove records process.")
+            total_to_remove = diff.count_to_remove()
+            total_indexed = diff.count('indexed')
+            limit = removal_limit(
+                remove_threshold or REMOVE_THRESHOLD[endpoint], total_indexed)
+            logger.info(
+                "Removing (%d) of (%d) documents from search index, limit (%d).",
+                total_to_remove, total_indexed, limit)
+
+            if dry_run_report:
+                write_removal_report(dry_run_report, diff.to_remove())
+                return
+
+            if total_to_remove > limit:
+                logger.warning(
+                    'To many %s documents to remove (%d), the limit is %d, skipping',
+                    endpoint, total_to_remove, limit)
+                return
+
+            for to_remove_id in diff.to_remove():
+                indexer.delete(to_remove_id)
+
+            indexer.flush()
 
 
 def common_mode(
     index, endpoint, fmt, collection=None, issns=None, from_date=FROM,
-    until_date=UNTIL, delete=False
+    until_date=UNTIL, delete=False, indexer=None, checkpoint=None,
+    processes=0, batch_size=BATCH_SIZE, source=None
 ):
+    """
+    processes: number of processes formatting articles in batches of
+        ``batch_size`` documents, when zero the documents are formatted while
+        they are read.
+    source: iterable of xylose documents read instead of ArticleMeta.
+    """
 
+    indexer = indexer or BulkIndexer(ES, index, endpoint)
     logger.info('Running common mode')
 
-    for event, document in documents(
-        endpoint, collection=collection, issns=issns, fmt=fmt,
-        from_date=from_date, until_date=until_date
-    ):
+    # Latest processing_date of the documents loaded, the watermark of the
+    # checkpoint when all of them are indexed.
+    latest = {'processing_date': None}
+
+    if processes > 0 and endpoint == 'article':
+        raw = (document for event, document in documents(
+            endpoint, collection=collection, issns=issns,
+            from_date=from_date, until_date=until_date, source=source
+        ))
+        formated = parallel_batches(
+            raw, fmt_documents_batch, processes=processes,
+            batch_size=batch_size)
+    else:
+        formated = (document for event, document in documents(
+            endpoint, collection=collection, issns=issns, fmt=fmt,
+            from_date=from_date, until_date=until_date, source=source
+        ))
+
+    for document in formated:
 
         logger.debug('loading document %s into index %s', document['id'], endpoint)
-        ES.index(
-            index=index,
-            doc_type=endpoint,
-            id=document['id'],
-            body=document
-        )
+        indexer.add(document)
+        latest['processing_date'] = max(
+            latest['processing_date'] or '', document['processing_date'])
+
+    indexer.flush()
+
+    if checkpoint:
+        failed = indexer.summary().get('failed', 0)
+        if failed:
+            logger.warning(
+                'Checkpoint watermark of %s (%s) kept, %d documents failed',
+                collection, endpoint, failed)
+            checkpoint.finish(collection, endpoint)
+        else:
+            checkpoint.finish(collection, endpoint, latest['processing_date'])
 
 
 def run(
     doc_type, index=utils.ELASTICSEARCH_INDEX, collection=None, issns=None,
-    from_date=FROM, until_date=UNTIL, differential=False, delete=False
+    from_date=None, until_date=UNTIL, differential=False, delete=False,
+    bulk_size=CHUNK_SIZE, bulk_max_bytes=MAX_CHUNK_BYTES, workers=WORKERS,
+    queue_size=QUEUE_SIZE, processes=0, checkpoint=None,
+    batch_size=BATCH_SIZE, prewarm_journals=False, publish=True,
+    bulk_profile=BULK_PROFILE, remove_threshold=None, dry_run_report=None,
+    dump=None, export=None, export_only=False, rollup=None
 ):
+    """
+    Load the documents of the doc_type and return the summary of the
+    indexer, the number of documents indexed, deleted and failed.
+
+    checkpoint: path of the checkpoint file, when given and from_date is not,
+        only the documents changed since the last checkpoint are loaded.
+    prewarm_journals: load the journal fields of the articles from the
+        journal documents already indexed.
+    publish: publish a new generation of the index at the end, disabled
+        when the caller publishes it once for several loads.
+    bulk_profile: index settings applied during the load and restored at
+        the end, see processing.index_settings.
+    remove_threshold, dry_run_report: see differential_mode.
+    dump: path of a JSONL dump of ArticleMeta records, optionally gzipped,
+        loaded instead of the ArticleMeta server, see processing.sources.
+        The whole dump is loaded, the dates and the checkpoint are ignored.
+    export: directory where the formatted documents are written as CSV files
+        partitioned by collection and year, see processing.export.
+    export_only: write the documents to the export directory without
+        indexing them, ElasticSearch is not used.
+    rollup: path of the rollup of the facets written for the generation
+        published, see publication.rollup.
+    """
+
+    if dump and differential:
+        raise ValueError('The differential mode is not available for dumps')
+
+    if export_only and (differential or not export):
+        raise ValueError('Export only loads require an export directory and are not differential')
 
     logger.info('Running Publication Stats Update')
 
-    setup_index(index)
+    if export_only:
+        # Nothing is indexed, the watermark of the index is kept.
+        publish = False
+        prewarm_journals = False
+        bulk_profile = None
+        checkpoint = None
+    else:
+        setup_index(index)
 
     if doc_type == 'journal':
         endpoint = 'journal'
@@ -605,13 +929,103 @@ def run(
 
     logger.info('Updating %s index', index)
 
-    if differential is True:
-        differential_mode(
-            index, endpoint, fmt, collection=collection, delete=delete)
-    else:
-        common_mode(index, endpoint, fmt, collection, issns, from_date, until_date)
+    # Every fetching thread holds one connection to ArticleMeta.
+    art_meta = articlemeta(pool_size=max(POOL_SIZE, workers))
+
+    JOURNALS.clear()
+    if doc_type == 'article' and prewarm_journals:
+        JOURNALS.prewarm(ES, index, collection=collection)
+
+    source = None
+    if dump:
+        logger.info('Loading documents from dump %s', dump)
+        source = dump_source(dump, endpoint, collection=collection, issns=issns)
+        checkpoint = None
+
+    store = None
+    if checkpoint and issns and any(issns):
+        # Each ISSN is read from the beginning of the period, so a single
+        # watermark for the collection would skip documents.
+        logger.warning('Checkpoint ignored when loading specific ISSNs')
+    elif checkpoint:
+        store = CheckpointStore(checkpoint)
+
+    if not from_date:
+        from_date = (store and store.watermark(collection, endpoint)) or FROM
+        logger.info('Loading documents changed since %s', from_date)
+
+    bulk = None
+    if not export_only:
+        bulk = indexer = BulkIndexer(
+            ES, index, endpoint, chunk_size=bulk_size,
+            max_chunk_bytes=bulk_max_bytes
+        )
+
+    exporter = None
+    if export:
+        logger.info('Exporting %s documents to %s', endpoint, export)
+        exporter = CsvExporter(export, endpoint, chunk_size=bulk_size)
+        indexer = ExportingIndexer(bulk, exporter) if bulk else exporter
+
+    with index_settings(ES, index, parse_profile(bulk_profile)):
+        if differential is True:
+            differential_mode(
+                index, endpoint, fmt, collection=collection, delete=delete,
+                indexer=indexer, workers=workers, queue_size=queue_size,
+                processes=processes, remove_threshold=remove_threshold,
+                dry_run_report=dry_run_report)
+        else:
+            common_mode(
+                index, endpoint, fmt, collection, issns, from_date, until_date,
+                indexer=indexer, checkpoint=store, processes=processes,
+                batch_size=batch_size, source=source)
+
+    if store:
+        store.close()
+
+    if publish:
+        publish_generation(index, rollup=rollup)
+
+    summary = bulk.summary() if bulk else {'indexed': 0, 'deleted': 0, 'failed': 0}
+    logger.info(
+        'Processing finished: %d indexed, %d deleted, %d failed',
+        summary['indexed'], summary['deleted'], summary['failed']
+    )
 
-    logger.info('Processing finished')
+    if exporter:
+        exporter.close()
+        summary.update(exporter.summary())
+        logger.info(
+            'Export finished: %d documents in %d files',
+            summary['exported'], summary['files']
+        )
+
+    art_meta_stats = art_meta.stats()
+    logger.info(
+        'ArticleMeta: %d connections, %d reconnects',
+        art_meta_stats['connects'], art_meta_stats['reconnects']
+    )
+    for method, info in sorted(art_meta_stats['latency'].items()):
+        logger.info(
+            'ArticleMeta %s: %d calls, %.1fms mean latency, histogram %s',
+            method, info['count'], info['mean'],
+            ', '.join(['<=%s: %d' % i for i in info['buckets'] if i[1]])
+        )
+
+    if doc_type == 'article':
+        journals = JOURNALS.stats()
+        logger.info(
+            'Journal cache: %d hits, %d misses, %d pre-warmed, %.1f%% hit rate',
+            journals['hits'], journals['misses'], journals['prewarmed'],
+            journals['hit_rate'] * 100
+        )
+        for name, info in sorted(normalization_stats().items()):
+            logger.info(
+                'Normalization of %s: %d hits, %d misses, %.1f%% hit rate',
+                name, info['hits'], info['misses'], info['hit_rate'] * 100
+            )
+
+    return summary
 
 
 def main():
@@ -632,11 +1046,57 @@ def main():
         help='Collection Acronym'
     )
 
+    parser.add_argument(
+        '--collections',
+        help='Collection acronyms separated by commas, or all for every collection of ArticleMeta, each collection is loaded in its own process'
+    )
+
+    parser.add_argument(
+        '--concurrency',
+        type=int,
+        default=multiprocessing.cpu_count(),
+        help='Maximum number of collections loaded at the same time with --collections or --rebuild'
+    )
+
+    parser.add_argument(
+        '--shard_by_issn',
+        default=False,
+        action='store_true',
+        help='Load the articles of each journal in its own process with --collections'
+    )
+
+    parser.add_argument(
+        '--rebuild',
+        default=False,
+        action='store_true',
+        help='Load all the documents, of the given doc_type or of both, into a new index and swap the --index alias to it when ready'
+    )
+
+    parser.add_argument(
+        '--keep_previous',
+        default=False,
+        action='store_true',
+        help='Keep the indices previously aliased after a rebuild'
+    )
+
+    parser.add_argument(
+        '--replace_index',
+        default=False,
+        action='store_true',
+        help='Replace by an alias the index named as --index in a rebuild, copied first with --keep_previous'
+    )
+
+    parser.add_argument(
+        '--swap_unhealthy',
+        default=False,
+        action='store_true',
+        help='Swap the alias in a rebuild even when the replicas of the new index are not allocated'
+    )
+
     parser.add_argument(
         '--from_date',
         '-f',
-        default=FROM,
-        help='ISO date like 2013-12-31'
+        help='ISO date like 2013-12-31, defaults to the checkpoint watermark or %s' % FROM
     )
 
     parser.add_argument(
@@ -667,6 +1127,17 @@ def main():
         help='Remove documents elegible to be removed in differential process'
     )
 
+    parser.add_argument(
+        '--remove_threshold',
+        help='Maximum number of documents removed in differential process, as a number or a percentage of the indexed documents like 5%%%%, defaults to %s articles and %s journals' % (
+            REMOVE_THRESHOLD['article'], REMOVE_THRESHOLD['journal'])
+    )
+
+    parser.add_argument(
+        '--dry_run_report',
+        help='Write the ids elegible to be removed in differential process to this file instead of removing them'
+    )
+
     parser.add_argument(
         '--doc_type',
         '-t',
@@ -674,6 +1145,95 @@ def main():
         help='Document type that will be updated'
     )
 
+    parser.add_argument(
+        '--bulk_size',
+        '-b',
+        type=int,
+        default=CHUNK_SIZE,
+        help='Maximum number of documents sent in each bulk request'
+    )
+
+    parser.add_argument(
+        '--bulk_max_bytes',
+        type=int,
+        default=MAX_CHUNK_BYTES,
+        help='Maximum size in bytes of each bulk request'
+    )
+
+    parser.add_argument(
+        '--workers',
+        '-w',
+        type=int,
+        default=WORKERS,
+        help='Number of threads retrieving documents from ArticleMeta in differential mode'
+    )
+
+    parser.add_argument(
+        '--queue_size',
+        '-q',
+        type=int,
+        default=QUEUE_SIZE,
+        help='Maximum number of documents waiting to be formated or indexed in differential mode'
+    )
+
+    parser.add_argument(
+        '--processes',
+        '-p',
+        type=int,
+        default=0,
+        help='Number of processes formating documents, 0 formats in the fetching threads, not allowed with --collections'
+    )
+
+    parser.add_argument(
+        '--batch_size',
+        type=int,
+        default=BATCH_SIZE,
+        help='Number of articles sent at once to each formating process'
+    )
+
+    parser.add_argument(
+        '--prewarm_journals',
+        default=False,
+        action='store_true',
+        help='Load the journal fields of the articles from the journals already indexed'
+    )
+
+    parser.add_argument(
+        '--bulk_profile',
+        default=BULK_PROFILE,
+        help='Index settings applied during the load and restored at the end, as key=value pairs separated by commas, or none, defaults to %s' % BULK_PROFILE
+    )
+
+    parser.add_argument(
+        '--dump',
+        help='JSONL dump of ArticleMeta records, one by line, optionally gzipped, loaded instead of the ArticleMeta server'
+    )
+
+    parser.add_argument(
+        '--export',
+        help='Directory where the formatted documents are also written as gzipped CSV files partitioned by collection and year'
+    )
+
+    parser.add_argument(
+        '--export_only',
+        default=False,
+        action='store_true',
+        help='Write the documents to the --export directory without indexing them, the checkpoint is not used'
+    )
+
+    parser.add_argument(
+        '--rollup',
+        default=os.environ.get('PUBLICATIONSTATS_ROLLUP', None),
+        help='Rollup file of the facets of the index written after the load for the generation published, read by the API from PUBLICATIONSTATS_ROLLUP'
+    )
+
+    parser.add_argument(
+        '--checkpoint',
+        '-k',
+        default=CHECKPOINT_FILE,
+        help='Checkpoint file recording, for each collection, the latest processing date of the last load finished without failures, used to run incremental loads, an interrupted load is read again in full'
+    )
+
     parser.add_argument(
         '--logging_level',
         '-l',
@@ -693,10 +1253,54 @@ def main():
     if len(args.issns) > 0:
         issns = utils.ckeck_given_issns(args.issns)
 
-    run(
-        args.doc_type,
-        index=args.index, collection=args.collection,
-        issns=issns or [None], from_date=args.from_date,
+    kwargs = dict(
+        index=args.index, from_date=args.from_date,
         until_date=args.until_date, differential=args.differential,
-        delete=args.delete
+        delete=args.delete, bulk_size=args.bulk_size,
+        bulk_max_bytes=args.bulk_max_bytes, workers=args.workers,
+        queue_size=args.queue_size, processes=args.processes,
+        batch_size=args.batch_size, prewarm_journals=args.prewarm_journals,
+        checkpoint=args.checkpoint, bulk_profile=args.bulk_profile,
+        remove_threshold=args.remove_threshold,
+        dry_run_report=args.dry_run_report, dump=args.dump,
+        export=args.export, export_only=args.export_only,
+        rollup=args.rollup
+    )
+
+    if args.processes and (args.collections or (args.rebuild and args.concurrency > 1)):
+        parser.error('--processes can not be used with --collections, or with --rebuild and --concurrency greater than 1, the collections are already loaded in their own processes')
+
+    if args.export_only and (args.rebuild or args.differential or not args.export):
+        parser.error('--export_only requires --export and can not be used with --rebuild or --differential')
+
+    if args.rebuild:
+        # Imported here, the rebuild runs this module.
+        from processing.reindex import rebuild
+
+        kwargs['alias'] = kwargs.pop('index')
+        rebuild(
+            doc_types=[args.doc_type] if args.doc_type else ['journal', 'article'],
+            keep_previous=args.keep_previous, concurrency=args.concurrency,
+            replace_index=args.replace_index,
+            swap_unhealthy=args.swap_unhealthy,
+            **kwargs
+        )
+        return
+
+    if args.collections:
+        # Imported here, the orchestrator runs this module in its processes.
+        from processing.orchestrator import load_collections
+
+        report = load_collections(
+            args.doc_type, args.collections.split(','),
+            concurrency=args.concurrency, shard_by_issn=args.shard_by_issn,
+            **kwargs
+        )
+        if report['errors']:
+            sys.exit(1)
+        return
+
+    run(
+        args.doc_type, collection=args.collection, issns=issns or [None],
+        **kwargs
     )
@@ -0,0 +1,170 @@
+# coding: utf-8
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from publication import utils
+from processing import loaddata
+from processing.index_settings import index_settings, parse_profile, BULK_PROFILE
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY = multiprocessing.cpu_count()
+ALL_COLLECTIONS = 'all'
+
+
+def discover_collections(art_meta):
+    """
+    Acronyms of the collections available at ArticleMeta.
+    """
+    return sorted([i.code for i in art_meta.collections(only_identifiers=True)])
+
+
+def discover_issns(art_meta, collection):
+    """
+    ISSNs of the journals of a collection available at ArticleMeta.
+    """
+    return sorted([
+        i.code for i in art_meta.journals(
+            collection=collection, only_identifiers=True)
+    ])
+
+
+def shards(art_meta, doc_type, collections, shard_by_issn=False):
+    """
+    Units of work of the load, one (collection, issns) pair for each
+    collection, or for each journal of the collections when loading articles
+    with ``shard_by_issn``.
+    """
+    for collection in collections:
+        if shard_by_issn and doc_type == 'article':
+            for issn in discover_issns(art_meta, collection):
+                yield (collection, [issn])
+            continue
+
+        yield (collection, [None])
+
+
+def run_shard(doc_type, collection, issns, kwargs, runner=None):
+    """
+    Load one shard in a pool process, returning the summary of the load.
+
+    runner: function loading the shard, loaddata.run by default, it must be
+        picklable, a function of a module.
+    """
+    start = time.time()
+    runner = runner or loaddata.run
+
+    # The connections inherited from the parent process are not shared.
+    loaddata.ES = loaddata.elasticsearch()
+
+    summary = runner(
+        doc_type, collection=collection, issns=issns, publish=False, **kwargs)
+
+    summary['elapsed'] = time.time() - start
+
+    return summary
+
+
+def load_collections(
+    doc_type, collections, concurrency=CONCURRENCY, shard_by_issn=False,
+    runner=None, publish=True, **kwargs
+):
+    """
+    Load the given collections, 'all' for every collection of ArticleMeta,
+    running up to ``concurrency`` shards at the same time, each one in its
+    own process.
+
+    The shards of the collections share the checkpoint file, one row for
+    each collection, the shards of ISSNs do not use it. The documents are
+    formatted in the shard processes, formatting processes
+    (kwargs['processes']) are not started inside them.
+
+    runner: function loading each shard, see run_shard.
+    publish: publish a new generation of the index after the load, left to
+        the caller loading several doc_types.
+    kwargs: arguments of loaddata.run given to every shard.
+
+    Returns the report of the load, with the totals of the loaded shards and
+    the errors of the failed ones.
+    """
+    if kwargs.get('processes', 0):
+        raise ValueError(
+            'Formatting processes can not be used with the shards processes')
+
+    art_meta = loaddata.articlemeta()
+
+    if shard_by_issn and kwargs.get('differential', False):
+        # The differential mode compares whole collections.
+        logger.warning('Sharding by ISSN ignored in differential mode')
+        shard_by_issn = False
+
+    if ALL_COLLECTIONS in collections:
+        collections = discover_collections(art_meta)
+
+    work = list(shards(art_meta, doc_type, collections, shard_by_issn))
+    logger.info(
+        'Loading %d shards of %d collections with %d processes',
+        len(work), len(collections), concurrency
+    )
+
+    report = {
+        'shards': len(work),
+        'finished': 0,
+        'indexed': 0,
+        'deleted': 0,
+        'failed': 0,
+        'errors': []
+    }
+
+    # The profile is applied once for all the shards, shards restoring the
+    # settings while others are loading would leave the bulk settings.
+    profile = parse_profile(kwargs.pop('bulk_profile', BULK_PROFILE))
+    kwargs['bulk_profile'] = None
+    if kwargs.get('export_only', False):
+        profile = {}
+    index = kwargs.get('index', utils.ELASTICSEARCH_INDEX)
+
+    with index_settings(loaddata.ES, index, profile), \
+            ProcessPoolExecutor(concurrency) as pool:
+        futures = {
+            pool.submit(run_shard, doc_type, collection, issns, kwargs, runner): (collection, issns)
+            for collection, issns in work
+        }
+
+        for future in as_completed(futures):
+            collection, issns = futures[future]
+            shard = collection if issns == [None] else '%s %s' % (collection, issns[0])
+
+            try:
+                summary = future.result()
+            except Exception as e:
+                logger.exception('Fail to load shard %s', shard)
+                report['errors'].append({'shard': shard, 'error': str(e)})
+                continue
+
+            report['finished'] += 1
+            for field in ('indexed', 'deleted', 'failed'):
+                report[field] += summary[field]
+
+            logger.info(
+                'Shard %s finished in %.0fs (%d/%d): %d indexed, %d deleted, %d failed',
+                shard, summary['elapsed'], report['finished'] + len(report['errors']),
+                report['shards'], summary['indexed'], summary['deleted'],
+                summary['failed']
+            )
+
+    if publish and not kwargs.get('export_only', False):
+        loaddata.publish_generation(index, rollup=kwargs.get('rollup', None))
+
+    logger.info(
+        'Load finished: %d/%d shards, %d indexed, %d deleted, %d failed documents',
+        report['finished'], report['shards'], report['indexed'],
+        report['deleted'], report['failed']
+    )
+
+    for error in report['errors']:
+        logger.error('Shard %s failed: %s', error['shard'], error['error'])
+
+    return report
@@ -0,0 +1,225 @@
+# coding: utf-8
+import logging
+from datetime import datetime
+
+from elasticsearch import TransportError
+from articlemeta.client import DEFAULT_FROM_DATE
+
+from publication import utils
+from publication.controller import stats_request
+from processing import loaddata
+
+logger = logging.getLogger(__name__)
+
+# Settings of the new index while it is loaded, nothing is searched there
+# until the alias is swapped.
+LOAD_SETTINGS = {
+    'number_of_replicas': 0,
+    'refresh_interval': '-1'
+}
+
+SERVING_SETTINGS = {
+    'number_of_replicas': loaddata.NUMBER_OF_REPLICAS,
+    'refresh_interval': '1s'
+}
+
+HEALTH_TIMEOUT = '30m'
+
+# Seconds to copy an index replaced by the alias.
+REINDEX_TIMEOUT = 3600
+
+# Aggregations requested by the SciELO Analytics dashboards, run against the
+# new index before it starts serving so its caches are warm.
+WARM_QUERIES = [
+    ('journal', ['collection']),
+    ('journal', ['subject_areas']),
+    ('journal', ['status']),
+    ('article', ['collection']),
+    ('article', ['publication_year']),
+    ('article', ['subject_areas']),
+    ('article', ['document_type']),
+    ('article', ['languages']),
+    ('article', ['aff_countries']),
+    ('article', ['collection', 'publication_year']),
+    ('article', ['issn'])
+]
+
+
+def new_index_name(alias):
+    return '%s_%s' % (alias, datetime.now().strftime('%Y%m%d%H%M%S'))
+
+
+def aliased_indices(client, alias):
+    """
+    Indices the alias points to, empty when it is not an alias.
+    """
+    if not client.indices.exists_alias(name=alias):
+        return []
+
+    return sorted(client.indices.get_alias(name=alias).keys())
+
+
+def warm(client, index, queries=WARM_QUERIES):
+    """
+    Run the common aggregation queries against the index.
+    """
+    for doc_type, aggs in queries:
+        request = stats_request(doc_type, aggs)
+        try:
+            client.search(index=index, doc_type=doc_type, body=request['body'])
+        except TransportError as e:
+            logger.warning('Fail to warm %s aggregations %s: %s', doc_type, aggs, e)
+
+    logger.info('Index %s warmed with %d queries', index, len(queries))
+
+
+def concrete_index(client, alias):
+    """
+    Tell if the name is taken by an index instead of an alias.
+    """
+    return not aliased_indices(client, alias) and client.indices.exists(index=alias)
+
+
+def wait_green(client, index, timeout=HEALTH_TIMEOUT):
+    """
+    Wait for the replicas of the index to be allocated, returns False when
+    they are not allocated before the timeout.
+    """
+    try:
+        health = client.cluster.health(
+            index=index, wait_for_status='green', timeout=timeout)
+    except TransportError as e:
+        logger.warning('Index %s replicas not allocated: %s', index, e)
+        return False
+
+    if health.get('timed_out', False):
+        logger.warning('Index %s replicas not allocated, status %s', index, health.get('status'))
+        return False
+
+    return True
+
+
+def swap_alias(client, alias, index, replace_index=False, keep_previous=False):
+    """
+    Point the alias to the index, removing it from the indices it pointed
+    to in the same request. Returns the indices previously aliased.
+
+    replace_index: replace an index named as the alias, created before the
+        aliases, it is refused otherwise.
+    keep_previous: copy the index replaced to <alias>_previous_<timestamp>
+        before deleting it.
+    """
+    previous = aliased_indices(client, alias)
+
+    if not previous and client.indices.exists(index=alias):
+        if not replace_index:
+            raise ValueError(
+                '%s is an index, not an alias, it is only replaced with replace_index' % alias)
+
+        if keep_previous:
+            backup = new_index_name('%s_previous' % alias)
+            logger.info('Copying index %s to %s', alias, backup)
+            loaddata.setup_index(backup)
+            client.reindex(
+                body={'source': {'index': alias}, 'dest': {'index': backup}},
+                wait_for_completion=True, request_timeout=REINDEX_TIMEOUT)
+
+        # The name is taken by the index itself and must be freed before the
+        # alias is created, the API fails until the alias is added.
+        logger.warning('Replacing index %s by an alias to %s', alias, index)
+        client.indices.delete(index=alias)
+
+    actions = [{'remove': {'index': i, 'alias': alias}} for i in previous]
+    actions.append({'add': {'index': index, 'alias': alias}})
+
+    client.indices.update_aliases(body={'actions': actions})
+    logger.info('Alias %s swapped from %s to %s', alias, previous, index)
+
+    return previous
+
+
+def load_all(doc_type, concurrency, kwargs):
+    """
+    Load every collection in parallel processes.
+    """
+    # Imported here, the orchestrator runs loaddata in its processes.
+    from processing.orchestrator import load_collections
+
+    # The generation is published by the rebuild, after every doc_type.
+    report = load_collections(
+        doc_type, ['all'], concurrency=concurrency, publish=False, **kwargs)
+
+    if report['errors']:
+        raise RuntimeError(
+            '%d shards of %s failed' % (len(report['errors']), doc_type))
+
+
+def rebuild(
+    alias=utils.ELASTICSEARCH_INDEX, doc_types=('journal', 'article'),
+    keep_previous=False, concurrency=1, replace_index=False,
+    swap_unhealthy=False, **kwargs
+):
+    """
+    Load every document into a new timestamped index and swap the alias read
+    by the API to it once it is ready, the index being replaced keeps
+    serving the queries during the load.
+
+    doc_types: documents loaded into the new index.
+    keep_previous: keep the indices previously aliased instead of deleting
+        them after the swap.
+    concurrency: number of collections loaded at the same time, see
+        processing.orchestrator.
+    replace_index: replace an index named as the alias, see swap_alias.
+    swap_unhealthy: swap the alias even when the replicas of the new index
+        are not allocated, otherwise the rebuild fails keeping the new index.
+    kwargs: arguments of loaddata.run.
+
+    Returns the name of the new index.
+    """
+    client = loaddata.ES
+    index = new_index_name(alias)
+
+    if concrete_index(client, alias) and not replace_index:
+        raise ValueError(
+            '%s is an index, not an alias, it is only replaced with replace_index' % alias)
+
+    kwargs.update({
+        'index': index,
+        'from_date': kwargs.get('from_date') or DEFAULT_FROM_DATE,
+        'differential': False,
+        'checkpoint': None,
+        'bulk_profile': None
+    })
+
+    logger.info('Rebuilding %s into index %s', alias, index)
+    loaddata.setup_index(index, settings=LOAD_SETTINGS)
+
+    try:
+        for doc_type in doc_types:
+            if concurrency > 1:
+                load_all(doc_type, concurrency, kwargs)
+            else:
+                loaddata.run(doc_type, publish=False, **kwargs)
+    except (Exception, KeyboardInterrupt):
+        logger.error('Rebuild failed, removing index %s', index)
+        client.indices.delete(index=index)
+        raise
+
+    client.indices.put_settings(index=index, body={'index': SERVING_SETTINGS})
+    if not wait_green(client, index) and not swap_unhealthy:
+        raise RuntimeError(
+            'Index %s is not green, alias %s not swapped' % (index, alias))
+
+    loaddata.publish_generation(index, rollup=kwargs.get('rollup', None))
+    warm(client, index)
+
+    previous = swap_alias(
+        client, alias, index, replace_index=replace_index,
+        keep_previous=keep_previous)
+
+    if not keep_previous:
+        for old in previous:
+            logger.info('Deleting previous index %s', old)
+            client.indices.delete(index=old)
+
+    return index
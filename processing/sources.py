@@ -0,0 +1,69 @@
+# coding: utf-8
+import codecs
+import gzip
+import json
+import logging
+
+from xylose.scielodocument import Article, Journal
+
+logger = logging.getLogger(__name__)
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def open_dump(path):
+    """
+    Open a dump for reading text, decompressing it when it is gzipped.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(2)
+
+    if magic == GZIP_MAGIC:
+        return codecs.getreader('utf-8')(gzip.open(path, 'rb'))
+
+    return codecs.open(path, 'r', encoding='utf-8')
+
+
+def read_dump(path):
+    """
+    Stream the raw ArticleMeta records of a JSONL dump, one JSON document by
+    line, optionally gzipped. Invalid lines are logged and skipped.
+    """
+    with open_dump(path) as dump:
+        for ndx, line in enumerate(dump, 1):
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                logger.error('Invalid JSON at line %d of %s: %s', ndx, path, e)
+
+
+def dump_source(path, endpoint, collection=None, issns=None):
+    """
+    Stream the xylose documents of a dump of ArticleMeta records, replacing
+    the ArticleMeta server as the source of the documents.
+
+    endpoint: 'article' for Article records, 'journal' for Journal records.
+    collection, issns: keep only the documents of the collection and of the
+        journals, None for all of them.
+    """
+    issns = set([i for i in issns or [] if i])
+
+    for record in read_dump(path):
+        if collection and record.get('collection', None) != collection:
+            continue
+
+        if endpoint == 'article':
+            document = Article(record)
+            issn = (record.get('code', None) or '')[1:10]
+        else:
+            document = Journal(record)
+            issn = document.scielo_issn
+
+        if issns and issn not in issns:
+            continue
+
+        yield document
@@ -0,0 +1,197 @@
+# coding: utf-8
+import itertools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue, Empty, Full
+
+import xylose
+
+logger = logging.getLogger(__name__)
+
+WORKERS = 4
+QUEUE_SIZE = 1000
+BATCH_SIZE = 200
+POLL_INTERVAL = 0.5
+
+_DONE = object()
+
+
+def _put(queue, item, stop):
+    """
+    Put an item in a bounded queue, giving up when the stop event is set.
+    """
+    while not stop.is_set():
+        try:
+            queue.put(item, timeout=POLL_INTERVAL)
+            return True
+        except Full:
+            continue
+
+    return False
+
+
+def parallel_documents(
+    items, fetch, fmt, workers=WORKERS, queue_size=QUEUE_SIZE, processes=0
+):
+    """
+    Fetch and format documents concurrently, yielding the formatted documents
+    in completion order.
+
+    items: iterable of identifiers given to ``fetch``.
+    fetch: callable that retrieves the raw document of one identifier.
+    fmt: callable that formats a raw document, it must be picklable when
+        ``processes`` is greater than zero.
+    workers: number of threads fetching documents.
+    queue_size: maximum number of pending identifiers and formatted
+        documents held in memory.
+    processes: number of processes formatting documents, when zero the
+        fetching threads also format the documents.
+
+    Both queues are bounded, so a slow consumer stops the workers instead of
+    accumulating documents in memory. Closing the generator, or a
+    KeyboardInterrupt while it is consumed, stops the workers.
+    """
+    tasks = Queue(maxsize=queue_size)
+    results = Queue(maxsize=queue_size)
+    stop = threading.Event()
+    pool = ProcessPoolExecutor(processes) if processes > 0 else None
+
+    def feeder():
+        try:
+            for item in items:
+                if not _put(tasks, item, stop):
+                    return
+        finally:
+            for _ in range(workers):
+                _put(tasks, _DONE, stop)
+
+    def worker():
+        try:
+            while not stop.is_set():
+                try:
+                    item = tasks.get(timeout=POLL_INTERVAL)
+                except Empty:
+                    continue
+
+                if item is _DONE:
+                    return
+
+                try:
+                    document = fetch(item)
+                except Exception as e:
+                    logger.error('Fail to fetch document (%s) error: %s', item, e)
+                    continue
+
+                if not document or not document.data:
+                    logger.warning('Document not available: %s', item)
+                    continue
+
+                try:
+                    if pool:
+                        formated_document = pool.submit(fmt, document).result()
+                    else:
+                        formated_document = fmt(document)
+                except xylose.scielodocument.UnavailableMetadataException as e:
+                    logger.error('Fail to format metadata for (%s) error: %s', item, e.args[0])
+                    continue
+                except Exception:
+                    logger.exception('Fail to format document (%s)', item)
+                    continue
+
+                if not _put(results, formated_document, stop):
+                    return
+        finally:
+            _put(results, _DONE, stop)
+
+    threads = [threading.Thread(target=feeder, name='feeder')]
+    threads += [
+        threading.Thread(target=worker, name='worker-%d' % i)
+        for i in range(workers)
+    ]
+
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    running = workers
+    try:
+        while running:
+            try:
+                document = results.get(timeout=POLL_INTERVAL)
+            except Empty:
+                continue
+
+            if document is _DONE:
+                running -= 1
+                continue
+
+            yield document
+    except (KeyboardInterrupt, GeneratorExit):
+        logger.warning('Stopping workers')
+        raise
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        if pool:
+            pool.shutdown()
+
+
+def batches(items, size=BATCH_SIZE):
+    """
+    Split an iterable in lists of at most ``size`` items.
+    """
+    items = iter(items)
+
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+def parallel_batches(items, fmt_batch, processes=0, batch_size=BATCH_SIZE):
+    """
+    Format documents in batches, yielding the formatted documents in the
+    order of the items.
+
+    items: iterable of raw documents.
+    fmt_batch: callable that formats a list of raw documents and returns the
+        list of formatted ones, it must be picklable when ``processes`` is
+        greater than zero.
+    processes: number of processes formatting batches, when zero the
+        batches are formatted in the current process.
+    batch_size: number of raw documents sent to a process at once.
+
+    At most two batches per process are pending, so a slow consumer stops
+    the reading of the items instead of accumulating documents in memory.
+    """
+    if processes <= 0:
+        for batch in batches(items, batch_size):
+            for document in fmt_batch(batch):
+                yield document
+        return
+
+    pool = ProcessPoolExecutor(processes)
+    pending = deque()
+
+    try:
+        for batch in batches(items, batch_size):
+            pending.append(pool.submit(fmt_batch, batch))
+            if len(pending) < processes * 2:
+                continue
+            for document in pending.popleft().result():
+                yield document
+
+        while pending:
+            for document in pending.popleft().result():
+                yield document
+    except (KeyboardInterrupt, GeneratorExit):
+        logger.warning('Stopping batch formatting processes')
+        for future in pending:
+            future.cancel()
+        raise
+    finally:
+        pool.shutdown()
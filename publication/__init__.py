@@ -5,6 +5,7 @@ from pyramid.config import Configurator
 from pyramid.settings import aslist
 
 from publication import controller
+from publication.cache import cache_from_env
 
 
 def main(global_config, **settings):
@@ -14,11 +15,13 @@ def main(global_config, **settings):
     config.add_renderer('jsonp', JSONP(param_name='callback', indent=4))
 
     hosts = aslist(os.environ.get('ELASTICSEARCH', '127.0.0.1:9200'))
+    cache = cache_from_env()
 
     def add_index(request):
-        return controller.stats(
+        return controller.shared_stats(
             hosts=hosts,
-            sniff_on_connection_fail=True
+            sniff_on_connection_fail=True,
+            cache=cache
         )
 
     config.include('pyramid_chameleon')
@@ -26,6 +29,9 @@ def main(global_config, **settings):
     config.add_route('index', '/')
     config.add_route('journals', '/api/v1/journals')
     config.add_route('documents', '/api/v1/documents')
+    config.add_route('journals_facets', '/api/v1/journals/facets')
+    config.add_route('documents_facets', '/api/v1/documents/facets')
+    config.add_route('health', '/api/v1/health')
     config.add_request_method(add_index, 'index', reify=True)
     config.scan()
     return config.make_wsgi_app()
@@ -0,0 +1,300 @@
+# coding: utf-8
+"""
+Asyncio serving mode of the Publication Stats API.
+
+Serves the same routes and JSONP responses of the Pyramid application,
+sharing one pooled HTTP connection to ElasticSearch per worker, so each
+worker handles many concurrent requests while waiting for ElasticSearch.
+
+Requires aiohttp (pip install publication[async]).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import re
+
+import aiohttp
+from aiohttp import web
+import pyramid.httpexceptions as exc
+from pyramid.settings import aslist
+
+from publication import utils, views
+from publication.cache import cache_from_env
+from publication.controller import (
+    ServerError, stats_request, facets_request, request_cache_key,
+    aggregation_response, POOL_SIZE, BACKEND, ELASTICSEARCH_BACKEND, ROLLUP
+)
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT = 60
+JSONP_VALID_CALLBACK = re.compile(r"^[$a-z_][$0-9a-z_\.\[\]]+[^.]$", re.I)
+
+
+class AsyncStats(object):
+    """
+    Asynchronous counterpart of controller.Stats, answering the aggregation
+    requests through a pooled aiohttp session.
+    """
+
+    def __init__(self, hosts, cache=None, pool_size=POOL_SIZE, timeout=TIMEOUT):
+        self.hosts = [i if '://' in i else 'http://%s' % i for i in hosts]
+        self.cache = cache
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session = None
+        self._hosts = itertools.cycle(self.hosts)
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+
+    async def _request(self, method, path, body=None):
+        url = next(self._hosts) + path
+        data = json.dumps(body) if body is not None else None
+
+        try:
+            async with self.session.request(
+                method, url, data=data,
+                headers={'Content-Type': 'application/json'}
+            ) as response:
+                result = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error('ElasticSearch ConnectionError: %s', e)
+            raise ServerError('ElasticSearch ConnectionError: %s' % e)
+
+        if response.status >= 400:
+            logger.error('ElasticSearch TransportError: %s', result)
+            raise ServerError('ElasticSearch TransportError: %s' % result)
+
+        return result
+
+    async def index_generation(self):
+        path = '/%s/%s/%s' % (
+            utils.ELASTICSEARCH_INDEX, utils.GENERATION_DOC_TYPE,
+            utils.GENERATION_ID
+        )
+
+        try:
+            data = await self._request('GET', path)
+        except ServerError as e:
+            logger.warning('Fail to retrieve index generation: %s', e)
+            return None
+
+        return data.get('_source', {}).get('generation', None)
+
+    async def health(self):
+        """
+        Check the ElasticSearch cluster and report the connection pool and
+        cache metrics of this worker, like controller.Stats.health.
+        """
+        try:
+            await self._request('GET', '/')
+            available = True
+        except ServerError:
+            available = False
+
+        data = {
+            'elasticsearch': 'available' if available else 'unavailable',
+            'backend': 'elasticsearch',
+            'pid': os.getpid(),
+            'pool': {'hosts': len(self.hosts), 'limit': self.pool_size}
+        }
+
+        if self.cache:
+            data['cache'] = self.cache.stats()
+
+        return data
+
+    async def _cache(self, method, *args):
+        """
+        Call a method of the response cache, in the default executor when it
+        has a shared backend, which reads and writes files.
+        """
+        function = getattr(self.cache, method)
+
+        if self.cache.shared is None:
+            return function(*args)
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, function, *args)
+
+    async def _aggregate(self, request):
+
+        if self.cache:
+            if self.cache.generation_due():
+                self.cache.update_generation(await self.index_generation())
+            key = request_cache_key(request, self.cache.generation)
+            cached = await self._cache('get', key)
+            if cached is not None:
+                return cached
+
+        path = '/%s/%s/_search' % (
+            utils.ELASTICSEARCH_INDEX, request['doc_type'])
+        query_result = await self._request('POST', path, request['body'])
+
+        response = query_result['aggregations']
+
+        if self.cache:
+            await self._cache('set', key, response)
+
+        return response
+
+    async def publication_stats(
+        self, doc_type, aggs, filters=None, size=None, paginate=False,
+        after=None, other=False
+    ):
+
+        request = stats_request(
+            doc_type, aggs, filters=filters, size=size, paginate=paginate,
+            after=after
+        )
+
+        return aggregation_response(
+            request, await self._aggregate(request), other)
+
+    async def publication_facets(
+        self, doc_type, facets, filters=None, size=None, other=False
+    ):
+
+        request = facets_request(doc_type, facets, filters=filters, size=size)
+
+        return aggregation_response(
+            request, await self._aggregate(request), other)
+
+
+def jsonp(request, data):
+    """
+    Render the data like the Pyramid jsonp renderer.
+    """
+    body = json.dumps(data, indent=4)
+    callback = request.query.get('callback', None)
+
+    if callback is None:
+        return web.Response(text=body, content_type='application/json')
+
+    if not JSONP_VALID_CALLBACK.match(callback):
+        raise web.HTTPBadRequest(text='Invalid JSONP callback function name.')
+
+    return web.Response(
+        text='/**/%s(%s);' % (callback, body),
+        content_type='application/javascript'
+    )
+
+
+def stats_handler(method, doc_type, arguments, filters):
+    """
+    Build the handler of a stats route from the same argument parsers used
+    by the Pyramid views.
+    """
+
+    async def handler(request):
+        try:
+            kwargs = arguments(request.query, filters(request.query))
+            data = await getattr(request.app['stats'], method)(
+                doc_type=doc_type, **kwargs)
+        except exc.HTTPBadRequest as e:
+            raise web.HTTPBadRequest(text=e.detail)
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        except ServerError as e:
+            raise web.HTTPInternalServerError(text=e.message)
+
+        return jsonp(request, data)
+
+    return handler
+
+
+async def index(request):
+    return web.Response(text='Publication Stats API by SciELO')
+
+
+async def health(request):
+    return jsonp(request, await request.app['stats'].health())
+
+
+async def on_startup(app):
+    await app['stats'].open()
+
+
+async def on_cleanup(app):
+    await app['stats'].close()
+
+
+def make_app(hosts=None, pool_size=POOL_SIZE, backend=BACKEND, rollup=ROLLUP):
+    """
+    The aggregations are only answered by ElasticSearch, the local and
+    fallback backends and the rollup are served by the Pyramid application.
+    """
+    if backend != ELASTICSEARCH_BACKEND:
+        raise ValueError(
+            'The asyncio server only queries ElasticSearch, backend %s is served by the Pyramid application' % backend)
+
+    if rollup:
+        logger.warning('Rollup %s not used by the asyncio server', rollup)
+
+    hosts = hosts or aslist(os.environ.get('ELASTICSEARCH', '127.0.0.1:9200'))
+
+    app = web.Application()
+    app['stats'] = AsyncStats(hosts, cache=cache_from_env(), pool_size=pool_size)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_get('/', index)
+    app.router.add_get('/api/v1/health', health)
+    app.router.add_get('/api/v1/journals', stats_handler(
+        'publication_stats', 'journal', views.stats_arguments,
+        views.journal_filters))
+    app.router.add_get('/api/v1/documents', stats_handler(
+        'publication_stats', 'article', views.stats_arguments,
+        views.document_filters))
+    app.router.add_get('/api/v1/journals/facets', stats_handler(
+        'publication_facets', 'journal', views.facets_arguments,
+        views.journal_filters))
+    app.router.add_get('/api/v1/documents/facets', stats_handler(
+        'publication_facets', 'article', views.facets_arguments,
+        views.document_filters))
+
+    return app
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description="Asyncio server of the Publication Stats API"
+    )
+
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Host address to bind'
+    )
+
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8000,
+        help='Port to bind'
+    )
+
+    parser.add_argument(
+        '--pool_size',
+        type=int,
+        default=POOL_SIZE,
+        help='Maximum number of connections to ElasticSearch'
+    )
+
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    web.run_app(make_app(pool_size=args.pool_size), host=args.host, port=args.port)
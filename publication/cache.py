@@ -0,0 +1,405 @@
+# coding: utf-8
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_SIZE = int(os.environ.get('PUBLICATIONSTATS_CACHE_SIZE', 256))
+CACHE_TTL = int(os.environ.get('PUBLICATIONSTATS_CACHE_TTL', 300))
+CACHE_DIR = os.environ.get('PUBLICATIONSTATS_CACHE_DIR', None)
+GENERATION_POLL_INTERVAL = int(
+    os.environ.get('PUBLICATIONSTATS_CACHE_GENERATION_POLL', 30))
+
+# Maximum number of entries of the shared cache directory, the oldest ones
+# are removed by the periodic sweep.
+CACHE_DIR_SIZE = int(os.environ.get('PUBLICATIONSTATS_CACHE_DIR_SIZE', 10000))
+
+
+def cache_key(
+    doc_type, aggs, filters=None, generation=None, kind='stats', options=None
+):
+    """
+    Normalized key of a stats query. The order of the aggregations is kept,
+    it defines the nesting of the buckets, the filters are sorted. ``kind``
+    tells nested aggregations (stats) from sibling ones (facets) and
+    ``options`` holds the bucket size and pagination parameters.
+    """
+    aggs = [i.strip() for i in aggs or []]
+    filters = sorted([(k, str(v)) for k, v in (filters or {}).items()])
+    options = sorted((options or {}).items())
+
+    return json.dumps([generation, kind, doc_type, aggs, filters, options])
+
+
+class LRUCache(object):
+    """
+    In-process cache with a maximum number of entries, evicting the least
+    recently used ones, and a time to live for each entry.
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, timer=time.time):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return None
+
+            if expires < self.timer():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.timer() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache(object):
+    """
+    Cache shared by the processes of a host, keeping one JSON file per entry
+    in the given directory.
+
+    The files are swept at most once every ``sweep_interval`` seconds, or
+    after ``max_entries`` writes of this process: the expired entries are
+    removed, then the oldest ones until at most ``max_entries`` are left.
+    """
+
+    def __init__(
+        self, path, ttl=CACHE_TTL, max_entries=CACHE_DIR_SIZE,
+        sweep_interval=None, timer=time.time
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.sweep_interval = ttl if sweep_interval is None else sweep_interval
+        self.timer = timer
+        self.sweeps = 0
+        self.evictions = 0
+        self._writes = 0
+        self._swept_at = timer()
+        self._lock = threading.Lock()
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+    def _filename(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.json')
+
+    def get(self, key):
+        filename = self._filename(key)
+
+        try:
+            with open(filename, 'r') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if entry['expires'] < self.timer():
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+            return None
+
+        return entry['value']
+
+    def set(self, key, value):
+        entry = {'expires': self.timer() + self.ttl, 'value': value}
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, self._filename(key))
+
+        with self._lock:
+            self._writes += 1
+            due = (
+                self._writes >= self.max_entries or
+                self.timer() - self._swept_at >= self.sweep_interval
+            )
+            if due:
+                self._writes = 0
+                self._swept_at = self.timer()
+
+        if due:
+            self.sweep()
+
+    def _remove(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            return 0
+
+        return 1
+
+    def sweep(self):
+        """
+        Remove the expired entries, and the oldest ones beyond max_entries,
+        returning the number of files removed. The files are written once,
+        so their modification time tells when they expire.
+        """
+        expired_at = self.timer() - self.ttl
+        entries = []
+        removed = 0
+
+        for filename in os.listdir(self.path):
+            path = os.path.join(self.path, filename)
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+
+            if mtime < expired_at:
+                removed += self._remove(path)
+            elif filename.endswith('.json'):
+                entries.append((mtime, path))
+
+        if len(entries) > self.max_entries:
+            entries.sort()
+            for mtime, path in entries[:len(entries) - self.max_entries]:
+                removed += self._remove(path)
+
+        with self._lock:
+            self.sweeps += 1
+            self.evictions += removed
+
+        return removed
+
+    def clear(self):
+        for filename in os.listdir(self.path):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                os.remove(os.path.join(self.path, filename))
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'sweeps': self.sweeps,
+            'evictions': self.evictions
+        }
+
+
+class ResponseCache(object):
+    """
+    Cache of aggregation responses. Entries are looked up in the in-process
+    LRU cache and then in the optional shared backend, which is used to share
+    warm entries between the workers of the same host.
+
+    The generation of the index is checked at most once every
+    ``poll_interval`` seconds, when it changes the in-process entries are
+    dropped. The generation is part of the keys, so stale entries of the
+    shared backend are never read.
+    """
+
+    def __init__(
+        self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, shared=None,
+        poll_interval=GENERATION_POLL_INTERVAL, timer=time.time
+    ):
+        self.local = LRUCache(maxsize=maxsize, ttl=ttl, timer=timer)
+        self.shared = shared
+        self.poll_interval = poll_interval
+        self.timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def generation_due(self):
+        """
+        Tell whether the generation of the index must be checked again, at
+        most once every poll interval.
+        """
+        now = self.timer()
+
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < self.poll_interval:
+                return False
+            self._checked_at = now
+
+        return True
+
+    def update_generation(self, generation):
+        """
+        Record the current generation of the index, dropping the in-process
+        entries when it changed. None means the generation is not available
+        and keeps the last one.
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                if self.generation is not None:
+                    logger.info(
+                        'Index generation changed from %s to %s, dropping cached responses',
+                        self.generation, generation
+                    )
+                    self.local.clear()
+                    self.invalidations += 1
+                self.generation = generation
+
+        return self.generation
+
+    def check_generation(self, fetch):
+        """
+        Return the current generation of the index, calling ``fetch`` when
+        the last check is older than the poll interval.
+        """
+        if not self.generation_due():
+            return self.generation
+
+        return self.update_generation(fetch())
+
+    def get(self, key):
+        value = self.local.get(key)
+
+        if value is None and self.shared:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if value is None:
+            return None
+
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        self.local.set(key, value)
+        if self.shared:
+            self.shared.set(key, value)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared:
+            self.shared.clear()
+
+    def stats(self):
+        data = {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'size': len(self.local)
+        }
+
+        if self.shared:
+            data['shared'] = self.shared.stats()
+
+        return data
+
+
+class _Flight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiting = 0
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    Runs a single call at a time for each key, the calls made with the same
+    key while it runs wait for it and share its result, or its exception.
+
+    The callers waiting receive copies of the result, so they can change it
+    as the caller that ran it does.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self._lock:
+            flight = self._flights.get(key, None)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                self.executed += 1
+                leader = True
+            else:
+                flight.waiting += 1
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                waiting = flight.waiting
+            flight.done.set()
+
+        if waiting:
+            return copy.deepcopy(flight.result)
+
+        return flight.result
+
+    def stats(self):
+        total = self.executed + self.coalesced
+
+        return {
+            'in_flight': len(self._flights),
+            'executed': self.executed,
+            'coalesced': self.coalesced,
+            'coalesced_rate': float(self.coalesced) / total if total else 0.0
+        }
+
+
+def cache_from_env():
+    """
+    Build the response cache from the PUBLICATIONSTATS_CACHE_* environment
+    variables, a size of 0 disables the cache.
+    """
+    if CACHE_SIZE <= 0:
+        return None
+
+    shared = FileCache(
+        CACHE_DIR, ttl=CACHE_TTL, max_entries=CACHE_DIR_SIZE
+    ) if CACHE_DIR else None
+
+    return ResponseCache(maxsize=CACHE_SIZE, ttl=CACHE_TTL, shared=shared)
@@ -1,12 +1,16 @@
 # coding: utf-8
+import json
 import os
 import logging
 import sys
+import threading
+import time
 
 import elasticsearch
 from elasticsearch import Elasticsearch
 
 from publication import utils
+from publication.cache import cache_key, SingleFlight, GENERATION_POLL_INTERVAL
 
 ALLOWED_DOC_TYPES_N_FACETS = {
     'journal': [
@@ -28,24 +32,96 @@ ALLOWED_DOC_TYPES_N_FACETS = {
 }
 
 
-def construct_aggs(aggs, size=0):
+BUCKET_SIZE = int(os.environ.get('PUBLICATIONSTATS_BUCKET_SIZE', 1000))
+MAX_BUCKET_SIZE = int(os.environ.get('PUBLICATIONSTATS_MAX_BUCKET_SIZE', 10000))
+
+# Bucket size per facet, given as facet:size pairs separated by commas, like
+# PUBLICATIONSTATS_FACET_BUCKET_SIZE=issn:5000,aff_countries:300
+FACET_BUCKET_SIZE = {
+    'issn': 5000,
+}
+FACET_BUCKET_SIZE.update({
+    item.split(':')[0].strip(): int(item.split(':')[1])
+    for item in os.environ.get('PUBLICATIONSTATS_FACET_BUCKET_SIZE', '').split(',')
+    if ':' in item
+})
+
+OTHER_BUCKET = 'other'
+
+# Maximum number of connections kept alive to each ElasticSearch host.
+POOL_SIZE = int(os.environ.get('ELASTICSEARCH_POOL_SIZE', 10))
+
+# Backend answering the aggregations: elasticsearch, local, the snapshot of
+# PUBLICATIONSTATS_SNAPSHOT (see publication.local), or fallback,
+# ElasticSearch and the snapshot when it fails.
+ELASTICSEARCH_BACKEND = 'elasticsearch'
+LOCAL_BACKEND = 'local'
+FALLBACK_BACKEND = 'fallback'
+BACKENDS = (ELASTICSEARCH_BACKEND, LOCAL_BACKEND, FALLBACK_BACKEND)
+BACKEND = os.environ.get('PUBLICATIONSTATS_BACKEND', ELASTICSEARCH_BACKEND)
+SNAPSHOT = os.environ.get('PUBLICATIONSTATS_SNAPSHOT', None)
+
+# Rollup file written by the loader, answering the aggregations it covers
+# while it is the one of the current generation, see publication.rollup.
+ROLLUP = os.environ.get('PUBLICATIONSTATS_ROLLUP', None)
+
+_shared_stats = {}
+_shared_lock = threading.Lock()
+
+
+def bucket_size(field):
+
+    return FACET_BUCKET_SIZE.get(field, BUCKET_SIZE)
+
+
+def after_regex(key):
+    """
+    Lucene regular expression matching the terms sorted after the given key,
+    used as the cursor of paginated aggregations.
+    """
+
+    def escape(text):
+        return ''.join(['\\' + i for i in text])
+
+    last = chr(0x10FFFF)
+    options = [escape(key) + '.+']
+    for ndx, char in enumerate(key):
+        if char == last:
+            continue
+        options.append('%s[%s-%s].*' % (
+            escape(key[:ndx]), escape(chr(ord(char) + 1)), escape(last)))
+
+    return '|'.join(options)
+
+
+def terms(field, size=None):
+
+    return {
+        "terms": {
+            "field": field,
+            "size": size or bucket_size(field)
+        }
+    }
+
+
+def construct_aggs(aggs, size=None, paginate=False, after=None):
     """
     Construct the ElasticSearch aggretions query according to a list of
     parameters that must be aggregated.
+
+    size: number of buckets of the first aggregation, the nested ones use the
+        bucket size configured for the facet.
+    paginate: sort the buckets of the first aggregation by key, so they can
+        be retrieved in pages.
+    after: retrieve the buckets of the first aggregation sorted after this
+        key.
     """
 
     data = {}
     point = None
 
-    def join(field, point=None, size=0):
-        default = {
-            field: {
-                "terms": {
-                    "field": field,
-                    "size": size
-                }
-            }
-        }
+    def join(field, point=None, size=None):
+        default = {field: terms(field, size)}
 
         if point:
             point.setdefault('aggs', default)
@@ -54,8 +130,200 @@ def construct_aggs(aggs, size=0):
             data.setdefault('aggs', default)
             return data['aggs'][field]
 
-    for item in aggs:
-        point = join(item, point=point, size=size)
+    for ndx, item in enumerate(aggs):
+        point = join(item, point=point, size=size if ndx == 0 else None)
+
+    if aggs and paginate:
+        first = data['aggs'][aggs[0]]['terms']
+        first['order'] = {'_term': 'asc'}
+        if after:
+            first['include'] = after_regex(after)
+
+    return data
+
+
+def construct_facets(facets, size=None):
+    """
+    Construct the ElasticSearch sibling aggregations query according to a
+    list of independent facets.
+    """
+
+    data = {'aggs': {}}
+
+    for item in facets:
+        data['aggs'][item] = terms(item, size)
+
+    return data
+
+
+def add_other_bucket(data):
+    """
+    Append to every list of buckets an "other" bucket counting the documents
+    left out of it.
+    """
+
+    for value in data.values():
+        if not isinstance(value, dict) or 'buckets' not in value:
+            continue
+
+        for bucket in value['buckets']:
+            add_other_bucket(bucket)
+
+        other = value.get('sum_other_doc_count', 0)
+        if other:
+            value['buckets'].append({'key': OTHER_BUCKET, 'doc_count': other})
+
+    return data
+
+
+def check_aggs(doc_type, aggs):
+
+    if not aggs:
+        raise ValueError(
+            u'Aggregation not allowed, %s, expected %s' % (
+                str(aggs),
+                str(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
+            )
+        )
+
+    if doc_type not in ALLOWED_DOC_TYPES_N_FACETS.keys():
+        raise ValueError(
+            u'DocumentType not allowed, %s, expected %s' % (
+                doc_type,
+                str(ALLOWED_DOC_TYPES_N_FACETS.keys())
+            )
+        )
+
+    for agg in aggs:
+        if agg not in ALLOWED_DOC_TYPES_N_FACETS[doc_type]:
+            raise ValueError(
+                u'Aggregation not allowed, %s, expected %s' % (
+                    aggs,
+                    str(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
+                )
+            )
+
+
+def check_size(size):
+
+    if size is None:
+        return
+
+    if not isinstance(size, int) or not 0 < size <= MAX_BUCKET_SIZE:
+        raise ValueError(
+            u'Size not allowed, %s, expected an integer from 1 to %d' % (
+                str(size),
+                MAX_BUCKET_SIZE
+            )
+        )
+
+
+def query_body(doc_type, aggs_query, filters=None):
+    """
+    Construct the ElasticSearch query body of an aggregation restricted by
+    exact term filters.
+    """
+
+    body = {
+        "size": 0,
+        "query": {
+            "match_all": {}
+        }
+    }
+
+    body.update(aggs_query)
+
+    if filters:
+        must_terms = []
+        for param, value in filters.items():
+            if param not in ALLOWED_DOC_TYPES_N_FACETS[doc_type]:
+                raise ValueError(
+                    u'Filter not allowed, %s expected %s' % (
+                        param,
+                        str(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
+                    )
+                )
+            must_terms.append({'term': {param: value}})
+
+        body['query'] = {
+            "bool": {
+                "must": must_terms
+            }
+        }
+
+    return body
+
+
+def stats_request(
+    doc_type, aggs, filters=None, size=None, paginate=False, after=None
+):
+    """
+    Validate the parameters of a nested aggregation and return the request
+    to be sent to ElasticSearch.
+    """
+
+    check_aggs(doc_type, aggs)
+    check_size(size)
+    paginate = paginate or after is not None
+
+    return {
+        'doc_type': doc_type,
+        'kind': 'stats',
+        'aggs': aggs,
+        'filters': filters,
+        'options': {'size': size, 'paginate': paginate, 'after': after},
+        'body': query_body(
+            doc_type,
+            construct_aggs(aggs, size=size, paginate=paginate, after=after),
+            filters
+        )
+    }
+
+
+def facets_request(doc_type, facets, filters=None, size=None):
+    """
+    Validate the parameters of independent aggregations and return the
+    request to be sent to ElasticSearch.
+    """
+
+    check_aggs(doc_type, facets)
+    check_size(size)
+
+    return {
+        'doc_type': doc_type,
+        'kind': 'facets',
+        'aggs': facets,
+        'filters': filters,
+        'options': {'size': size},
+        'body': query_body(
+            doc_type, construct_facets(facets, size=size), filters)
+    }
+
+
+def request_cache_key(request, generation=None):
+
+    return cache_key(
+        request['doc_type'], request['aggs'], request['filters'], generation,
+        request['kind'], request['options']
+    )
+
+
+def aggregation_response(request, data, other=False):
+    """
+    Add the pagination cursor and the "other" buckets to the aggregations
+    returned by ElasticSearch.
+    """
+
+    if request['options'].get('paginate'):
+        first_agg = request['aggs'][0]
+        first = data[first_agg]
+        buckets = first['buckets']
+        size = request['options']['size'] or bucket_size(first_agg)
+        full_page = len(buckets) >= size
+        first['after_key'] = buckets[-1]['key'] if buckets and full_page else None
+
+    if other:
+        add_other_bucket(data)
 
     return data
 
@@ -66,10 +334,52 @@ def stats(*args, **kwargs):
         kwargs['hosts'] = ['esd.scielo.org']
 
     kwargs['timeout'] = kwargs.get('timeout', 60)
+    kwargs['maxsize'] = kwargs.get('maxsize', POOL_SIZE)
+    kwargs['retry_on_timeout'] = kwargs.get('retry_on_timeout', True)
+    kwargs['backend'] = kwargs.get('backend', BACKEND)
+
+    if kwargs['backend'] != ELASTICSEARCH_BACKEND and kwargs.get('local', None) is None:
+        if not SNAPSHOT:
+            raise ValueError(
+                u'Backend %s requires PUBLICATIONSTATS_SNAPSHOT' % kwargs['backend'])
+
+        # Imported here, the local backend uses the helpers of this module.
+        from publication.local import SnapshotFile
+        kwargs['local'] = SnapshotFile(SNAPSHOT)
+
+    if ROLLUP and kwargs.get('rollup', None) is None:
+        # Imported here, the rollup uses the helpers of this module.
+        from publication.rollup import RollupFile
+        kwargs['rollup'] = RollupFile(ROLLUP)
 
     return Stats(*args, **kwargs)
 
 
+def shared_stats(*args, **kwargs):
+    """
+    Return the Stats client of the current process for the given arguments,
+    creating it on the first call, so every request of a worker reuses the
+    same connection pool.
+
+    The clients are kept by process id, workers forked after the first call
+    create their own clients instead of sharing the sockets of the parent.
+    """
+    pid = os.getpid()
+    key = json.dumps([args, kwargs], sort_keys=True, default=repr)
+
+    with _shared_lock:
+        if pid not in _shared_stats:
+            _shared_stats.clear()
+            _shared_stats[pid] = {}
+
+        clients = _shared_stats[pid]
+        client = clients.get(key, None)
+        if client is None:
+            client = clients[key] = stats(*args, **kwargs)
+
+    return client
+
+
 class ServerError(Exception):
 
     def __init__(self, value):
@@ -81,6 +391,24 @@ class ServerError(Exception):
 
 class Stats(Elasticsearch):
 
+    def __init__(self, *args, **kwargs):
+        self.cache = kwargs.pop('cache', None)
+        self.backend = kwargs.pop('backend', ELASTICSEARCH_BACKEND)
+        self.local = kwargs.pop('local', None)
+        self.rollup = kwargs.pop('rollup', None)
+        self.flights = SingleFlight()
+        self._generation = None
+        self._generation_checked_at = None
+
+        if self.backend not in BACKENDS:
+            raise ValueError(
+                u'Backend not allowed, %s, expected %s' % (self.backend, str(BACKENDS)))
+
+        if self.backend != ELASTICSEARCH_BACKEND and self.local is None:
+            raise ValueError(u'Backend %s requires a local index' % self.backend)
+
+        super(Stats, self).__init__(*args, **kwargs)
+
     def _query_dispatcher(self, *args, **kwargs):
 
         try:
@@ -100,6 +428,96 @@ class Stats(Elasticsearch):
 
         return data
 
+    def pool_stats(self):
+        """
+        Connection reuse metrics of the HTTP connection pools, the number of
+        connections opened against the number of requests sent through them.
+        """
+        connections = 0
+        requests = 0
+        for connection in self.transport.connection_pool.connections:
+            pool = getattr(connection, 'pool', None)
+            connections += getattr(pool, 'num_connections', 0)
+            requests += getattr(pool, 'num_requests', 0)
+
+        return {
+            'hosts': len(self.transport.connection_pool.connections),
+            'connections': connections,
+            'requests': requests,
+            'reused': max(requests - connections, 0)
+        }
+
+    def health(self):
+        """
+        Check the ElasticSearch cluster and report the connection pool and
+        cache metrics of this worker.
+        """
+        try:
+            available = self.ping()
+        except elasticsearch.TransportError:
+            available = False
+
+        data = {
+            'elasticsearch': 'available' if available else 'unavailable',
+            'backend': self.backend,
+            'pid': os.getpid(),
+            'pool': self.pool_stats()
+        }
+
+        if self.local:
+            data['snapshot'] = self.local.stats()
+
+        if self.rollup:
+            data['rollup'] = self.rollup.stats()
+
+        data['coalescing'] = self.flights.stats()
+
+        if self.cache:
+            data['cache'] = self.cache.stats()
+
+        return data
+
+    def index_generation(self):
+        """
+        Return the generation published by the loader at the end of the last
+        load, or None when it is not available.
+        """
+        try:
+            data = self.get(
+                index=utils.ELASTICSEARCH_INDEX,
+                doc_type=utils.GENERATION_DOC_TYPE,
+                id=utils.GENERATION_ID
+            )
+        except elasticsearch.NotFoundError:
+            return None
+        except elasticsearch.TransportError as e:
+            logging.warning('Fail to retrieve index generation: %s', e)
+            return None
+
+        return data['_source'].get('generation', None)
+
+    def current_generation(self):
+        """
+        Generation of the data answering the requests, the one of the local
+        snapshot or the one of the index, checked at most once every poll
+        interval.
+        """
+        if self.backend == LOCAL_BACKEND:
+            return self.local.generation
+
+        if self.cache:
+            return self.cache.check_generation(self.index_generation)
+
+        now = time.time()
+        checked_at = self._generation_checked_at
+        if checked_at is None or now - checked_at >= GENERATION_POLL_INTERVAL:
+            self._generation_checked_at = now
+            generation = self.index_generation()
+            if generation is not None:
+                self._generation = generation
+
+        return self._generation
+
     def publication_search(self, parameters):
 
         parameters['index'] = utils.ELASTICSEARCH_INDEX
@@ -107,66 +525,98 @@ class Stats(Elasticsearch):
 
         return query_result
 
-    def publication_stats(self, doc_type, aggs, filters=None):
+    def _aggregate(self, request):
+        """
+        Run an aggregation request, answering from the cache when possible.
 
-        if not aggs:
-            raise ValueError(
-                u'Aggregation not allowed, %s, expected %s' % (
-                    str(aggs),
-                    str(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
-                )
-            )
+        Identical requests running at the same time in this process share a
+        single run and its result.
+        """
 
-        if doc_type not in ALLOWED_DOC_TYPES_N_FACETS.keys():
-            raise ValueError(
-                u'DocumentType not allowed, %s, expected %s' % (
-                    doc_type,
-                    str(ALLOWED_DOC_TYPES_N_FACETS.keys())
-                )
-            )
+        generation = None
+        if self.cache or self.rollup:
+            generation = self.current_generation()
 
-        for agg in aggs:
-            if agg not in ALLOWED_DOC_TYPES_N_FACETS[doc_type]:
-                raise ValueError(
-                    u'Aggregation not allowed, %s, expected %s' % (
-                        aggs,
-                        str(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
-                    )
-                )
+        key = request_cache_key(request, generation)
 
-        body = {
-            "query": {
-                "match_all": {}
-            }
-        }
+        if self.cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
 
-        body.update(construct_aggs(aggs))
-
-        if filters:
-            must_terms = []
-            for param, value in filters.items():
-                if param not in ALLOWED_DOC_TYPES_N_FACETS[doc_type]:
-                    raise ValueError(
-                        u'Filter not allowed, %s expected %s' % (
-                            param,
-                            str(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
-                        )
-                    )
-                must_terms.append({'term': {param: value}})
+        return self.flights.do(
+            key, lambda: self._run_aggregation(request, key, generation))
 
-            body['query'] = {
-                "bool": {
-                    "must": must_terms
-                }
-            }
+    def _run_aggregation(self, request, key, generation=None):
+
+        # The rollup only answers for the generation it was built from, an
+        # unknown generation may be a newer one.
+        response = None
+        if self.rollup and generation is not None:
+            response = self.rollup.aggregate(request, generation)
+
+        if response is None:
+            try:
+                response = self._backend_aggregate(request)
+            except ServerError:
+                if self.backend != FALLBACK_BACKEND:
+                    raise
+                # Not cached, the snapshot is not the generation of the key.
+                logging.warning('Answering from the local snapshot, ElasticSearch failed')
+                return self.local.aggregate(request)
+
+        if self.cache:
+            self.cache.set(key, response)
+
+        return response
+
+    def _backend_aggregate(self, request):
+        """
+        Run an aggregation request in the configured backend.
+        """
+
+        if self.backend == LOCAL_BACKEND:
+            return self.local.aggregate(request)
 
         query_result = self._query_dispatcher(
             index=utils.ELASTICSEARCH_INDEX,
-            doc_type=doc_type,
-            search_type='count',
-            body=body
+            doc_type=request['doc_type'],
+            body=request['body']
         )
 
-        response = query_result['aggregations']
+        return query_result['aggregations']
+
+    def publication_stats(
+        self, doc_type, aggs, filters=None, size=None, paginate=False,
+        after=None, other=False
+    ):
+        """
+        Nested aggregations, each aggregation is computed inside the buckets
+        of the previous one.
+
+        size: number of buckets of the first aggregation, defaults to the
+            bucket size configured for the facet.
+        paginate: sort the buckets of the first aggregation by key and
+            include in it the after_key of the next page, None in the last
+            one.
+        after: after_key of the previous page.
+        other: add an "other" bucket counting the documents left out of each
+            list of buckets.
+        """
+
+        request = stats_request(
+            doc_type, aggs, filters=filters, size=size, paginate=paginate,
+            after=after
+        )
 
-        return response
+        return aggregation_response(request, self._aggregate(request), other)
+
+    def publication_facets(self, doc_type, facets, filters=None, size=None, other=False):
+        """
+        Independent aggregations computed with the same filters in a single
+        query, returning the buckets of each facet by its name.
+        """
+
+        request = facets_request(doc_type, facets, filters=filters, size=size)
+
+        return aggregation_response(request, self._aggregate(request), other)
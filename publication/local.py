@@ -0,0 +1,413 @@
+# coding: utf-8
+"""
+Local aggregation backend of publication.controller.Stats.
+
+The facets of the documents loaded into ElasticSearch are kept in memory as
+an inverted index, built from the CSV export of the loader (see
+processing.export) and saved as a snapshot file. The allowed terms
+aggregations are answered from it with the same JSON shape returned by
+ElasticSearch.
+"""
+import argparse
+import csv
+import glob
+import gzip
+import logging
+import os
+import pickle
+import tempfile
+import threading
+from array import array
+from datetime import datetime
+
+from publication.controller import (
+    ALLOWED_DOC_TYPES_N_FACETS, bucket_size
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+# Separator of the values of the multivalued columns of the CSV export, the
+# one of processing.export.
+SEPARATOR = '|'
+
+
+class SnapshotBuilder(object):
+    """
+    Collects the facets of the documents of each doc_type, the values of a
+    facet are numbered and every document keeps the tuple of the numbers of
+    its values.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self._ids = {}
+        self._tuples = {}
+
+    def _doc_type(self, doc_type):
+        if doc_type not in self.data:
+            facets = ALLOWED_DOC_TYPES_N_FACETS[doc_type]
+            self.data[doc_type] = {
+                'count': 0,
+                'values': {i: [] for i in facets},
+                'columns': {i: [] for i in facets},
+                'postings': {i: [] for i in facets}
+            }
+            self._ids[doc_type] = {i: {} for i in facets}
+
+        return self.data[doc_type]
+
+    def add(self, doc_type, document):
+        """
+        document: formatted document, or a row of the CSV export with the
+            multivalued fields already split.
+        """
+        data = self._doc_type(doc_type)
+        ordinal = data['count']
+        data['count'] += 1
+
+        for facet, ids in self._ids[doc_type].items():
+            values = document.get(facet, None)
+            if values is None or values == '':
+                values = []
+            elif not isinstance(values, (list, tuple, set)):
+                values = [values]
+
+            numbers = []
+            for value in values:
+                value = str(value)
+                number = ids.get(value, None)
+                if number is None:
+                    number = ids[value] = len(data['values'][facet])
+                    data['values'][facet].append(value)
+                    data['postings'][facet].append(array('I'))
+                if number not in numbers:
+                    numbers.append(number)
+                    data['postings'][facet][number].append(ordinal)
+
+            numbers = tuple(numbers)
+            data['columns'][facet].append(self._tuples.setdefault(numbers, numbers))
+
+    def add_export(self, directory):
+        """
+        Add the documents of a CSV export directory.
+
+        Every load exports its own parts, so a document exported by several
+        loads is added once, from the row with the latest processing_date,
+        the latest part written when they are the same.
+        """
+        for doc_type in ALLOWED_DOC_TYPES_N_FACETS:
+            facets = ALLOWED_DOC_TYPES_N_FACETS[doc_type]
+            pattern = os.path.join(directory, doc_type, '*', '*', '*.csv.gz')
+            latest = {}
+
+            for path in sorted(glob.glob(pattern), key=os.path.getmtime):
+                logger.info('Reading %s', path)
+                with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+                    for row in csv.DictReader(f):
+                        processing_date = row.get('processing_date') or ''
+                        current = latest.get(row['id'], None)
+                        if current is not None and current[0] > processing_date:
+                            continue
+                        latest[row['id']] = (processing_date, {
+                            i: row[i].split(SEPARATOR) if row.get(i) else []
+                            for i in facets
+                        })
+
+            for processing_date, document in latest.values():
+                self.add(doc_type, document)
+
+    def snapshot(self, generation=None):
+        return LocalIndex(
+            self.data, generation or datetime.now().isoformat())
+
+
+def write_pickle(content, path):
+    """
+    Write the content to the path, replacing it at once.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def write_snapshot(snapshot, path):
+    write_pickle(
+        (SNAPSHOT_VERSION, snapshot.generation, snapshot.data), path)
+
+
+def read_snapshot(path):
+    with open(path, 'rb') as f:
+        version, generation, data = pickle.load(f)
+
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(
+            'Snapshot %s version %s, expected %s' % (path, version, SNAPSHOT_VERSION))
+
+    logger.info('Snapshot %s of generation %s loaded', path, generation)
+
+    return LocalIndex(data, generation)
+
+
+class FileContent(object):
+    """
+    Content of a file returned by ``read``, read again when the modification
+    time of the file changes. The content read before is kept while the file
+    is missing or fails to be read.
+    """
+
+    def __init__(self, path, read):
+        self.path = path
+        self.read = read
+        self.content = None
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        """
+        The content of the file, read again when it was changed.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return self.content
+
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    try:
+                        self.content = self.read(self.path)
+                    except Exception as e:
+                        logger.error('Fail to read %s: %s', self.path, e)
+                    self._mtime = mtime
+
+        return self.content
+
+
+class SnapshotFile(FileContent):
+    """
+    LocalIndex of a snapshot file, read again when publicationstats_snapshot
+    replaces it, so the workers serve the new snapshot without restarting.
+    """
+
+    def __init__(self, path):
+        super(SnapshotFile, self).__init__(path, read_snapshot)
+
+        if self.current() is None:
+            raise ValueError('Snapshot %s can not be read' % path)
+
+    @property
+    def generation(self):
+        return self.current().generation
+
+    def stats(self):
+        return self.current().stats()
+
+    def aggregate(self, request):
+        return self.current().aggregate(request)
+
+
+def terms_response(buckets, facet, size=None, paginate=False, after=None, nested=None):
+    """
+    Terms aggregation response of the (key, doc_count) pairs, sorted and cut
+    as ElasticSearch does: by doc_count and key, or by key when paginated.
+
+    nested: function returning the aggregations nested in the bucket of a
+        key, if any.
+    """
+    size = size or bucket_size(facet)
+
+    if paginate:
+        buckets = sorted(buckets)
+        if after is not None:
+            buckets = [i for i in buckets if i[0] > after]
+    else:
+        buckets = sorted(buckets, key=lambda i: (-i[1], i[0]))
+
+    result = []
+    for key, count in buckets[:size]:
+        bucket = {'key': key, 'doc_count': count}
+        if nested:
+            bucket.update(nested(key))
+        result.append(bucket)
+
+    return {
+        'doc_count_error_upper_bound': 0,
+        'sum_other_doc_count': sum([i[1] for i in buckets[size:]]),
+        'buckets': result
+    }
+
+
+class LocalIndex(object):
+    """
+    Inverted index of the facets of the documents answering the aggregation
+    requests of publication.controller.
+    """
+
+    def __init__(self, data, generation=None):
+        self.data = data
+        self.generation = generation
+        self._ids = {
+            doc_type: {
+                facet: {value: number for number, value in enumerate(values)}
+                for facet, values in content['values'].items()
+            }
+            for doc_type, content in data.items()
+        }
+
+    def stats(self):
+        return {
+            'generation': self.generation,
+            'documents': {k: v['count'] for k, v in self.data.items()}
+        }
+
+    def _empty(self, doc_type):
+        facets = ALLOWED_DOC_TYPES_N_FACETS[doc_type]
+        return {
+            'count': 0,
+            'values': {i: [] for i in facets},
+            'columns': {i: [] for i in facets},
+            'postings': {i: [] for i in facets}
+        }
+
+    def _filter(self, doc_type, data, filters):
+        """
+        Ordinals of the documents matching all the term filters, None for
+        all the documents.
+        """
+        if not filters:
+            return None
+
+        postings = []
+        for facet, value in filters.items():
+            number = self._ids.get(doc_type, {}).get(facet, {}).get(str(value), None)
+            if number is None:
+                return []
+            postings.append(data['postings'][facet][number])
+
+        postings.sort(key=len)
+        matching = set(postings[0])
+        for posting in postings[1:]:
+            matching.intersection_update(posting)
+
+        return sorted(matching)
+
+    def _groups(self, data, facet, ordinals):
+        """
+        Ordinals of the documents of each value of the facet.
+        """
+        if ordinals is None:
+            return enumerate(data['postings'][facet])
+
+        groups = {}
+        column = data['columns'][facet]
+        for ordinal in ordinals:
+            for number in column[ordinal]:
+                groups.setdefault(number, []).append(ordinal)
+
+        return groups.items()
+
+    def _terms(self, data, aggs, ordinals, size=None, paginate=False, after=None):
+        """
+        Terms aggregation of the first facet of aggs, with the next ones
+        nested in its buckets.
+        """
+        facet = aggs[0]
+        values = data['values'][facet]
+
+        groups = {
+            values[number]: group
+            for number, group in self._groups(data, facet, ordinals) if len(group)
+        }
+
+        nested = None
+        if len(aggs) > 1:
+            nested = lambda key: {aggs[1]: self._terms(data, aggs[1:], groups[key])}
+
+        return terms_response(
+            [(key, len(group)) for key, group in groups.items()], facet,
+            size=size, paginate=paginate, after=after, nested=nested)
+
+    def aggregate(self, request):
+        """
+        Aggregations of a request of controller.stats_request or
+        controller.facets_request, shaped as the ElasticSearch response.
+        """
+        data = self.data.get(request['doc_type'], None)
+        if data is None:
+            data = self._empty(request['doc_type'])
+
+        ordinals = self._filter(request['doc_type'], data, request['filters'])
+        options = request['options']
+
+        if request['kind'] == 'facets':
+            return {
+                facet: self._terms(data, [facet], ordinals, size=options['size'])
+                for facet in request['aggs']
+            }
+
+        aggs = request['aggs']
+        return {
+            aggs[0]: self._terms(
+                data, aggs, ordinals, size=options['size'],
+                paginate=options['paginate'], after=options['after'])
+        }
+
+
+def main():
+
+    parser = argparse.ArgumentParser(
+        description='Build the snapshot of the local aggregation backend from a CSV export of publicationstats_loaddata'
+    )
+
+    parser.add_argument(
+        'export',
+        help='Directory given to publicationstats_loaddata --export'
+    )
+
+    parser.add_argument(
+        'snapshot',
+        help='Snapshot file, set in PUBLICATIONSTATS_SNAPSHOT'
+    )
+
+    parser.add_argument(
+        '--rollup',
+        help='Rollup file of the snapshot, set in PUBLICATIONSTATS_ROLLUP'
+    )
+
+    parser.add_argument(
+        '--dimensions',
+        type=int,
+        help='Maximum number of facets of the rollup cuboids'
+    )
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    builder = SnapshotBuilder()
+    builder.add_export(args.export)
+    snapshot = builder.snapshot()
+    write_snapshot(snapshot, args.snapshot)
+
+    logger.info('Snapshot %s written: %s', args.snapshot, snapshot.stats())
+
+    if args.rollup:
+        # Imported here, the rollup is built from the snapshot.
+        from publication.rollup import build_rollup, write_rollup, DIMENSIONS
+
+        rollup = build_rollup(snapshot, dimensions=args.dimensions or DIMENSIONS)
+        write_rollup(rollup, args.rollup)
+
+        logger.info('Rollup %s written: %d cuboids', args.rollup, len(rollup.cube))
+
+
+if __name__ == '__main__':
+    main()
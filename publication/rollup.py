@@ -0,0 +1,252 @@
+# coding: utf-8
+"""
+Precomputed rollup of the allowed facets.
+
+The aggregations are at most three nested terms aggregations of the allowed
+facets of a doc_type, filtered by exact terms of those same facets, so the
+number of documents of every combination of values of up to ``dimensions``
+facets answers them without reading the documents.
+
+The loader builds the rollup from the index after each load and tags it with
+the generation it published (publicationstats_loaddata --rollup), the API
+only uses it while that generation is the current one.
+"""
+import itertools
+import logging
+import os
+import pickle
+
+from publication.controller import ALLOWED_DOC_TYPES_N_FACETS
+from publication.local import FileContent, terms_response, write_pickle
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_VERSION = 1
+
+# Maximum number of facets of a cuboid, aggregations and filters together.
+DIMENSIONS = int(os.environ.get('PUBLICATIONSTATS_ROLLUP_DIMENSIONS', 3))
+
+# Cuboids with more combinations of values are left out of the rollup, the
+# requests needing them are answered by the backend.
+MAX_CELLS = int(os.environ.get('PUBLICATIONSTATS_ROLLUP_MAX_CELLS', 1000000))
+
+
+def cuboid(data, facets, max_cells=MAX_CELLS):
+    """
+    Number of documents of each combination of values of the facets in the
+    snapshot data of a doc_type, None when there are more than max_cells
+    combinations.
+    """
+    values = [data['values'][i] for i in facets]
+
+    if len(facets) == 1:
+        counts = {(n,): len(p) for n, p in enumerate(data['postings'][facets[0]]) if len(p)}
+    else:
+        columns = [data['columns'][i] for i in facets]
+        counts = {}
+        for ordinal in range(data['count']):
+            for numbers in itertools.product(*[i[ordinal] for i in columns]):
+                counts[numbers] = counts.get(numbers, 0) + 1
+
+            if len(counts) > max_cells:
+                return None
+
+    if len(counts) > max_cells:
+        return None
+
+    return {
+        tuple([v[n] for v, n in zip(values, numbers)]): count
+        for numbers, count in counts.items()
+    }
+
+
+def build_rollup(snapshot, dimensions=DIMENSIONS, max_cells=MAX_CELLS, generation=None):
+    """
+    Rollup of every combination of up to ``dimensions`` allowed facets of the
+    documents of a publication.local snapshot.
+
+    generation: generation of the index the documents were read from,
+        defaults to the one of the snapshot.
+    """
+    cube = {}
+
+    for doc_type, data in snapshot.data.items():
+        facets = sorted(ALLOWED_DOC_TYPES_N_FACETS[doc_type])
+        for size in range(1, dimensions + 1):
+            for combination in itertools.combinations(facets, size):
+                cells = cuboid(data, combination, max_cells=max_cells)
+                if cells is None:
+                    logger.warning(
+                        'Cuboid %s %s skipped, more than %d cells',
+                        doc_type, combination, max_cells)
+                    continue
+                cube[(doc_type, combination)] = cells
+
+    return Rollup(cube, generation or snapshot.generation, dimensions)
+
+
+def write_rollup(rollup, path):
+    write_pickle(
+        (ROLLUP_VERSION, rollup.generation, rollup.dimensions, rollup.cube),
+        path)
+
+
+def read_rollup(path):
+    with open(path, 'rb') as f:
+        version, generation, dimensions, cube = pickle.load(f)
+
+    if version != ROLLUP_VERSION:
+        raise ValueError(
+            'Rollup %s version %s, expected %s' % (path, version, ROLLUP_VERSION))
+
+    logger.info('Rollup %s of generation %s loaded, %d cuboids', path, generation, len(cube))
+
+    return Rollup(cube, generation, dimensions)
+
+
+class Rollup(object):
+    """
+    Cuboids of document counts by doc_type and sorted facets, answering the
+    aggregation requests of publication.controller they cover.
+    """
+
+    def __init__(self, cube, generation=None, dimensions=DIMENSIONS):
+        self.cube = cube
+        self.generation = generation
+        self.dimensions = dimensions
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def stats(self):
+        total = self.hits + self.misses + self.stale
+
+        return {
+            'generation': self.generation,
+            'cuboids': len(self.cube),
+            'hits': self.hits,
+            'misses': self.misses,
+            'stale': self.stale,
+            'hit_rate': float(self.hits) / total if total else 0.0
+        }
+
+    def _counts(self, doc_type, aggs, filters):
+        """
+        Number of documents matching the filters of each combination of
+        values of the aggs, None when the cuboid is not in the rollup.
+        """
+        facets = tuple(sorted(set(aggs) | set(filters)))
+        cells = self.cube.get((doc_type, facets), None)
+        if cells is None:
+            return None
+
+        positions = [facets.index(i) for i in aggs]
+        selection = [(facets.index(k), v) for k, v in filters.items()]
+
+        return {
+            tuple([key[i] for i in positions]): count
+            for key, count in cells.items()
+            if all([key[i] == v for i, v in selection])
+        }
+
+    def _miss(self):
+        self.misses += 1
+        return None
+
+    def aggregate(self, request, generation=None):
+        """
+        Aggregations of a request of controller.stats_request or
+        controller.facets_request, shaped as the ElasticSearch response, or
+        None when the rollup does not cover it.
+
+        generation: current generation of the index, the rollup answers
+            only when it was built from it, not checked when None.
+        """
+        if generation is not None and generation != self.generation:
+            self.stale += 1
+            return None
+
+        doc_type = request['doc_type']
+        aggs = request['aggs']
+        filters = {k: str(v) for k, v in (request['filters'] or {}).items()}
+        options = request['options']
+
+        # The values of a facet aggregated and filtered at the same time
+        # depend on the other values of the same documents.
+        if len(set(aggs)) != len(aggs) or set(aggs) & set(filters):
+            return self._miss()
+
+        if request['kind'] == 'facets':
+            levels = [self._counts(doc_type, [i], filters) for i in aggs]
+            if any([i is None for i in levels]):
+                return self._miss()
+
+            self.hits += 1
+            return {
+                facet: terms_response(
+                    [(key[0], count) for key, count in counts.items()], facet,
+                    size=options['size'])
+                for facet, counts in zip(aggs, levels)
+            }
+
+        levels = [self._counts(doc_type, aggs[:i + 1], filters) for i in range(len(aggs))]
+        if any([i is None for i in levels]):
+            return self._miss()
+
+        # Buckets of each level by the keys of the buckets containing them.
+        children = []
+        for counts in levels:
+            grouped = {}
+            for key, count in counts.items():
+                grouped.setdefault(key[:-1], []).append((key[-1], count))
+            children.append(grouped)
+
+        def response(level, prefix, **kwargs):
+            nested = None
+            if level + 1 < len(aggs):
+                nested = lambda key: {
+                    aggs[level + 1]: response(level + 1, prefix + (key,))}
+
+            return terms_response(
+                children[level].get(prefix, []), aggs[level], nested=nested,
+                **kwargs)
+
+        self.hits += 1
+        return {
+            aggs[0]: response(
+                0, (), size=options['size'], paginate=options['paginate'],
+                after=options['after'])
+        }
+
+
+class RollupFile(FileContent):
+    """
+    Rollup of a file written by the loader, read again when the file changes
+    and the rollup loaded is not the one of the current generation.
+    """
+
+    def __init__(self, path):
+        super(RollupFile, self).__init__(path, read_rollup)
+
+    @property
+    def rollup(self):
+        return self.content
+
+    @property
+    def generation(self):
+        return self.rollup.generation if self.rollup else None
+
+    def stats(self):
+        rollup = self.rollup or self.current()
+
+        return rollup.stats() if rollup else {'generation': None}
+
+    def aggregate(self, request, generation=None):
+        rollup = self.rollup
+        if rollup is None or (generation is not None and generation != rollup.generation):
+            rollup = self.current()
+
+        if rollup is None:
+            return None
+
+        return rollup.aggregate(request, generation)
@@ -40,5 +40,8 @@ service PublicationStats {
     list<aggs> document_languages(1: optional map<string,string> filters) throws (1:ValueError value_err, 2:ServerError server_err),
     list<aggs> document_affiliation_countries(1: optional map<string,string> filters) throws (1:ValueError value_err, 2:ServerError server_err),
     list<aggs> document_types(1: optional map<string,string> filters) throws (1:ValueError value_err, 2:ServerError server_err),
+    map<string, list<aggs>> journal_facets(1: list<string> facets, 2: optional map<string,string> filters) throws (1:ValueError value_err, 2:ServerError server_err),
+    map<string, list<aggs>> document_facets(1: list<string> facets, 2: optional map<string,string> filters) throws (1:ValueError value_err, 2:ServerError server_err),
+    string aggregations(1: string doc_type, 2: list<string> aggs, 3: optional map<string,string> filters, 4: optional i32 size, 5: optional bool paginate, 6: optional string after, 7: optional bool other) throws (1:ValueError value_err, 2:ServerError server_err),
     string search(1:string doc_type, 2: string body, 3: optional list<kwargs> parameters) throws (1:ValueError value_err, 2:ServerError server_err)
 }
\ No newline at end of file
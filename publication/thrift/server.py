@@ -3,7 +3,8 @@ import json
 import logging
 import os
 
-from publication.controller import stats, ServerError
+from publication.controller import shared_stats, ServerError
+from publication.cache import cache_from_env
 
 import thriftpy
 import thriftpywrap
@@ -60,23 +61,46 @@ class Dispatcher(object):
 
         es_params = {
             'hosts': os.environ.get('ELASTICSEARCH', '127.0.0.1:9200'),
-            'timeout': 60
+            'timeout': 60,
+            'cache': cache_from_env()
         }
 
-        self._stats = stats(**es_params)
+        self._stats = shared_stats(**es_params)
 
     def _stats_dispatcher(self, *args, **kwargs):
 
         try:
             data = self._stats.publication_stats(*args, **kwargs)
         except ValueError as e:
-            logging.error(e.message)
-            raise publication_stats_thrift.ValueError(message=e.message)
+            logging.error(str(e))
+            raise publication_stats_thrift.ValueError(message=str(e))
         except ServerError as e:
             raise publication_stats_thrift.ServerError(message=e.message)
 
         return data
 
+    def _facets_dispatcher(self, doc_type, facets, filters=None):
+
+        try:
+            data = self._stats.publication_facets(doc_type, facets, filters=filters)
+        except ValueError as e:
+            logging.error(str(e))
+            raise publication_stats_thrift.ValueError(message=str(e))
+        except ServerError as e:
+            raise publication_stats_thrift.ServerError(message=e.message)
+
+        try:
+            result = {
+                facet: [publication_stats_thrift.aggs(key=item['key'], count=item['doc_count']) for item in data[facet]['buckets']]
+                for facet in facets
+            }
+        except:
+            raise publication_stats_thrift.ServerError(
+                'Fail to retrieve data from server'
+            )
+
+        return result
+
     def search(self, doc_type, body, parameters):
 
         params = {i.key: i.value for i in parameters}
@@ -256,5 +280,25 @@ class Dispatcher(object):
 
         return result
 
+    def aggregations(
+        self, doc_type, aggs, filters=None, size=None, paginate=False,
+        after=None, other=False
+    ):
+
+        data = self._stats_dispatcher(
+            doc_type, aggs=aggs, filters=filters, size=size,
+            paginate=bool(paginate), after=after, other=bool(other)
+        )
+
+        return json.dumps(data)
+
+    def journal_facets(self, facets, filters=None):
+
+        return self._facets_dispatcher('journal', facets, filters=filters)
+
+    def document_facets(self, facets, filters=None):
+
+        return self._facets_dispatcher('article', facets, filters=filters)
+
 
 main = thriftpywrap.ConsoleApp(publication_stats_thrift.PublicationStats, Dispatcher)
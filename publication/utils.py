@@ -11,6 +11,11 @@ TAG_RE = re.compile(r'<[^>]+>')
 
 ELASTICSEARCH_INDEX = os.environ.get('ELASTICSEARCH_INDEX', 'publication')
 
+# Document published by the loader at the end of each load, identifying the
+# current generation of the index data.
+GENERATION_DOC_TYPE = 'generation'
+GENERATION_ID = 'current'
+
 
 def remove_tags(text):
     return TAG_RE.sub('', text)
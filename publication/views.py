@@ -6,18 +6,16 @@ import pyramid.httpexceptions as exc
 def index(request):
     return Response('Publication Stats API by SciELO')
 
-@view_config(route_name='journals', request_method='GET', renderer='jsonp')
-def journals_collection(request):
-    collection = request.GET.get('collection', None)
-    issn = request.GET.get('issn', None)
-    subject_area = request.GET.get('subject_area', None)
-    aggs = request.GET.get('aggs', None)
 
-    if not aggs:
-        raise exc.HTTPBadRequest("aggs parameter is required")
+@view_config(route_name='health', request_method='GET', renderer='jsonp')
+def health(request):
+    return request.index.health()
 
-    if len(aggs.split(',')) > 3:
-        raise exc.HTTPBadRequest("max aggregations allowed is 3, you are must doing something wrong if you are trying to use more than 2 aggregations")
+
+def journal_filters(params):
+    collection = params.get('collection', None)
+    issn = params.get('issn', None)
+    subject_area = params.get('subject_area', None)
 
     filters = {}
     if collection:
@@ -27,30 +25,17 @@ def journals_collection(request):
     if subject_area:
         filters['subject_areas'] = subject_area
 
-    try:
-        data = request.index.publication_stats(doc_type='journal', filters=filters, aggs=aggs.split(','))
-    except ValueError as error:
-        raise exc.HTTPBadRequest(error.message)
+    return filters
 
-    return data
-
-@view_config(route_name='documents', request_method='GET', renderer='jsonp')
-def documents_collection(request):
-
-    collection = request.GET.get('collection', None)
-    issn = request.GET.get('issn', None)
-    subject_area = request.GET.get('subject_area', None)
-    affiliation_country = request.GET.get('affiliation_country', None)
-    publication_year = request.GET.get('publication_year', None)
-    document_type = request.GET.get('document_type', None)
-    language = request.GET.get('language', None)
-    aggs = request.GET.get('aggs', None)
-
-    if not aggs:
-        raise exc.HTTPBadRequest("aggs parameter is required")
 
-    if len(aggs.split(',')) > 3:
-        raise exc.HTTPBadRequest("max aggregations allowed is 3, you are must doing something wrong if you are trying to use more than 2 aggregations")
+def document_filters(params):
+    collection = params.get('collection', None)
+    issn = params.get('issn', None)
+    subject_area = params.get('subject_area', None)
+    affiliation_country = params.get('affiliation_country', None)
+    publication_year = params.get('publication_year', None)
+    document_type = params.get('document_type', None)
+    language = params.get('language', None)
 
     filters = {}
     if collection:
@@ -68,9 +53,113 @@ def documents_collection(request):
     if language:
         filters['languages'] = language
 
+    return filters
+
+
+def aggregation_options(params):
+    """
+    Bucket size, pagination and "other" bucket parameters of the stats
+    endpoints.
+    """
+    size = params.get('size', None)
+    after = params.get('after', None)
+    paginate = params.get('paginate', 'false').lower() == 'true'
+    other = params.get('other', 'false').lower() == 'true'
+
+    options = {'other': other}
+
+    if size:
+        try:
+            options['size'] = int(size)
+        except ValueError:
+            raise exc.HTTPBadRequest("size parameter must be an integer")
+
+    if paginate or after:
+        options['paginate'] = True
+        options['after'] = after or None
+
+    return options
+
+
+def stats_arguments(params, filters):
+    """
+    Arguments of publication_stats from the query string parameters.
+    """
+    aggs = params.get('aggs', None)
+
+    if not aggs:
+        raise exc.HTTPBadRequest("aggs parameter is required")
+
+    if len(aggs.split(',')) > 3:
+        raise exc.HTTPBadRequest("max aggregations allowed is 3, you are must doing something wrong if you are trying to use more than 2 aggregations")
+
+    arguments = aggregation_options(params)
+    arguments['aggs'] = aggs.split(',')
+    arguments['filters'] = filters
+
+    return arguments
+
+
+def facets_arguments(params, filters):
+    """
+    Arguments of publication_facets from the query string parameters.
+    """
+    facets = params.get('facets', None)
+
+    if not facets:
+        raise exc.HTTPBadRequest("facets parameter is required")
+
+    arguments = aggregation_options(params)
+    arguments.pop('paginate', None)
+    arguments.pop('after', None)
+    arguments['facets'] = facets.split(',')
+    arguments['filters'] = filters
+
+    return arguments
+
+
+@view_config(route_name='journals', request_method='GET', renderer='jsonp')
+def journals_collection(request):
+    arguments = stats_arguments(request.GET, journal_filters(request.GET))
+
+    try:
+        data = request.index.publication_stats(doc_type='journal', **arguments)
+    except ValueError as error:
+        raise exc.HTTPBadRequest(str(error))
+
+    return data
+
+@view_config(route_name='documents', request_method='GET', renderer='jsonp')
+def documents_collection(request):
+    arguments = stats_arguments(request.GET, document_filters(request.GET))
+
+    try:
+        data = request.index.publication_stats(doc_type='article', **arguments)
+    except ValueError as error:
+        raise exc.HTTPBadRequest(str(error))
+
+    return data
+
+
+@view_config(route_name='journals_facets', request_method='GET', renderer='jsonp')
+def journals_facets(request):
+    arguments = facets_arguments(request.GET, journal_filters(request.GET))
+
     try:
-        data = request.index.publication_stats(doc_type='article', filters=filters, aggs=aggs.split(','))
+        data = request.index.publication_facets(doc_type='journal', **arguments)
     except ValueError as error:
-        raise exc.HTTPBadRequest(error.message)
+        raise exc.HTTPBadRequest(str(error))
 
-    return data
\ No newline at end of file
+    return data
+
+
+@view_config(route_name='documents_facets', request_method='GET', renderer='jsonp')
+def documents_facets(request):
+    arguments = facets_arguments(request.GET, document_filters(request.GET))
+
+    try:
+        data = request.index.publication_facets(doc_type='article', **arguments)
+    except ValueError as error:
+        raise exc.HTTPBadRequest(str(error))
+
+    return data
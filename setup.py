@@ -2,6 +2,7 @@
 import os
 
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 
 here = os.path.abspath(os.path.dirname(__file__))
 with open(os.path.join(here, 'README.rst')) as f:
@@ -25,6 +26,28 @@ install_requires = [
 
 test_requires = []
 
+extras_require = {
+    'async': ['aiohttp>=3.3'],
+}
+
+
+class BuildPy(build_py):
+    """
+    Compile the ISO 3166 lookup tables into the built package, so the loader
+    does not parse the JSON sources at runtime.
+    """
+
+    def run(self):
+        build_py.run(self)
+
+        from processing import choices
+
+        if not self.dry_run:
+            choices.write_tables(
+                choices.compile_tables(),
+                os.path.join(self.build_lib, 'processing', 'iso_3166.pickle')
+            )
+
 setup(
     name="publication",
     version='1.30.1',
@@ -54,12 +77,16 @@ setup(
     setup_requires=["nose>=1.0", "coverage"],
     tests_require=test_requires,
     install_requires=install_requires,
+    extras_require=extras_require,
     test_suite="nose.collector",
+    cmdclass={'build_py': BuildPy},
     entry_points="""\
     [paste.app_factory]
     main = publication:main
     [console_scripts]
     publicationstats_thriftserver = publication.thrift.server:main
     publicationstats_loaddata = processing.loaddata:main
+    publicationstats_aioserver = publication.aio:main
+    publicationstats_snapshot = publication.local:main
     """,
 )
\ No newline at end of file
@@ -0,0 +1,179 @@
+# coding: utf-8
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+from aiohttp.test_utils import AioHTTPTestCase
+
+from publication import aio
+from publication.cache import FileCache, ResponseCache
+from publication.controller import ServerError
+
+
+class FakeElasticSearch(object):
+    """
+    Answers the requests of AsyncStats._request, recording their bodies.
+    """
+
+    def __init__(self):
+        self.searches = []
+        self.available = True
+
+    async def request(self, method, path, body=None):
+        if not self.available:
+            raise ServerError('ElasticSearch ConnectionError: down')
+
+        if path == '/':
+            return {'version': {'number': '5.1.0'}}
+
+        if path.endswith('/_search'):
+            self.searches.append(body)
+            return {'aggregations': {
+                facet: {'buckets': [{'key': 'scl', 'doc_count': 2}]}
+                for facet in body['aggs']
+            }}
+
+        return {'_source': {'generation': '2017-01-01'}}
+
+
+class TestAsyncApp(AioHTTPTestCase):
+
+    cache = None
+
+    async def get_application(self):
+        app = aio.make_app(hosts=['127.0.0.1:9200'], backend='elasticsearch', rollup=None)
+        app['stats'].cache = self.cache
+        self.es = FakeElasticSearch()
+        app['stats']._request = self.es.request
+
+        return app
+
+    async def test_index(self):
+        response = await self.client.get('/')
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(await response.text(), 'Publication Stats API by SciELO')
+
+    async def test_health(self):
+        response = await self.client.get('/api/v1/health')
+        data = await response.json()
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(data['elasticsearch'], 'available')
+        self.assertEqual(data['pool']['hosts'], 1)
+
+        self.es.available = False
+        data = await (await self.client.get('/api/v1/health')).json()
+        self.assertEqual(data['elasticsearch'], 'unavailable')
+
+    async def test_stats(self):
+        response = await self.client.get(
+            '/api/v1/documents', params={'aggs': 'collection', 'collection': 'scl'})
+        data = await response.json()
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.content_type, 'application/json')
+        self.assertEqual(data['collection']['buckets'], [{'key': 'scl', 'doc_count': 2}])
+        self.assertEqual(
+            self.es.searches[0]['query'],
+            {'bool': {'must': [{'term': {'collection': 'scl'}}]}}
+        )
+
+    async def test_facets(self):
+        response = await self.client.get(
+            '/api/v1/journals/facets', params={'facets': 'collection,status'})
+        data = await response.json()
+
+        self.assertEqual(response.status, 200)
+        self.assertEqual(sorted(data), ['collection', 'status'])
+        self.assertEqual(sorted(self.es.searches[0]['aggs']), ['collection', 'status'])
+
+    async def test_jsonp(self):
+        response = await self.client.get(
+            '/api/v1/documents', params={'aggs': 'collection', 'callback': 'show'})
+        text = await response.text()
+
+        self.assertEqual(response.content_type, 'application/javascript')
+        self.assertTrue(text.startswith('/**/show('))
+        self.assertTrue(text.endswith(');'))
+        self.assertEqual(
+            json.loads(text[len('/**/show('):-2])['collection']['buckets'][0]['key'],
+            'scl'
+        )
+
+    async def test_invalid_callback(self):
+        response = await self.client.get(
+            '/api/v1/documents', params={'aggs': 'collection', 'callback': 'alert(1)'})
+
+        self.assertEqual(response.status, 400)
+
+    async def test_bad_request(self):
+        response = await self.client.get('/api/v1/documents')
+        self.assertEqual(response.status, 400)
+        self.assertIn('aggs parameter is required', await response.text())
+
+        response = await self.client.get(
+            '/api/v1/documents', params={'aggs': 'collection', 'size': 'x'})
+        self.assertEqual(response.status, 400)
+
+    async def test_server_error(self):
+        self.es.available = False
+
+        response = await self.client.get('/api/v1/documents', params={'aggs': 'collection'})
+
+        self.assertEqual(response.status, 500)
+        self.assertIn('down', await response.text())
+
+
+class TestMakeApp(unittest.TestCase):
+
+    def test_only_elasticsearch_backend(self):
+        for backend in ('local', 'fallback'):
+            with self.assertRaises(ValueError):
+                aio.make_app(hosts=['127.0.0.1:9200'], backend=backend)
+
+    def test_rollup_not_used(self):
+        with self.assertLogs('publication.aio', 'WARNING'):
+            aio.make_app(hosts=['127.0.0.1:9200'], rollup='/data/rollup.pickle')
+
+
+class TestAsyncAppSharedCache(TestAsyncApp):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = ResponseCache(shared=FileCache(self.directory))
+        super(TestAsyncAppSharedCache, self).setUp()
+
+    def tearDown(self):
+        super(TestAsyncAppSharedCache, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    async def test_cached(self):
+        threads = []
+        get = self.cache.shared.get
+
+        def shared_get(key):
+            threads.append(threading.get_ident())
+            return get(key)
+
+        self.cache.shared.get = shared_get
+
+        for i in range(2):
+            response = await self.client.get('/api/v1/documents', params={'aggs': 'collection'})
+            self.assertEqual(response.status, 200)
+
+        self.assertEqual(len(self.es.searches), 1)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        self.cache.local.clear()
+        await self.client.get('/api/v1/documents', params={'aggs': 'collection'})
+        self.assertEqual(len(self.es.searches), 1)
+
+        # The files of the shared cache are not read in the event loop.
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
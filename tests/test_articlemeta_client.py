@@ -0,0 +1,117 @@
+# coding: utf-8
+import unittest
+
+from thriftpy.transport import TTransportException
+
+from processing import loaddata
+from processing.articlemeta_client import (
+    PooledThriftClient, LatencyHistogram)
+
+
+class Connection(object):
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.closed = False
+
+    def get_journal(self, code, collection):
+        if self.failures:
+            self.failures.pop()
+            raise TTransportException(message='broken pipe')
+
+        return '{"v400": [{"_": "%s"}]}' % code
+
+    def close(self):
+        self.closed = True
+
+
+class Client(PooledThriftClient):
+
+    def __init__(self, failures=0, **kwargs):
+        super(Client, self).__init__(
+            domain='127.0.0.1:11621', retry_backoff=0, **kwargs)
+        self.failures = [True] * failures
+        self.connections = []
+
+    def _connect(self):
+        self.connects += 1
+        connection = Connection(self.failures)
+        self.connections.append(connection)
+        return connection
+
+
+class TestPooledThriftClient(unittest.TestCase):
+
+    def test_connection_reused(self):
+        client = Client()
+
+        client.journal('0001-3765', 'scl')
+        client.journal('0002-3765', 'scl')
+
+        self.assertEqual(1, client.connects)
+        self.assertEqual(1, client.stats()['idle'])
+
+    def test_reconnect_on_broken_transport(self):
+        client = Client(failures=2)
+
+        journal = client.journal('0001-3765', 'scl')
+
+        self.assertEqual('0001-3765', journal.scielo_issn)
+        self.assertEqual(3, client.connects)
+        self.assertEqual(2, client.reconnects)
+        self.assertTrue(client.connections[0].closed)
+
+    def test_gives_up_after_max_retries(self):
+        client = Client(failures=5, max_retries=2)
+
+        with self.assertRaises(TTransportException):
+            client.journal('0001-3765', 'scl')
+
+        self.assertEqual(2, client.retries)
+
+    def test_latency_recorded(self):
+        client = Client()
+
+        client.journal('0001-3765', 'scl')
+
+        latency = client.stats()['latency']
+        self.assertEqual(1, latency['get_journal']['count'])
+
+    def test_grow(self):
+        client = Client(pool_size=1)
+
+        first = client._acquire()
+        self.assertFalse(client._slots.acquire(blocking=False))
+
+        client.grow(2)
+        client.grow(1)
+        second = client._acquire()
+        self.assertEqual(2, client.pool_size)
+        self.assertFalse(client._slots.acquire(blocking=False))
+
+        client._release(first)
+        client._release(second)
+        self.assertEqual(2, client.stats()['idle'])
+
+    def test_shared_client_grows(self):
+        first = loaddata.articlemeta('127.0.0.1:11620', pool_size=2)
+        second = loaddata.articlemeta('127.0.0.1:11620', pool_size=4)
+
+        self.assertIs(first, second)
+        self.assertEqual(4, second.pool_size)
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = LatencyHistogram(buckets=(10, 100))
+
+        histogram.record('document', 0.005)
+        histogram.record('document', 0.05)
+        histogram.record('document', 0.5)
+        histogram.record('document', 0.01)
+
+        result = histogram.stats()['document']
+        self.assertEqual(4, result['count'])
+        self.assertEqual(
+            [('10', 2), ('100', 1), ('+Inf', 1)], result['buckets'])
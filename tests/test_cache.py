@@ -0,0 +1,270 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from publication import cache
+
+
+class Clock(object):
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCacheKey(unittest.TestCase):
+
+    def test_filters_order_ignored(self):
+        key_1 = cache.cache_key('article', ['collection'], {'issn': '0001-3765', 'collection': 'scl'})
+        key_2 = cache.cache_key('article', ['collection'], {'collection': 'scl', 'issn': '0001-3765'})
+
+        self.assertEqual(key_1, key_2)
+
+    def test_aggs_order_kept(self):
+        key_1 = cache.cache_key('article', ['collection', 'issn'])
+        key_2 = cache.cache_key('article', ['issn', 'collection'])
+
+        self.assertNotEqual(key_1, key_2)
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        self.assertEqual(1, lru.get('a'))
+        self.assertIsNone(lru.get('b'))
+        self.assertEqual(3, lru.get('c'))
+
+    def test_expires_after_ttl(self):
+        clock = Clock()
+        lru = cache.LRUCache(ttl=10, timer=clock)
+        lru.set('a', 1)
+
+        clock.now = 11
+
+        self.assertIsNone(lru.get('a'))
+        self.assertEqual(0, len(lru))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_hits_and_misses(self):
+        responses = cache.ResponseCache()
+
+        responses.get('a')
+        responses.set('a', {'collection': {'buckets': []}})
+        responses.get('a')
+
+        self.assertEqual(
+            {'hits': 1, 'misses': 1, 'invalidations': 0, 'size': 1},
+            responses.stats()
+        )
+
+    def test_returns_copies(self):
+        responses = cache.ResponseCache()
+        responses.set('a', {'buckets': []})
+
+        responses.get('a')['buckets'].append(1)
+
+        self.assertEqual({'buckets': []}, responses.get('a'))
+
+    def test_shared_backend(self):
+        worker_1 = cache.ResponseCache(shared=cache.FileCache(self.path))
+        worker_2 = cache.ResponseCache(shared=cache.FileCache(self.path))
+
+        worker_1.set('a', {'buckets': []})
+
+        self.assertEqual({'buckets': []}, worker_2.get('a'))
+
+        worker_1.clear()
+
+        self.assertIsNone(cache.FileCache(self.path).get('a'))
+
+    def test_counters_of_concurrent_lookups(self):
+        responses = cache.ResponseCache()
+        responses.set('a', {'buckets': []})
+
+        def lookups():
+            for i in range(1000):
+                responses.get('a')
+                responses.get('b')
+
+        threads = [threading.Thread(target=lookups) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(4000, responses.stats()['hits'])
+        self.assertEqual(4000, responses.stats()['misses'])
+
+    def test_generation_change_drops_entries(self):
+        clock = Clock()
+        generations = ['2017-01-01', '2017-01-02']
+        responses = cache.ResponseCache(poll_interval=10, timer=clock)
+
+        responses.check_generation(lambda: generations[0])
+        responses.set('a', {'buckets': []})
+
+        clock.now = 5
+        self.assertEqual('2017-01-01', responses.check_generation(lambda: generations[1]))
+        self.assertEqual({'buckets': []}, responses.get('a'))
+
+        clock.now = 10
+        self.assertEqual('2017-01-02', responses.check_generation(lambda: generations[1]))
+        self.assertIsNone(responses.get('a'))
+        self.assertEqual(1, responses.stats()['invalidations'])
+
+    def test_unavailable_generation_keeps_entries(self):
+        responses = cache.ResponseCache(poll_interval=0)
+
+        responses.check_generation(lambda: '2017-01-01')
+        responses.set('a', {'buckets': []})
+
+        self.assertEqual('2017-01-01', responses.check_generation(lambda: None))
+        self.assertEqual({'buckets': []}, responses.get('a'))
+
+
+class TestFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.clock = Clock()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def touch(self, files, key, mtime):
+        os.utime(files._filename(key), (mtime, mtime))
+
+    def test_sweep(self):
+        self.clock.now = 1000
+        files = cache.FileCache(self.path, ttl=10, timer=self.clock)
+
+        for key, mtime in (('a', 985), ('b', 991), ('c', 992), ('d', 993)):
+            files.set(key, {'buckets': []})
+            self.touch(files, key, mtime)
+
+        files.max_entries = 2
+        self.assertEqual(2, files.sweep())
+
+        self.assertEqual(
+            sorted([files._filename('c'), files._filename('d')]),
+            sorted([os.path.join(self.path, i) for i in os.listdir(self.path)])
+        )
+        self.assertEqual({'sweeps': 1, 'evictions': 2}, files.stats())
+
+    def test_swept_while_written(self):
+        files = cache.FileCache(
+            self.path, ttl=5, max_entries=100, sweep_interval=10, timer=self.clock)
+
+        files.set('a', {'buckets': []})
+        self.touch(files, 'a', 0)
+
+        self.clock.now = 20
+        files.set('b', {'buckets': []})
+
+        self.assertEqual(1, files.stats()['evictions'])
+        self.assertFalse(os.path.exists(files._filename('a')))
+        self.assertEqual({'buckets': []}, files.get('b'))
+
+    def test_swept_after_max_entries_writes(self):
+        files = cache.FileCache(
+            self.path, ttl=5, max_entries=2, sweep_interval=1000, timer=self.clock)
+
+        for key in ('a', 'b', 'c', 'd'):
+            files.set(key, {'buckets': []})
+            self.touch(files, key, 100 + ord(key))
+
+        self.assertEqual(2, files.stats()['sweeps'])
+        self.assertEqual(2, len(os.listdir(self.path)))
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def run_concurrently(self, flights, func, count=5):
+        results = []
+        errors = []
+
+        def call():
+            try:
+                results.append(flights.do('key', func))
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for i in range(count)]
+        for thread in threads:
+            thread.start()
+
+        return threads, results, errors
+
+    def test_concurrent_calls_share_the_result(self):
+        flights = cache.SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def func():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return {'buckets': []}
+
+        threads, results, errors = self.run_concurrently(flights, func)
+        started.wait()
+        while flights.coalesced < 4:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'buckets': []}] * 5)
+        self.assertEqual(len(set([id(i) for i in results])), 5)
+        self.assertEqual(flights.stats()['executed'], 1)
+        self.assertEqual(flights.stats()['coalesced'], 4)
+        self.assertEqual(flights.stats()['in_flight'], 0)
+
+    def test_concurrent_calls_share_the_error(self):
+        flights = cache.SingleFlight()
+        release = threading.Event()
+
+        def func():
+            release.wait()
+            raise ValueError('fail')
+
+        threads, results, errors = self.run_concurrently(flights, func, count=3)
+        while flights.coalesced < 2:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, [])
+        self.assertEqual(len(errors), 3)
+
+    def test_sequential_calls_run_again(self):
+        flights = cache.SingleFlight()
+        value = {'buckets': []}
+
+        self.assertIs(flights.do('key', lambda: value), value)
+        self.assertIs(flights.do('key', lambda: value), value)
+        self.assertEqual(flights.stats()['executed'], 2)
+        self.assertEqual(flights.stats()['coalesced'], 0)
+
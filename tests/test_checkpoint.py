@@ -0,0 +1,51 @@
+# coding: utf-8
+import os
+import tempfile
+import unittest
+
+from processing.checkpoint import CheckpointStore
+
+
+class TestCheckpointStore(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.store = CheckpointStore(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        os.remove(self.path)
+
+    def test_watermark_without_checkpoint(self):
+        self.assertIsNone(self.store.watermark('scl', 'article'))
+
+    def test_finish(self):
+        self.store.finish('scl', 'article', '2017-01-20')
+
+        self.assertEqual('2017-01-20', self.store.watermark('scl', 'article'))
+        self.assertEqual('2017-01-20', self.store.get('scl', 'article')['processing_date'])
+        self.assertIsNone(self.store.get('scl', 'journal'))
+
+    def test_finish_with_failures_keeps_watermark(self):
+        self.store.finish('scl', 'article')
+        self.assertIsNone(self.store.get('scl', 'article'))
+
+        self.store.finish('scl', 'article', '2017-01-10')
+        self.store.finish('scl', 'article')
+
+        self.assertEqual('2017-01-10', self.store.watermark('scl', 'article'))
+
+    def test_watermark_does_not_move_backwards(self):
+        self.store.finish(None, 'article', '2017-01-20')
+        self.store.finish(None, 'article', '2017-01-10')
+
+        self.assertEqual('2017-01-20', self.store.watermark(None, 'article'))
+
+    def test_persisted_between_runs(self):
+        self.store.finish('scl', 'journal', '2017-01-20')
+        self.store.close()
+
+        self.store = CheckpointStore(self.path)
+
+        self.assertEqual('2017-01-20', self.store.watermark('scl', 'journal'))
@@ -0,0 +1,47 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from processing import choices
+
+
+class TestChoices(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.filename = os.path.join(self.path, 'iso_3166.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_compile_tables(self):
+        tables = choices.compile_tables()
+
+        self.assertEqual('Brazil', tables.country_code['BR'])
+        self.assertEqual('BR', tables.country_name_as_key['BRAZIL'])
+        self.assertEqual('BR', tables.country_alias['BRASIL'])
+        self.assertEqual('BR-SP', tables.division_name_as_key[u'SÃO PAULO'])
+        self.assertEqual('BR-SP', tables.division_alias[('BR', 'SAO PAULO')])
+
+    def test_write_and_read_tables(self):
+        tables = choices.compile_tables()
+
+        choices.write_tables(tables, self.filename)
+
+        self.assertEqual(tables, choices.read_tables(self.filename))
+
+    def test_read_tables_missing_file(self):
+
+        self.assertIsNone(choices.read_tables(self.filename))
+
+    def test_read_tables_older_than_sources(self):
+        choices.write_tables(choices.compile_tables(), self.filename)
+        os.utime(self.filename, (0, 0))
+
+        self.assertIsNone(choices.read_tables(self.filename))
+
+    def test_normalize_name(self):
+
+        self.assertEqual('SAO PAULO', choices.normalize_name(u' São-Paulo. '))
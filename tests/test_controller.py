@@ -1,6 +1,22 @@
+import re
+import threading
 import unittest
 
 from publication import controller
+from publication.cache import ResponseCache
+
+
+def lucene_to_python(regex):
+    """
+    Convert the escaped Lucene regular expressions built by the controller to
+    Python ones.
+    """
+    converted = []
+    chars = iter(regex)
+    for char in chars:
+        converted.append(re.escape(next(chars)) if char == '\\' else char)
+
+    return ''.join(converted)
 
 
 class TestController(unittest.TestCase):
@@ -13,7 +29,7 @@ class TestController(unittest.TestCase):
                 "subject_areas": {
                     "terms": {
                         "field": "subject_areas",
-                        "size": 0
+                        "size": 1000
                     }
                 }
             }
@@ -29,13 +45,13 @@ class TestController(unittest.TestCase):
                 "collection": {
                     "terms": {
                         "field": "collection",
-                        "size": 0
+                        "size": 1000
                     },
                     "aggs": {
                         "subject_areas": {
                             "terms": {
                                 "field": "subject_areas",
-                                "size": 0
+                                "size": 1000
                             }
                         }
                     }
@@ -44,3 +60,189 @@ class TestController(unittest.TestCase):
         }
 
         self.assertEqual(expected, aggs)
+
+    def test_publication_stats_cached(self):
+        queries = []
+
+        def query_dispatcher(**kwargs):
+            queries.append(kwargs)
+            return {'aggregations': {'collection': {'buckets': []}}}
+
+        stats = controller.stats(hosts=['127.0.0.1'], cache=ResponseCache())
+        stats._query_dispatcher = query_dispatcher
+        stats.index_generation = lambda: '2017-01-01'
+
+        stats.publication_stats('article', ['collection'], {'issn': '0001-3765'})
+        result = stats.publication_stats('article', ['collection'], {'issn': '0001-3765'})
+
+        self.assertEqual({'collection': {'buckets': []}}, result)
+        self.assertEqual(1, len(queries))
+
+    def test_construct_facets(self):
+        aggs = controller.construct_facets(['collection', 'subject_areas'])
+
+        expected = {
+            "aggs": {
+                "collection": {
+                    "terms": {
+                        "field": "collection",
+                        "size": 1000
+                    }
+                },
+                "subject_areas": {
+                    "terms": {
+                        "field": "subject_areas",
+                        "size": 1000
+                    }
+                }
+            }
+        }
+
+        self.assertEqual(expected, aggs)
+
+    def test_publication_facets_not_allowed(self):
+        stats = controller.stats(hosts=['127.0.0.1'])
+
+        with self.assertRaises(ValueError):
+            stats.publication_facets('article', ['collection', 'status'])
+
+    def test_construct_aggs_size_only_on_first_aggregation(self):
+        aggs = controller.construct_aggs(['collection', 'issn'], size=10)
+
+        self.assertEqual(10, aggs['aggs']['collection']['terms']['size'])
+        self.assertEqual(
+            5000, aggs['aggs']['collection']['aggs']['issn']['terms']['size'])
+
+    def test_construct_aggs_paginated(self):
+        aggs = controller.construct_aggs(
+            ['issn'], size=10, paginate=True, after='0001-3765')
+
+        terms = aggs['aggs']['issn']['terms']
+        self.assertEqual({'_term': 'asc'}, terms['order'])
+        self.assertEqual(controller.after_regex('0001-3765'), terms['include'])
+
+    def test_after_regex(self):
+        regex = re.compile(lucene_to_python(controller.after_regex('0001-3765')))
+        keys = ['0001-3764', '0001-3765', '0001-37650', '0001-3766', '0002', '1', '0001']
+
+        result = [i for i in keys if regex.fullmatch(i)]
+
+        self.assertEqual(['0001-37650', '0001-3766', '0002', '1'], result)
+
+    def test_add_other_bucket(self):
+        data = {
+            'collection': {
+                'sum_other_doc_count': 5,
+                'buckets': [
+                    {
+                        'key': 'scl',
+                        'doc_count': 10,
+                        'languages': {
+                            'sum_other_doc_count': 0,
+                            'buckets': [{'key': 'pt', 'doc_count': 10}]
+                        }
+                    }
+                ]
+            }
+        }
+
+        controller.add_other_bucket(data)
+
+        self.assertEqual(
+            [{'key': 'scl', 'doc_count': 10}, {'key': 'other', 'doc_count': 5}],
+            [{'key': i['key'], 'doc_count': i['doc_count']} for i in data['collection']['buckets']]
+        )
+        self.assertEqual(1, len(data['collection']['buckets'][0]['languages']['buckets']))
+
+    def test_publication_stats_after_key(self):
+        stats = controller.stats(hosts=['127.0.0.1'])
+        stats._query_dispatcher = lambda **kwargs: {
+            'aggregations': {
+                'issn': {'buckets': [
+                    {'key': '0001-3765', 'doc_count': 1},
+                    {'key': '0002-3765', 'doc_count': 1}
+                ]}
+            }
+        }
+
+        full_page = stats.publication_stats('article', ['issn'], size=2, paginate=True)
+        last_page = stats.publication_stats('article', ['issn'], size=3, after='0000-0000')
+
+        self.assertEqual('0002-3765', full_page['issn']['after_key'])
+        self.assertIsNone(last_page['issn']['after_key'])
+
+    def test_publication_stats_size_not_allowed(self):
+        stats = controller.stats(hosts=['127.0.0.1'])
+
+        with self.assertRaises(ValueError):
+            stats.publication_stats('article', ['issn'], size=0)
+
+    def test_shared_stats_reused_by_the_process(self):
+        controller._shared_stats.clear()
+
+        first = controller.shared_stats(hosts=['127.0.0.1'])
+        second = controller.shared_stats(hosts=['127.0.0.1'])
+
+        self.assertIs(first, second)
+        controller._shared_stats.clear()
+
+    def test_shared_stats_by_arguments(self):
+        controller._shared_stats.clear()
+
+        first = controller.shared_stats(hosts=['127.0.0.1'])
+        other = controller.shared_stats(hosts=['127.0.0.2'], maxsize=3)
+
+        self.assertIsNot(first, other)
+        self.assertIs(other, controller.shared_stats(maxsize=3, hosts=['127.0.0.2']))
+        self.assertEqual(
+            other.transport.connection_pool.connections[0].host,
+            'http://127.0.0.2:9200'
+        )
+        controller._shared_stats.clear()
+
+    def test_stats_pool_size(self):
+        stats = controller.stats(hosts=['127.0.0.1'], maxsize=3)
+
+        connection = stats.transport.connection_pool.connections[0]
+        self.assertEqual(3, connection.pool.pool.maxsize)
+
+    def test_pool_stats(self):
+        stats = controller.stats(hosts=['127.0.0.1'])
+        connection = stats.transport.connection_pool.connections[0]
+        connection.pool.num_connections = 2
+        connection.pool.num_requests = 10
+
+        self.assertEqual(
+            {'hosts': 1, 'connections': 2, 'requests': 10, 'reused': 8},
+            stats.pool_stats()
+        )
+
+    def test_identical_requests_coalesced(self):
+        queries = []
+        release = threading.Event()
+
+        def query_dispatcher(**kwargs):
+            queries.append(kwargs)
+            release.wait()
+            return {'aggregations': {'collection': {'buckets': [{'key': 'scl', 'doc_count': 1}]}}}
+
+        stats = controller.stats(hosts=['127.0.0.1'])
+        stats._query_dispatcher = query_dispatcher
+        results = []
+
+        def request():
+            results.append(stats.publication_stats(
+                'article', ['collection'], {'issn': '0001-3765'}, other=True))
+
+        threads = [threading.Thread(target=request) for i in range(3)]
+        for thread in threads:
+            thread.start()
+        while stats.flights.coalesced < 2:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, len(queries))
+        self.assertEqual(3, len(results))
+        self.assertEqual(2, stats.flights.stats()['coalesced'])
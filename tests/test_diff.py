@@ -0,0 +1,47 @@
+# coding: utf-8
+import os
+import unittest
+
+from processing.diff import IdDiff
+
+
+class TestIdDiff(unittest.TestCase):
+
+    def setUp(self):
+        self.diff = IdDiff()
+        self.diff.load('articlemeta', [
+            ('scl_S0001', '2017-01-01'),
+            ('scl_S0002', '2017-01-02'),
+            ('scl_S0003', '2017-01-01'),
+        ])
+        self.diff.load('indexed', [
+            ('scl_S0001', '2017-01-01'),
+            ('scl_S0002', '2017-01-01'),
+            ('scl_S0004', '2017-01-01'),
+        ])
+
+    def tearDown(self):
+        self.diff.close()
+
+    def test_to_include(self):
+        self.assertEqual(
+            ['scl_S0002', 'scl_S0003'], sorted(self.diff.to_include()))
+        self.assertEqual(2, self.diff.count_to_include())
+
+    def test_to_remove(self):
+        self.assertEqual(['scl_S0004'], list(self.diff.to_remove()))
+        self.assertEqual(1, self.diff.count_to_remove())
+
+    def test_count(self):
+        self.assertEqual(3, self.diff.count('indexed'))
+
+    def test_temporary_file_removed_on_close(self):
+        path = self.diff.path
+
+        self.diff.close()
+
+        self.assertFalse(os.path.exists(path))
+
+    def test_invalid_source(self):
+        with self.assertRaises(ValueError):
+            self.diff.load('invalid', [])
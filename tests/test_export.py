@@ -0,0 +1,173 @@
+# coding: utf-8
+import csv
+import glob
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from xylose.scielodocument import Article
+
+from processing import export
+from processing import loaddata
+from processing.checkpoint import CheckpointStore
+from tests.test_loaddata import raw_article
+
+
+def read_part(path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        return list(csv.reader(f))
+
+
+class FakeIndexer(object):
+
+    def __init__(self):
+        self.added = []
+        self.deleted = []
+        self.flushes = 0
+        self.on_flush = None
+
+    def add(self, document):
+        self.added.append(document['id'])
+
+    def delete(self, _id):
+        self.deleted.append(_id)
+
+    def flush(self):
+        self.flushes += 1
+
+    def summary(self):
+        return {'indexed': len(self.added), 'deleted': len(self.deleted), 'failed': 0}
+
+
+class TestCsvExporter(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def document(self, _id, collection='scl', year='2000'):
+        return {
+            'id': _id,
+            'collection': collection,
+            'publication_year': year,
+            'languages': ['en', 'pt'],
+            'pages': 10
+        }
+
+    def test_partitions(self):
+        with export.CsvExporter(self.directory, 'article') as exporter:
+            exporter.add(self.document('1'))
+            exporter.add(self.document('2', year='2001'))
+            exporter.add(self.document('3', collection='arg'))
+            exporter.add(self.document('4'))
+
+        rows = read_part(exporter.path('scl', '2000'))
+        self.assertEqual(rows[0], export.FIELDS['article'])
+        self.assertEqual([i[0] for i in rows[1:]], ['1', '4'])
+
+        row = dict(zip(rows[0], rows[1]))
+        self.assertEqual(row['languages'], 'en|pt')
+        self.assertEqual(row['pages'], '10')
+        self.assertEqual(row['doi'], '')
+
+        self.assertEqual(len(read_part(exporter.path('scl', '2001'))), 2)
+        self.assertEqual(len(read_part(exporter.path('arg', '2000'))), 2)
+        self.assertEqual(exporter.summary(), {'exported': 4, 'files': 3, 'skipped_deletes': 0})
+
+    def test_exporters_of_the_same_process(self):
+        with export.CsvExporter(self.directory, 'article') as first:
+            first.add(self.document('1'))
+
+        with export.CsvExporter(self.directory, 'article') as second:
+            second.add(self.document('2'))
+
+        self.assertNotEqual(first.path('scl', '2000'), second.path('scl', '2000'))
+        rows = read_part(first.path('scl', '2000')) + read_part(second.path('scl', '2000'))
+        self.assertEqual([i[0] for i in rows if i[0] != 'id'], ['1', '2'])
+
+    def test_reopen_closed_files(self):
+        with export.CsvExporter(self.directory, 'article', max_open_files=1) as exporter:
+            exporter.add(self.document('1'))
+            exporter.add(self.document('2', year='2001'))
+            exporter.add(self.document('3'))
+
+        rows = read_part(exporter.path('scl', '2000'))
+        self.assertEqual([i[0] for i in rows], ['id', '1', '3'])
+
+    def test_flush_every_chunk(self):
+        batches = []
+        exporter = export.CsvExporter(
+            self.directory, 'article', chunk_size=2, on_flush=batches.append)
+
+        for i in range(5):
+            exporter.add(self.document(str(i)))
+        exporter.close()
+
+        self.assertEqual(batches, [1, 2, 3])
+
+    def test_exporting_indexer(self):
+        indexer = FakeIndexer()
+        exporter = export.CsvExporter(self.directory, 'article')
+        both = export.ExportingIndexer(indexer, exporter)
+
+        both.on_flush = 'callback'
+        both.add(self.document('1'))
+        both.delete('2')
+        both.flush()
+        exporter.close()
+
+        self.assertEqual(indexer.on_flush, 'callback')
+        self.assertEqual(indexer.added, ['1'])
+        self.assertEqual(indexer.deleted, ['2'])
+        self.assertEqual(exporter.summary()['exported'], 1)
+        self.assertEqual(exporter.summary()['skipped_deletes'], 0)
+
+    def test_export_only_load_from_dump(self):
+        dump = os.path.join(self.directory, 'articles.jsonl')
+        with open(dump, 'w') as f:
+            f.write(json.dumps(raw_article('S0001-37652000000100001')) + '\n')
+            f.write(json.dumps(raw_article('S0001-37652000000100002')) + '\n')
+
+        output = os.path.join(self.directory, 'export')
+        summary = loaddata.run(
+            'article', dump=dump, export=output, export_only=True)
+
+        self.assertEqual(summary['indexed'], 0)
+        self.assertEqual(summary['exported'], 2)
+
+        parts = glob.glob(os.path.join(output, 'article', 'collection=scl', 'year=2000', '*.csv.gz'))
+        self.assertEqual(len(parts), 1)
+        rows = read_part(parts[0])
+        self.assertEqual(
+            [i[0] for i in rows[1:]],
+            ['scl_S0001-37652000000100001', 'scl_S0001-37652000000100002']
+        )
+
+    def test_export_only_keeps_the_checkpoint(self):
+        checkpoint = os.path.join(self.directory, 'checkpoint.sqlite')
+        with CheckpointStore(checkpoint) as store:
+            store.finish('scl', 'article', '1999-01-01')
+
+        original = loaddata.articlemeta_source
+        loaddata.articlemeta_source = lambda endpoint, **kwargs: [
+            Article(raw_article('S0001-37652000000100001'))]
+
+        try:
+            summary = loaddata.run(
+                'article', collection='scl', export=self.directory,
+                export_only=True, checkpoint=checkpoint)
+        finally:
+            loaddata.articlemeta_source = original
+
+        self.assertEqual(summary['exported'], 1)
+        with CheckpointStore(checkpoint) as store:
+            self.assertEqual(store.watermark('scl', 'article'), '1999-01-01')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+# coding: utf-8
+import unittest
+
+from processing.harvest import harvest_ids
+
+
+class Client(object):
+    """
+    Scrolls over documents split in slices by the position of the id.
+    """
+
+    def __init__(self, ids, fail_slice=None):
+        self.ids = ids
+        self.fail_slice = fail_slice
+        self.bodies = []
+        self.scrolls = {}
+        self.cleared = []
+
+    def _page(self, scroll_id):
+        hits, size = self.scrolls[scroll_id]
+        page, self.scrolls[scroll_id] = hits[:size], (hits[size:], size)
+        return {'_scroll_id': scroll_id, 'hits': {'hits': page}}
+
+    def search(self, index, doc_type, body, scroll):
+        self.bodies.append(body)
+        sliced = body.get('slice', {'id': 0, 'max': 1})
+        if sliced['id'] == self.fail_slice:
+            raise ValueError('slice failed')
+        hits = [
+            {'_id': i, 'fields': {'processing_date': ['2017-01-01']}}
+            for n, i in enumerate(self.ids) if n % sliced['max'] == sliced['id']
+        ]
+        scroll_id = 'scroll-%d' % sliced['id']
+        self.scrolls[scroll_id] = (hits, body['size'])
+        return self._page(scroll_id)
+
+    def scroll(self, scroll_id, scroll):
+        return self._page(scroll_id)
+
+    def clear_scroll(self, scroll_id):
+        self.cleared.append(scroll_id)
+
+
+class TestHarvestIds(unittest.TestCase):
+
+    def test_single_scroll(self):
+        client = Client(['scl_%d' % i for i in range(7)])
+
+        result = list(harvest_ids(client, 'publication', 'article', slices=1, size=3))
+
+        self.assertEqual([('scl_%d' % i, '2017-01-01') for i in range(7)], result)
+        self.assertEqual(['scroll-0'], client.cleared)
+        self.assertFalse(client.bodies[0]['_source'])
+        self.assertEqual(['processing_date'], client.bodies[0]['docvalue_fields'])
+        self.assertNotIn('slice', client.bodies[0])
+
+    def test_sliced_scroll(self):
+        ids = ['scl_%d' % i for i in range(25)]
+        client = Client(ids)
+
+        result = list(harvest_ids(client, 'publication', 'article', slices=3, size=2))
+
+        self.assertEqual(sorted(ids), sorted([i[0] for i in result]))
+        self.assertEqual(
+            [0, 1, 2], sorted([i['slice']['id'] for i in client.bodies]))
+        self.assertEqual(3, len(client.cleared))
+
+    def test_default_value(self):
+        client = Client(['scl_1'])
+        client.search = lambda **kwargs: {'_scroll_id': '1', 'hits': {'hits': [{'_id': 'scl_1'}]}}
+        client.scroll = lambda **kwargs: {'_scroll_id': '1', 'hits': {'hits': []}}
+
+        result = list(harvest_ids(
+            client, 'publication', 'article', default='1900-01-01', slices=1))
+
+        self.assertEqual([('scl_1', '1900-01-01')], result)
+
+    def test_slice_error_raised(self):
+        client = Client(['scl_%d' % i for i in range(25)], fail_slice=1)
+
+        with self.assertRaises(ValueError):
+            list(harvest_ids(client, 'publication', 'article', slices=3, size=2))
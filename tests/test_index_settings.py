@@ -0,0 +1,77 @@
+# coding: utf-8
+import unittest
+
+from processing.index_settings import index_settings, parse_profile
+
+
+class Indices(object):
+
+    def __init__(self):
+        self.put = []
+
+    def get_settings(self, index):
+        return {
+            'publication_1': {'settings': {'index': {
+                'number_of_shards': '5',
+                'number_of_replicas': '2'
+            }}}
+        }
+
+    def put_settings(self, index, body):
+        self.put.append((index, body['index']))
+
+
+class Client(object):
+
+    def __init__(self):
+        self.indices = Indices()
+
+
+class TestIndexSettings(unittest.TestCase):
+
+    def test_parse_profile(self):
+
+        result = parse_profile('refresh_interval=-1, number_of_replicas=0')
+
+        self.assertEqual(
+            {'refresh_interval': '-1', 'number_of_replicas': '0'}, result)
+
+    def test_parse_profile_none(self):
+
+        self.assertEqual({}, parse_profile('none'))
+        self.assertEqual({}, parse_profile(None))
+
+    def test_parse_profile_invalid(self):
+
+        with self.assertRaises(ValueError):
+            parse_profile('refresh_interval')
+
+    def test_settings_restored(self):
+        client = Client()
+        settings = {'refresh_interval': '-1', 'number_of_replicas': '0'}
+
+        with index_settings(client, 'publication', settings):
+            self.assertEqual([('publication', settings)], client.indices.put)
+
+        self.assertEqual(
+            ('publication_1', {'refresh_interval': None, 'number_of_replicas': '2'}),
+            client.indices.put[1]
+        )
+
+    def test_settings_restored_on_failure(self):
+        client = Client()
+
+        with self.assertRaises(ValueError):
+            with index_settings(client, 'publication', {'number_of_replicas': '0'}):
+                raise ValueError('load failed')
+
+        self.assertEqual(
+            ('publication_1', {'number_of_replicas': '2'}), client.indices.put[1])
+
+    def test_empty_profile(self):
+        client = Client()
+
+        with index_settings(client, 'publication', {}):
+            pass
+
+        self.assertEqual([], client.indices.put)
@@ -0,0 +1,80 @@
+# coding: utf-8
+import json
+import unittest
+
+from processing.indexer import BulkIndexer
+
+
+class Serializer(object):
+
+    def dumps(self, data):
+        return json.dumps(data)
+
+
+class Transport(object):
+
+    serializer = Serializer()
+
+
+class BulkClient(object):
+    """
+    Answers bulk requests with the given sequence of status per call.
+    """
+
+    transport = Transport()
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or []
+        self.calls = []
+
+    def bulk(self, body, index=None, doc_type=None):
+        lines = [json.loads(i) for i in body.strip().split('\n')]
+        actions = [i for i in lines if set(i.keys()) & set(['index', 'delete'])]
+        self.calls.append(actions)
+        statuses = self.statuses.pop(0) if self.statuses else [200] * len(actions)
+        items = []
+        for action, status in zip(actions, statuses):
+            op_type = list(action.keys())[0]
+            items.append({op_type: {'_id': action[op_type]['_id'], 'status': status}})
+
+        return {'items': items}
+
+
+class TestBulkIndexer(unittest.TestCase):
+
+    def test_chunk_by_document_count(self):
+        client = BulkClient()
+        indexer = BulkIndexer(client, 'publication', 'article', chunk_size=2)
+
+        for i in range(5):
+            indexer.add({'id': 'scl_%d' % i})
+        indexer.flush()
+
+        self.assertEqual([2, 2, 1], [len(i) for i in client.calls])
+        self.assertEqual(
+            {'indexed': 5, 'deleted': 0, 'failed': 0}, indexer.summary())
+
+    def test_chunk_by_bytes(self):
+        client = BulkClient()
+        indexer = BulkIndexer(
+            client, 'publication', 'article', max_chunk_bytes=80)
+
+        for i in range(3):
+            indexer.add({'id': 'scl_%d' % i})
+        indexer.flush()
+
+        self.assertEqual(3, len(client.calls))
+
+    def test_retry_only_failed_items(self):
+        client = BulkClient(statuses=[[200, 429, 400]])
+        indexer = BulkIndexer(
+            client, 'publication', 'article', retry_backoff=0)
+
+        with indexer:
+            for i in range(3):
+                indexer.add({'id': 'scl_%d' % i})
+
+        self.assertEqual(['scl_1'], [i['index']['_id'] for i in client.calls[1]])
+        self.assertEqual(
+            {'indexed': 2, 'deleted': 0, 'failed': 1}, indexer.summary())
+        self.assertEqual(['scl_2'], indexer.failed_ids)
@@ -0,0 +1,115 @@
+# coding: utf-8
+import threading
+import unittest
+
+from xylose.scielodocument import Article
+
+from processing import journals
+from processing.journals import JournalCache
+
+
+def raw_article(code, issn='0001-3765', areas=None):
+    return {
+        'collection': 'scl',
+        'code': code,
+        'article': {'v880': [{'_': code}]},
+        'title': {
+            'v400': [{'_': issn}],
+            'v100': [{'_': 'Journal %s' % issn}],
+            'v441': [{'_': i} for i in areas or ['Health Sciences']]
+        }
+    }
+
+
+class Client(object):
+
+    def __init__(self, hits):
+        self.hits = hits
+
+    def search(self, *args, **kwargs):
+        return {
+            '_scroll_id': '1',
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {'hits': self.hits, 'total': len(self.hits)}
+        }
+
+    def scroll(self, *args, **kwargs):
+        return {
+            '_scroll_id': '1',
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {'hits': []}
+        }
+
+    def clear_scroll(self, *args, **kwargs):
+        pass
+
+
+class TestJournalCache(unittest.TestCase):
+
+    def test_journal_fields(self):
+        article = Article(raw_article('S0001-37652000000100001', areas=['A', 'B', 'C']))
+
+        result = journals.journal_fields(article.journal)
+
+        self.assertEqual('0001-3765', result['issn'])
+        self.assertEqual('Journal 0001-3765', result['journal_title'])
+        self.assertEqual(['Multidisciplinary'], result['subject_areas'])
+        self.assertEqual(['undefined'], result['wos_subject_areas'])
+
+    def test_get_computes_each_journal_once(self):
+        cache = JournalCache()
+
+        cache.get(Article(raw_article('S0001-37652000000100001')))
+        cache.get(Article(raw_article('S0001-37652000000100002')))
+        result = cache.get(Article(raw_article('S0002-37652000000100001', issn='0002-3765')))
+
+        self.assertEqual('0002-3765', result['issn'])
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(2, cache.misses)
+        self.assertEqual(2, len(cache))
+
+    def test_counters_of_concurrent_lookups(self):
+        cache = JournalCache()
+        article = Article(raw_article('S0001-37652000000100001'))
+        cache.get(article)
+
+        def lookups():
+            for i in range(1000):
+                cache.get(article)
+
+        threads = [threading.Thread(target=lookups) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(4000, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_clear(self):
+        cache = JournalCache()
+        cache.get(Article(raw_article('S0001-37652000000100001')))
+
+        cache.clear()
+
+        self.assertEqual(0, len(cache))
+        self.assertEqual(0, cache.misses)
+
+    def test_prewarm(self):
+        client = Client([
+            {'_source': {
+                'collection': 'scl', 'issn': '0001-3765', 'title': 'Indexed',
+                'subject_areas': ['Health Sciences'], 'is_multidisciplinary': 0,
+                'wos_subject_areas': ['undefined']}},
+            {'_source': {
+                'collection': 'scl', 'issn': '0002-3765', 'title': 'Old',
+                'subject_areas': ['Health Sciences'], 'is_multidisciplinary': 0}}
+        ])
+        cache = JournalCache()
+
+        loaded = cache.prewarm(client, 'publication')
+        result = cache.get(Article(raw_article('S0001-37652000000100001')))
+
+        self.assertEqual(1, loaded)
+        self.assertEqual('Indexed', result['journal_title'])
+        self.assertEqual({'hits': 1, 'misses': 0, 'prewarmed': 1, 'size': 1, 'hit_rate': 1.0}, cache.stats())
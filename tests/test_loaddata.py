@@ -1,7 +1,36 @@
 # coding: utf-8
+import os
+import tempfile
 import unittest
 
+from xylose.scielodocument import Article
+
 from processing import loaddata
+from processing.checkpoint import CheckpointStore
+
+
+def raw_article(code, country='Brasil', state=u'São Paulo', keyword='Zika'):
+    return {
+        'collection': 'scl',
+        'code': code,
+        'created_at': '2000-01-01',
+        'processing_date': '2000-01-02',
+        'article': {
+            'v880': [{'_': code}],
+            'v65': [{'_': '20000101'}],
+            'v40': [{'_': 'en'}],
+            'v71': [{'_': 'oa'}],
+            'v70': [{'i': 'A01', 'p': country, 's': state, '_': 'USP'}],
+            'v85': [{'k': keyword, 'l': 'en'}],
+            'v14': [{'f': '1', 'l': '10'}]
+        },
+        'issue': {'issue': {'v31': [{'_': '1'}], 'v32': [{'_': '1'}]}},
+        'title': {
+            'v400': [{'_': '0001-3765'}],
+            'v100': [{'_': 'Journal'}],
+            'v441': [{'_': 'Health Sciences'}]
+        }
+    }
 
 
 class TestLoadData(unittest.TestCase):
@@ -29,3 +58,222 @@ class TestLoadData(unittest.TestCase):
         result = loaddata.state('São Paulo', 'BR')
 
         self.assertEqual(result, 'BR-SP')
+
+    def test_country_spelling_variant(self):
+
+        result = loaddata.country(' brasil ')
+
+        self.assertEqual(result, 'BR')
+
+    def test_country_accents_and_punctuation(self):
+
+        result = loaddata.country('Mexico.')
+
+        self.assertEqual(result, 'MX')
+
+    def test_country_undefined(self):
+
+        result = loaddata.country('Atlantis')
+
+        self.assertEqual(result, 'undefined')
+
+    def test_state_without_accents(self):
+
+        result = loaddata.state('Sao  Paulo', 'BR')
+
+        self.assertEqual(result, 'BR-SP')
+
+    def test_normalization_stats(self):
+        loaddata.country.cache_clear()
+
+        loaddata.country('Brazil')
+        loaddata.country('Brazil')
+
+        stats = loaddata.normalization_stats()
+
+        self.assertEqual(1, stats['country']['hits'])
+        self.assertEqual(1, stats['country']['misses'])
+        self.assertEqual(0.5, stats['country']['hit_rate'])
+
+    def test_fmt_documents_batch(self):
+        records = [
+            raw_article('S0001-37652000000100001'),
+            None,
+            raw_article('S0001-37652000000100002', country='Chile', state='Santiago')
+        ]
+
+        result = loaddata.fmt_documents_batch(records)
+
+        self.assertEqual(
+            ['scl_S0001-37652000000100001', 'scl_S0001-37652000000100002'],
+            [i['id'] for i in result]
+        )
+        self.assertEqual(['BR'], result[0]['aff_countries'])
+        self.assertEqual(['BR-SP'], result[0]['aff_states_code'])
+        self.assertEqual(['CL'], result[1]['aff_countries'])
+
+    def test_fmt_documents_batch_same_as_fmt_document(self):
+        record = raw_article('S0001-37652000000100001')
+
+        result = loaddata.fmt_documents_batch([record])
+
+        self.assertEqual([loaddata.fmt_document(Article(record))], result)
+
+    def test_fmt_documents_batch_skips_unavailable_metadata(self):
+        record = raw_article('S0001-37652000000100001')
+        del record['issue']
+
+        result = loaddata.fmt_documents_batch([record])
+
+        self.assertEqual([], result)
+
+    def test_removal_limit(self):
+
+        self.assertEqual(1000, loaddata.removal_limit('1000', 50000))
+        self.assertEqual(2500, loaddata.removal_limit('5%', 50000))
+        self.assertEqual(25, loaddata.removal_limit('0.5%', 5000))
+
+    def test_removal_limit_invalid(self):
+
+        with self.assertRaises(ValueError):
+            loaddata.removal_limit('many', 50000)
+
+
+class Indexer(object):
+
+    def __init__(self, failed=0):
+        self.added = []
+        self.deleted = []
+        self.failed = failed
+        self.on_flush = None
+
+    def add(self, document):
+        self.added.append(document['id'])
+
+    def delete(self, _id):
+        self.deleted.append(_id)
+
+    def flush(self):
+        if self.on_flush:
+            self.on_flush(1)
+
+    def summary(self):
+        return {'indexed': len(self.added), 'deleted': len(self.deleted), 'failed': self.failed}
+
+
+class TestCommonModeCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.store = CheckpointStore(self.path)
+        self.store.finish('scl', 'article', '1999-01-01')
+
+    def tearDown(self):
+        self.store.close()
+        os.remove(self.path)
+
+    def load(self, indexer):
+        source = [Article(raw_article('S0001-37652000000100001'))]
+        loaddata.common_mode(
+            'publication', 'article', loaddata.fmt_document, collection='scl',
+            issns=[None], indexer=indexer, checkpoint=self.store, source=source)
+
+    def test_watermark_moves_after_the_load(self):
+        self.load(Indexer())
+
+        self.assertEqual('2000-01-02', self.store.watermark('scl', 'article'))
+
+    def test_watermark_kept_with_failures(self):
+        self.load(Indexer(failed=1))
+
+        self.assertEqual('1999-01-01', self.store.watermark('scl', 'article'))
+
+
+class TestCommonModeUnavailableMetadata(unittest.TestCase):
+
+    def load(self, processes):
+        unavailable = raw_article('S0001-37652000000100001')
+        del unavailable['issue']
+        source = [
+            Article(unavailable),
+            Article(raw_article('S0001-37652000000100002'))
+        ]
+        indexer = Indexer()
+
+        loaddata.common_mode(
+            'publication', 'article', loaddata.fmt_document, collection='scl',
+            issns=[None], indexer=indexer, processes=processes, source=source)
+
+        return indexer.added
+
+    def test_format_errors_stop_the_load(self):
+        def fmt(document):
+            raise KeyError('v880')
+
+        with self.assertRaises(KeyError):
+            loaddata.common_mode(
+                'publication', 'article', fmt, collection='scl', issns=[None],
+                indexer=Indexer(),
+                source=[Article(raw_article('S0001-37652000000100001'))])
+
+        with self.assertRaises(KeyError):
+            loaddata.fmt_documents_batch([{'collection': 'scl', 'code': 'x'}])
+
+    def test_same_documents_with_and_without_processes(self):
+        serial = self.load(0)
+
+        self.assertEqual(['scl_S0001-37652000000100002'], serial)
+        self.assertEqual(serial, self.load(1))
+
+
+class TestDifferentialRemoval(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (
+            loaddata.articlemeta, loaddata.articlemeta_ids, loaddata.index_ids)
+        loaddata.articlemeta = lambda: None
+        loaddata.articlemeta_ids = lambda art_meta, endpoint, collection: [
+            ('scl_S0001', '2017-01-01')]
+        loaddata.index_ids = lambda index, endpoint, collection: [
+            ('scl_S0001', '2017-01-01'),
+            ('scl_S0002', '2017-01-01'),
+            ('scl_S0003', '2017-01-01')
+        ]
+        self.indexer = Indexer()
+
+    def tearDown(self):
+        (loaddata.articlemeta, loaddata.articlemeta_ids,
+         loaddata.index_ids) = self.original
+
+    def test_bulk_delete(self):
+
+        loaddata.differential_mode(
+            'publication', 'article', None, delete=True, indexer=self.indexer)
+
+        self.assertEqual(['scl_S0002', 'scl_S0003'], sorted(self.indexer.deleted))
+
+    def test_percentage_threshold(self):
+
+        loaddata.differential_mode(
+            'publication', 'article', None, delete=True, indexer=self.indexer,
+            remove_threshold='50%')
+
+        self.assertEqual([], self.indexer.deleted)
+
+    def test_dry_run_report(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+
+        try:
+            loaddata.differential_mode(
+                'publication', 'article', None, delete=True,
+                indexer=self.indexer, dry_run_report=path)
+
+            with open(path) as report:
+                result = sorted(report.read().split())
+        finally:
+            os.remove(path)
+
+        self.assertEqual(['scl_S0002', 'scl_S0003'], result)
+        self.assertEqual([], self.indexer.deleted)
@@ -0,0 +1,225 @@
+# coding: utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+from publication import controller
+from publication import local
+from publication.cache import ResponseCache
+from processing.export import CsvExporter
+
+DOCUMENTS = [
+    {'id': '1', 'collection': 'scl', 'issn': '0001-3765', 'publication_year': '2000', 'languages': ['en', 'pt']},
+    {'id': '2', 'collection': 'scl', 'issn': '0001-3765', 'publication_year': '2001', 'languages': ['pt']},
+    {'id': '3', 'collection': 'scl', 'issn': '0002-0000', 'publication_year': '2001', 'languages': ['es']},
+    {'id': '4', 'collection': 'arg', 'issn': '0003-0000', 'publication_year': '2001', 'languages': ['es', 'en']}
+]
+
+
+def snapshot(documents=DOCUMENTS):
+    builder = local.SnapshotBuilder()
+    for document in documents:
+        builder.add('article', document)
+
+    return builder.snapshot(generation='2017-01-01')
+
+
+def buckets(data):
+    return [(i['key'], i['doc_count']) for i in data['buckets']]
+
+
+class TestLocalIndex(unittest.TestCase):
+
+    def test_terms(self):
+        request = controller.stats_request('article', ['languages'])
+
+        result = snapshot().aggregate(request)
+
+        self.assertEqual(buckets(result['languages']), [('en', 2), ('es', 2), ('pt', 2)])
+        self.assertEqual(result['languages']['sum_other_doc_count'], 0)
+
+    def test_nested_with_filters(self):
+        request = controller.stats_request(
+            'article', ['collection', 'publication_year', 'languages'],
+            filters={'languages': 'es'})
+
+        result = snapshot().aggregate(request)
+
+        self.assertEqual(buckets(result['collection']), [('arg', 1), ('scl', 1)])
+        year = result['collection']['buckets'][1]['publication_year']
+        self.assertEqual(buckets(year), [('2001', 1)])
+        self.assertEqual(buckets(year['buckets'][0]['languages']), [('es', 1)])
+
+    def test_filters_without_matches(self):
+        request = controller.stats_request(
+            'article', ['collection'],
+            filters={'collection': 'scl', 'publication_year': 1999})
+
+        result = snapshot().aggregate(request)
+
+        self.assertEqual(buckets(result['collection']), [])
+
+    def test_size_and_pagination(self):
+        result = snapshot().aggregate(
+            controller.stats_request('article', ['issn'], size=1))
+
+        self.assertEqual(buckets(result['issn']), [('0001-3765', 2)])
+        self.assertEqual(result['issn']['sum_other_doc_count'], 2)
+
+        result = snapshot().aggregate(
+            controller.stats_request('article', ['issn'], size=1, after='0001-3765'))
+
+        self.assertEqual(buckets(result['issn']), [('0002-0000', 1)])
+
+    def test_facets(self):
+        request = controller.facets_request(
+            'article', ['collection', 'publication_year'],
+            filters={'issn': '0001-3765'})
+
+        result = snapshot().aggregate(request)
+
+        self.assertEqual(buckets(result['collection']), [('scl', 2)])
+        self.assertEqual(buckets(result['publication_year']), [('2000', 1), ('2001', 1)])
+
+    def test_unknown_doc_type_data(self):
+        result = snapshot().aggregate(controller.stats_request('journal', ['status']))
+
+        self.assertEqual(buckets(result['status']), [])
+
+
+class TestSnapshotFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_write_and_read(self):
+        path = os.path.join(self.directory, 'snapshot.pickle')
+
+        local.write_snapshot(snapshot(), path)
+        result = local.read_snapshot(path)
+
+        self.assertEqual(result.generation, '2017-01-01')
+        self.assertEqual(result.stats()['documents'], {'article': 4})
+
+    def test_snapshot_file_reloaded_when_replaced(self):
+        path = os.path.join(self.directory, 'snapshot.pickle')
+        local.write_snapshot(snapshot(), path)
+        request = controller.stats_request('article', ['collection'])
+
+        current = local.SnapshotFile(path)
+        self.assertEqual(current.generation, '2017-01-01')
+        self.assertEqual(buckets(current.aggregate(request)['collection']), [('scl', 3), ('arg', 1)])
+
+        builder = local.SnapshotBuilder()
+        builder.add('article', DOCUMENTS[0])
+        local.write_snapshot(builder.snapshot(generation='2017-02-01'), path)
+        os.utime(path, (0, 0))
+
+        self.assertEqual(current.generation, '2017-02-01')
+        self.assertEqual(buckets(current.aggregate(request)['collection']), [('scl', 1)])
+
+        os.remove(path)
+        self.assertEqual(current.stats()['documents'], {'article': 1})
+
+    def test_snapshot_file_required(self):
+        with self.assertRaises(ValueError):
+            local.SnapshotFile(os.path.join(self.directory, 'missing.pickle'))
+
+    def test_build_from_export(self):
+        with CsvExporter(self.directory, 'article') as exporter:
+            for document in DOCUMENTS:
+                exporter.add(document)
+
+        builder = local.SnapshotBuilder()
+        builder.add_export(self.directory)
+        request = controller.stats_request('article', ['collection', 'languages'])
+
+        self.assertEqual(
+            builder.snapshot().aggregate(request),
+            snapshot().aggregate(request)
+        )
+
+    def test_documents_of_several_loads_added_once(self):
+        with CsvExporter(self.directory, 'article') as exporter:
+            exporter.add(dict(DOCUMENTS[0], processing_date='2017-01-01'))
+            exporter.add(dict(DOCUMENTS[1], processing_date='2017-01-01'))
+
+        with CsvExporter(self.directory, 'article') as exporter:
+            exporter.add(dict(DOCUMENTS[0], processing_date='2017-02-01', languages=['es']))
+            exporter.add(dict(DOCUMENTS[1], processing_date='2016-12-01', languages=['es']))
+
+        builder = local.SnapshotBuilder()
+        builder.add_export(self.directory)
+        result = builder.snapshot().aggregate(
+            controller.stats_request('article', ['collection', 'languages']))
+
+        self.assertEqual(buckets(result['collection']), [('scl', 2)])
+        self.assertEqual(
+            buckets(result['collection']['buckets'][0]['languages']),
+            [('es', 1), ('pt', 1)]
+        )
+
+
+class TestStatsBackends(unittest.TestCase):
+
+    def test_local_backend(self):
+        stats = controller.stats(
+            hosts=['127.0.0.1'], backend=controller.LOCAL_BACKEND, local=snapshot())
+
+        def query_dispatcher(**kwargs):
+            raise AssertionError('ElasticSearch queried')
+
+        stats._query_dispatcher = query_dispatcher
+
+        result = stats.publication_stats('article', ['collection'], other=True)
+
+        self.assertEqual(buckets(result['collection']), [('scl', 3), ('arg', 1)])
+
+    def test_fallback_backend(self):
+        stats = controller.stats(
+            hosts=['127.0.0.1'], backend=controller.FALLBACK_BACKEND, local=snapshot())
+
+        def query_dispatcher(**kwargs):
+            raise controller.ServerError('down')
+
+        stats._query_dispatcher = query_dispatcher
+
+        result = stats.publication_facets('article', ['collection'])
+
+        self.assertEqual(buckets(result['collection']), [('scl', 3), ('arg', 1)])
+
+    def test_fallback_responses_not_cached(self):
+        stats = controller.stats(
+            hosts=['127.0.0.1'], backend=controller.FALLBACK_BACKEND,
+            local=snapshot(), cache=ResponseCache())
+        stats.index_generation = lambda: '2017-02-01'
+        available = []
+
+        def query_dispatcher(**kwargs):
+            if not available:
+                raise controller.ServerError('down')
+            return {'aggregations': {'collection': {'buckets': [{'key': 'scl', 'doc_count': 5}]}}}
+
+        stats._query_dispatcher = query_dispatcher
+
+        result = stats.publication_facets('article', ['collection'])
+        self.assertEqual(buckets(result['collection']), [('scl', 3), ('arg', 1)])
+
+        available.append(True)
+        result = stats.publication_facets('article', ['collection'])
+        self.assertEqual(buckets(result['collection']), [('scl', 5)])
+
+    def test_backend_requires_local_index(self):
+        with self.assertRaises(ValueError):
+            controller.Stats(hosts=['127.0.0.1'], backend=controller.LOCAL_BACKEND)
+
+        with self.assertRaises(ValueError):
+            controller.Stats(hosts=['127.0.0.1'], backend='sqlite')
+
+
+if __name__ == '__main__':
+    unittest.main()
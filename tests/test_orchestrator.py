@@ -0,0 +1,114 @@
+# coding: utf-8
+import unittest
+from collections import namedtuple
+
+from processing import loaddata, orchestrator
+
+Identifier = namedtuple('Identifier', ['code'])
+
+
+class ArticleMeta(object):
+
+    def collections(self, only_identifiers=False):
+        return [Identifier('spa'), Identifier('scl'), Identifier('broken')]
+
+    def journals(self, collection=None, only_identifiers=False):
+        return [Identifier('0002-3765'), Identifier('0001-3765')]
+
+
+class Indices(object):
+
+    def __init__(self):
+        self.put = []
+
+    def get_settings(self, index):
+        return {'publication_1': {'settings': {'index': {'number_of_replicas': '2'}}}}
+
+    def put_settings(self, index, body):
+        self.put.append((index, body['index']))
+
+
+class Client(object):
+
+    def __init__(self):
+        self.indices = Indices()
+
+
+def run(doc_type, collection=None, issns=None, publish=True, **kwargs):
+    if collection == 'broken':
+        raise ValueError('ArticleMeta unavailable')
+
+    return {'indexed': 10, 'deleted': 1, 'failed': 0}
+
+
+class TestOrchestrator(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (
+            loaddata.articlemeta, loaddata.publish_generation, loaddata.ES)
+        self.published = []
+        loaddata.ES = Client()
+        loaddata.articlemeta = lambda: ArticleMeta()
+        loaddata.publish_generation = lambda index, rollup=None: self.published.append(index)
+
+    def tearDown(self):
+        (loaddata.articlemeta, loaddata.publish_generation,
+         loaddata.ES) = self.original
+
+    def test_shards_by_collection(self):
+
+        result = list(orchestrator.shards(ArticleMeta(), 'article', ['scl', 'spa']))
+
+        self.assertEqual([('scl', [None]), ('spa', [None])], result)
+
+    def test_shards_by_issn(self):
+
+        result = list(orchestrator.shards(
+            ArticleMeta(), 'article', ['scl'], shard_by_issn=True))
+
+        self.assertEqual([('scl', ['0001-3765']), ('scl', ['0002-3765'])], result)
+
+    def test_shards_by_issn_only_for_articles(self):
+
+        result = list(orchestrator.shards(
+            ArticleMeta(), 'journal', ['scl'], shard_by_issn=True))
+
+        self.assertEqual([('scl', [None])], result)
+
+    def test_load_all_collections(self):
+
+        # The runner is given to the shard processes, which may not inherit
+        # the changes made to the modules of this one.
+        report = orchestrator.load_collections(
+            'article', ['all'], concurrency=2, index='publication',
+            bulk_profile='number_of_replicas=0', runner=run)
+
+        self.assertEqual(3, report['shards'])
+        self.assertEqual(2, report['finished'])
+        self.assertEqual(20, report['indexed'])
+        self.assertEqual(2, report['deleted'])
+        self.assertEqual(
+            [{'shard': 'broken', 'error': 'ArticleMeta unavailable'}],
+            report['errors']
+        )
+        self.assertEqual(['publication'], self.published)
+        self.assertEqual([
+            ('publication', {'number_of_replicas': '0'}),
+            ('publication_1', {'number_of_replicas': '2'})
+        ], loaddata.ES.indices.put)
+
+    def test_formatting_processes_not_allowed(self):
+
+        with self.assertRaises(ValueError):
+            orchestrator.load_collections(
+                'article', ['scl'], concurrency=2, processes=2, runner=run)
+
+        self.assertEqual([], self.published)
+
+    def test_publish_left_to_the_caller(self):
+
+        orchestrator.load_collections(
+            'article', ['scl'], concurrency=1, index='publication',
+            publish=False, runner=run)
+
+        self.assertEqual([], self.published)
@@ -0,0 +1,213 @@
+# coding: utf-8
+import unittest
+
+from processing import loaddata, orchestrator, reindex
+
+
+class Indices(object):
+
+    def __init__(self, aliases=None, indices=None):
+        self.aliases = aliases or {}
+        self.indices = set(indices or [])
+        self.actions = []
+        self.deleted = []
+        self.settings = {}
+
+    def exists_alias(self, name):
+        return name in self.aliases
+
+    def get_alias(self, name):
+        return {i: {'aliases': {name: {}}} for i in self.aliases[name]}
+
+    def exists(self, index):
+        return index in self.indices
+
+    def delete(self, index):
+        self.deleted.append(index)
+
+    def update_aliases(self, body):
+        self.actions = body['actions']
+
+    def put_settings(self, index, body):
+        self.settings[index] = body
+
+
+class Cluster(object):
+
+    def __init__(self):
+        self.timed_out = False
+
+    def health(self, **kwargs):
+        return {'status': 'yellow' if self.timed_out else 'green', 'timed_out': self.timed_out}
+
+
+class Client(object):
+
+    def __init__(self, aliases=None, indices=None):
+        self.indices = Indices(aliases, indices)
+        self.cluster = Cluster()
+        self.searches = []
+        self.reindexed = []
+
+    def reindex(self, body, **kwargs):
+        self.reindexed.append((body['source']['index'], body['dest']['index']))
+
+    def search(self, index, doc_type, body):
+        self.searches.append((index, doc_type))
+
+
+class TestReindex(unittest.TestCase):
+
+    def test_new_index_name(self):
+
+        result = reindex.new_index_name('publication')
+
+        self.assertRegex(result, r'^publication_\d{14}$')
+
+    def test_swap_alias(self):
+        client = Client(aliases={'publication': ['publication_1']})
+
+        previous = reindex.swap_alias(client, 'publication', 'publication_2')
+
+        self.assertEqual(['publication_1'], previous)
+        self.assertEqual([
+            {'remove': {'index': 'publication_1', 'alias': 'publication'}},
+            {'add': {'index': 'publication_2', 'alias': 'publication'}}
+        ], client.indices.actions)
+        self.assertEqual([], client.indices.deleted)
+
+    def test_swap_alias_refuses_concrete_index(self):
+        client = Client(indices=['publication'])
+
+        with self.assertRaises(ValueError):
+            reindex.swap_alias(client, 'publication', 'publication_2')
+
+        self.assertEqual([], client.indices.deleted)
+        self.assertEqual([], client.indices.actions)
+
+    def test_swap_alias_replaces_concrete_index(self):
+        client = Client(indices=['publication'])
+
+        previous = reindex.swap_alias(
+            client, 'publication', 'publication_2', replace_index=True)
+
+        self.assertEqual([], previous)
+        self.assertEqual([], client.reindexed)
+        self.assertEqual(['publication'], client.indices.deleted)
+        self.assertEqual(
+            [{'add': {'index': 'publication_2', 'alias': 'publication'}}],
+            client.indices.actions
+        )
+
+    def test_swap_alias_copies_concrete_index_kept(self):
+        client = Client(indices=['publication'])
+        setup_index = loaddata.setup_index
+        loaddata.setup_index = lambda index, settings=None: None
+
+        try:
+            reindex.swap_alias(
+                client, 'publication', 'publication_2', replace_index=True,
+                keep_previous=True)
+        finally:
+            loaddata.setup_index = setup_index
+
+        self.assertEqual(1, len(client.reindexed))
+        source, backup = client.reindexed[0]
+        self.assertEqual('publication', source)
+        self.assertRegex(backup, r'^publication_previous_\d{14}$')
+        self.assertEqual(['publication'], client.indices.deleted)
+
+    def test_warm(self):
+        client = Client()
+
+        reindex.warm(client, 'publication_2', [('article', ['collection'])])
+
+        self.assertEqual([('publication_2', 'article')], client.searches)
+
+
+class TestRebuild(unittest.TestCase):
+
+    def setUp(self):
+        self.original = (
+            loaddata.ES, loaddata.run, loaddata.setup_index,
+            loaddata.publish_generation)
+        self.client = Client(aliases={'publication': ['publication_1']})
+        self.loaded = []
+        self.created = []
+        loaddata.ES = self.client
+        loaddata.setup_index = lambda index, settings=None: self.created.append((index, settings))
+        loaddata.publish_generation = lambda index, rollup=None: None
+
+    def tearDown(self):
+        (loaddata.ES, loaddata.run, loaddata.setup_index,
+         loaddata.publish_generation) = self.original
+
+    def test_rebuild(self):
+        loaddata.run = lambda doc_type, **kwargs: self.loaded.append((doc_type, kwargs['index']))
+
+        index = reindex.rebuild('publication')
+
+        self.assertEqual([(index, reindex.LOAD_SETTINGS)], self.created)
+        self.assertEqual([('journal', index), ('article', index)], self.loaded)
+        self.assertEqual(
+            {'index': reindex.SERVING_SETTINGS},
+            self.client.indices.settings[index]
+        )
+        self.assertEqual(['publication_1'], self.client.indices.deleted)
+
+    def test_rebuild_by_collection_publishes_once(self):
+        published = []
+        loads = []
+        original = orchestrator.load_collections
+        loaddata.publish_generation = lambda index, rollup=None: published.append((index, rollup))
+
+        def load_collections(doc_type, collections, **kwargs):
+            loads.append((doc_type, kwargs['publish']))
+            return {'errors': []}
+
+        orchestrator.load_collections = load_collections
+        try:
+            index = reindex.rebuild('publication', concurrency=2, rollup='rollup.pickle')
+        finally:
+            orchestrator.load_collections = original
+
+        self.assertEqual([('journal', False), ('article', False)], loads)
+        self.assertEqual([(index, 'rollup.pickle')], published)
+
+    def test_rebuild_refuses_concrete_index(self):
+        self.client = loaddata.ES = Client(indices=['publication'])
+        loaddata.run = lambda doc_type, **kwargs: self.loaded.append(doc_type)
+
+        with self.assertRaises(ValueError):
+            reindex.rebuild('publication')
+
+        self.assertEqual([], self.loaded)
+        self.assertEqual([], self.created)
+
+    def test_rebuild_not_green_keeps_alias(self):
+        loaddata.run = lambda doc_type, **kwargs: None
+        self.client.cluster.timed_out = True
+
+        with self.assertRaises(RuntimeError):
+            reindex.rebuild('publication')
+
+        self.assertEqual([], self.client.indices.actions)
+        self.assertEqual([], self.client.indices.deleted)
+
+        index = reindex.rebuild('publication', swap_unhealthy=True)
+
+        self.assertEqual('add', list(self.client.indices.actions[-1].keys())[0])
+        self.assertEqual(index, self.client.indices.actions[-1]['add']['index'])
+
+    def test_rebuild_failure_keeps_alias(self):
+
+        def run(doc_type, **kwargs):
+            raise ValueError('ArticleMeta unavailable')
+
+        loaddata.run = run
+
+        with self.assertRaises(ValueError):
+            reindex.rebuild('publication')
+
+        self.assertEqual([], self.client.indices.actions)
+        self.assertEqual([self.created[0][0]], self.client.indices.deleted)
@@ -0,0 +1,197 @@
+# coding: utf-8
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+
+from processing import loaddata
+from publication import controller
+from publication import rollup
+from tests.test_local import DOCUMENTS, snapshot
+
+
+class Index(object):
+    """
+    Returns the documents of each doc_type in a single scroll page.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def search(self, index, doc_type, body, scroll):
+        hits = []
+        for document in self.documents.get(doc_type, []):
+            fields = {
+                k: v if isinstance(v, list) else [v]
+                for k, v in document.items() if k in body['docvalue_fields']
+            }
+            hits.append({'_id': document['id'], 'fields': fields})
+
+        return {'_scroll_id': doc_type, 'hits': {'hits': hits}}
+
+    def scroll(self, scroll_id, scroll):
+        return {'_scroll_id': scroll_id, 'hits': {'hits': []}}
+
+    def clear_scroll(self, scroll_id):
+        pass
+
+
+class TestRollup(unittest.TestCase):
+
+    def setUp(self):
+        self.snapshot = snapshot()
+        self.rollup = rollup.build_rollup(self.snapshot)
+
+    def test_same_as_local_index(self):
+        facets = ['collection', 'issn', 'publication_year', 'languages']
+        filters = [None, {'collection': 'scl'}, {'languages': 'en'}]
+
+        for size in (1, 2, 3):
+            for aggs in itertools.permutations(facets, size):
+                for item in filters:
+                    if item and (len(aggs) == 3 or set(item) & set(aggs)):
+                        continue
+                    request = controller.stats_request('article', list(aggs), filters=item)
+                    self.assertEqual(
+                        self.rollup.aggregate(request),
+                        self.snapshot.aggregate(request),
+                        (aggs, item)
+                    )
+
+    def test_size_and_pagination(self):
+        for request in (
+            controller.stats_request('article', ['issn', 'languages'], size=1),
+            controller.stats_request('article', ['issn'], size=1, after='0001-3765'),
+            controller.facets_request('article', ['issn', 'languages'], filters={'collection': 'scl'}, size=2)
+        ):
+            self.assertEqual(
+                self.rollup.aggregate(request), self.snapshot.aggregate(request))
+
+    def test_not_covered(self):
+        requests = [
+            controller.stats_request(
+                'article', ['collection', 'issn', 'languages'],
+                filters={'publication_year': '2001'}),
+            controller.stats_request(
+                'article', ['languages'], filters={'languages': 'en'}),
+            controller.stats_request('article', ['issn', 'issn'])
+        ]
+
+        for request in requests:
+            self.assertIsNone(self.rollup.aggregate(request))
+
+        self.assertEqual(self.rollup.stats()['misses'], 3)
+
+    def test_max_cells(self):
+        result = rollup.build_rollup(self.snapshot, dimensions=2, max_cells=3)
+
+        self.assertIn(('article', ('collection',)), result.cube)
+        self.assertNotIn(('article', ('issn', 'languages')), result.cube)
+
+    def test_write_and_read(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'rollup.pickle')
+
+        try:
+            rollup.write_rollup(self.rollup, path)
+            result = rollup.read_rollup(path)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(result.cube, self.rollup.cube)
+        self.assertEqual(result.generation, '2017-01-01')
+
+    def test_stale_generation(self):
+        request = controller.stats_request('article', ['collection'])
+
+        self.assertIsNotNone(self.rollup.aggregate(request, '2017-01-01'))
+        self.assertIsNone(self.rollup.aggregate(request, '2017-02-01'))
+        self.assertEqual(self.rollup.stats()['stale'], 1)
+
+    def test_stats_answers_from_rollup(self):
+        queries = []
+
+        def query_dispatcher(**kwargs):
+            queries.append(kwargs)
+            return {'aggregations': {'collection': {'buckets': []}}}
+
+        stats = controller.stats(hosts=['127.0.0.1'], rollup=self.rollup)
+        stats._query_dispatcher = query_dispatcher
+        stats.index_generation = lambda: '2017-01-01'
+
+        result = stats.publication_stats('article', ['collection'], {'issn': '0001-3765'})
+        self.assertEqual(result['collection']['buckets'], [{'key': 'scl', 'doc_count': 2}])
+        self.assertEqual(queries, [])
+
+        stats.publication_stats('article', ['languages'], {'languages': 'en'})
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.rollup.stats()['hits'], 1)
+
+    def test_stats_skips_rollup_of_other_generation(self):
+        queries = []
+
+        def query_dispatcher(**kwargs):
+            queries.append(kwargs)
+            return {'aggregations': {'collection': {'buckets': []}}}
+
+        for generation in ('2017-02-01', None):
+            stats = controller.stats(hosts=['127.0.0.1'], rollup=self.rollup)
+            stats._query_dispatcher = query_dispatcher
+            stats.index_generation = lambda: generation
+
+            result = stats.publication_stats('article', ['collection'])
+            self.assertEqual(result['collection']['buckets'], [])
+
+        self.assertEqual(len(queries), 2)
+
+
+class TestRollupFile(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'rollup.pickle')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_reloaded_when_changed(self):
+        request = controller.stats_request('article', ['collection'])
+        source = rollup.RollupFile(self.path)
+
+        self.assertIsNone(source.aggregate(request, '2017-01-01'))
+
+        rollup.write_rollup(rollup.build_rollup(snapshot()), self.path)
+        self.assertIsNotNone(source.aggregate(request, '2017-01-01'))
+        self.assertIsNone(source.aggregate(request, '2017-02-01'))
+
+        rollup.write_rollup(
+            rollup.build_rollup(snapshot(DOCUMENTS[:1]), generation='2017-02-01'),
+            self.path)
+        os.utime(self.path, (0, 0))
+
+        result = source.aggregate(request, '2017-02-01')
+        self.assertEqual(result['collection']['buckets'], [{'key': 'scl', 'doc_count': 1}])
+        self.assertEqual(source.generation, '2017-02-01')
+
+    def test_written_by_the_loader(self):
+        original = loaddata.ES
+        loaddata.ES = Index({'article': DOCUMENTS})
+
+        try:
+            loaddata.write_index_rollup('publication', '2017-03-01', self.path, slices=1)
+        finally:
+            loaddata.ES = original
+
+        result = rollup.read_rollup(self.path)
+        request = controller.stats_request('article', ['collection', 'languages'])
+
+        self.assertEqual(result.generation, '2017-03-01')
+        self.assertEqual(
+            result.aggregate(request, '2017-03-01'),
+            snapshot().aggregate(request)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+# coding: utf-8
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from processing import loaddata
+from processing import sources
+from tests.test_loaddata import raw_article
+
+
+class TestSources(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_dump(self, name, records, compress=False):
+        path = os.path.join(self.directory, name)
+        content = '\n'.join([json.dumps(i) for i in records]) + '\n\n'
+        opener = gzip.open if compress else open
+
+        with opener(path, 'wb') as f:
+            f.write(content.encode('utf-8'))
+
+        return path
+
+    def test_read_dump(self):
+        records = [raw_article('S0001-37652000000100001')]
+        path = self.write_dump('articles.jsonl', records)
+
+        self.assertEqual(list(sources.read_dump(path)), records)
+
+    def test_read_gzipped_dump(self):
+        records = [raw_article('S0001-37652000000100001')]
+        path = self.write_dump('articles.jsonl.gz', records, compress=True)
+
+        self.assertEqual(list(sources.read_dump(path)), records)
+
+    def test_read_dump_skips_invalid_lines(self):
+        path = os.path.join(self.directory, 'articles.jsonl')
+        with open(path, 'w') as f:
+            f.write('{"code": "1"}\n{invalid\n{"code": "2"}\n')
+
+        result = [i['code'] for i in sources.read_dump(path)]
+
+        self.assertEqual(result, ['1', '2'])
+
+    def test_dump_source_filters(self):
+        other_collection = raw_article('S0001-37652000000100002')
+        other_collection['collection'] = 'arg'
+        path = self.write_dump('articles.jsonl', [
+            raw_article('S0001-37652000000100001'),
+            other_collection,
+            raw_article('S0002-37652000000100001')
+        ])
+
+        result = [i.publisher_id for i in sources.dump_source(
+            path, 'article', collection='scl', issns=['0001-3765'])]
+
+        self.assertEqual(result, ['S0001-37652000000100001'])
+
+        result = [i.publisher_id for i in sources.dump_source(
+            path, 'article', issns=[None])]
+
+        self.assertEqual(len(result), 3)
+
+    def test_documents_from_dump(self):
+        path = self.write_dump('articles.jsonl.gz', [
+            raw_article('S0001-37652000000100001'),
+            raw_article('S0001-37652000000100002')
+        ], compress=True)
+
+        result = list(loaddata.documents(
+            'article', fmt=loaddata.fmt_document,
+            source=sources.dump_source(path, 'article')))
+
+        self.assertEqual(
+            [(event, doc['id']) for event, doc in result],
+            [('add', 'scl_S0001-37652000000100001'), ('add', 'scl_S0001-37652000000100002')]
+        )
+        self.assertEqual(result[0][1]['issn'], '0001-3765')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,3 +15,39 @@ class ViewTests(unittest.TestCase):
         request = testing.DummyRequest()
         info = index(request)
         self.assertEqual(info.body, b'Publication Stats API by SciELO')
+
+    def test_stats_arguments(self):
+        from publication.views import stats_arguments
+        params = {'aggs': 'collection,issn', 'size': '10', 'other': 'true'}
+
+        result = stats_arguments(params, {'collection': 'scl'})
+
+        expected = {
+            'aggs': ['collection', 'issn'],
+            'filters': {'collection': 'scl'},
+            'size': 10,
+            'other': True
+        }
+        self.assertEqual(expected, result)
+
+    def test_stats_arguments_paginated(self):
+        from publication.views import stats_arguments
+
+        result = stats_arguments({'aggs': 'issn', 'after': '0001-3765'}, {})
+
+        self.assertTrue(result['paginate'])
+        self.assertEqual('0001-3765', result['after'])
+
+    def test_stats_arguments_too_many_aggs(self):
+        from publication.views import stats_arguments
+        import pyramid.httpexceptions as exc
+
+        with self.assertRaises(exc.HTTPBadRequest):
+            stats_arguments({'aggs': 'collection,issn,languages,subject_areas'}, {})
+
+    def test_document_filters(self):
+        from publication.views import document_filters
+
+        result = document_filters({'affiliation_country': 'BR', 'language': 'pt'})
+
+        self.assertEqual({'aff_countries': 'BR', 'languages': 'pt'}, result)
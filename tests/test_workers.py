@@ -0,0 +1,75 @@
+# coding: utf-8
+import unittest
+
+from processing.workers import parallel_documents, parallel_batches, batches
+
+
+class Document(object):
+
+    def __init__(self, code):
+        self.code = code
+        self.data = {'code': code}
+
+
+def fetch(code):
+    if code == 'broken':
+        raise ValueError('broken document')
+
+    return Document(code)
+
+
+def fmt(document):
+    return {'id': document.code}
+
+
+def fmt_batch(codes):
+    return [{'id': i} for i in codes]
+
+
+class TestParallelDocuments(unittest.TestCase):
+
+    def test_all_documents_formated(self):
+        items = ['scl_%d' % i for i in range(50)]
+
+        result = parallel_documents(items, fetch, fmt, workers=3, queue_size=5)
+
+        self.assertEqual(sorted(items), sorted([i['id'] for i in result]))
+
+    def test_fetch_errors_are_skipped(self):
+        items = ['scl_1', 'broken', 'scl_2']
+
+        result = parallel_documents(items, fetch, fmt, workers=2, queue_size=1)
+
+        self.assertEqual(['scl_1', 'scl_2'], sorted([i['id'] for i in result]))
+
+    def test_close_stops_workers(self):
+        items = ('scl_%d' % i for i in range(10000))
+
+        result = parallel_documents(items, fetch, fmt, workers=2, queue_size=2)
+        next(result)
+        result.close()
+
+        self.assertLess(len(list(items)), 10000)
+
+
+class TestParallelBatches(unittest.TestCase):
+
+    def test_batches(self):
+
+        result = list(batches(range(5), 2))
+
+        self.assertEqual([[0, 1], [2, 3], [4]], result)
+
+    def test_formated_in_current_process(self):
+        items = ['scl_%d' % i for i in range(25)]
+
+        result = parallel_batches(items, fmt_batch, batch_size=4)
+
+        self.assertEqual(items, [i['id'] for i in result])
+
+    def test_formated_in_processes_keeps_order(self):
+        items = ['scl_%d' % i for i in range(25)]
+
+        result = parallel_batches(items, fmt_batch, processes=2, batch_size=3)
+
+        self.assertEqual(items, [i['id'] for i in result])